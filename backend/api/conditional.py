@@ -0,0 +1,67 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from inventory.services import stock_watermark
+from rbac.services import user_has_permission
+
+
+def _stock_etag(request, company):
+    # The same watermark still gives a new tag per URL, renderer and day
+    # (aging and "as of" reads move with the date)
+    payload = json.dumps(
+        [
+            str(company.id),
+            stock_watermark(company),
+            request.get_full_path(),
+            request.accepted_media_type,
+            timezone.localdate(),
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    return quote_etag(hashlib.sha256(payload.encode()).hexdigest())
+
+
+def stock_conditional(permission):
+    """
+    Conditional GET for a read view whose response only depends on the
+    company's stock, ledger and cost layers and the products, suppliers,
+    warehouses and users they show (see inventory.services.stock_watermark
+    for what moves it). 200
+    responses carry an ETag; a request whose If-None-Match still matches
+    gets 304 Not Modified without running the view, which costs one
+    small counter read instead of the report.
+
+    Goes below @api_view, so request.user is authenticated; users without
+    `permission` always get the view's own response.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            profile = getattr(request.user, "userprofile", None)
+            company = profile.company if profile else None
+            if company is None or not user_has_permission(request.user, permission):
+                return view(request, *args, **kwargs)
+
+            etag = _stock_etag(request, company)
+
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified.headers["ETag"] = etag
+                return not_modified
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                response.headers["ETag"] = etag
+                # Cached by the client, but revalidated on every poll
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,146 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework.response import Response
+
+from api.models import IdempotencyRecord
+
+
+def _request_hash(request):
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _existing(user, key):
+    return IdempotencyRecord.objects.filter(user=user, key=key).first()
+
+
+def _replay(record, request_hash):
+    if record.request_hash != request_hash:
+        return Response(
+            {"message": "Idempotency-Key was already used for a different request"},
+            status=422,
+        )
+
+    if record.status_code is None:
+        return Response(
+            {"message": "A request with this Idempotency-Key is still in progress"},
+            status=409,
+        )
+
+    return Response(
+        record.response,
+        status=record.status_code,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def _claim(user, key, request_hash):
+    """
+    Insert the pending record for `key` in its own transaction. Returns
+    (record, True) when this request claimed the key, or the existing
+    record and False when another request got there first.
+    """
+    record = _existing(user, key)
+    if record is not None:
+        return record, False
+
+    try:
+        with transaction.atomic():
+            return IdempotencyRecord.objects.create(
+                key=key, user=user, request_hash=request_hash
+            ), True
+    except IntegrityError:
+        record = _existing(user, key)
+        if record is None:
+            raise
+        return record, False
+
+
+def _store(record, response):
+    record.status_code = response.status_code
+    record.response = response.data
+    record.save(update_fields=["status_code", "response"])
+
+
+def _succeeded(response):
+    return 200 <= response.status_code < 300
+
+
+def _run_atomic(view, request, key, request_hash, *args, **kwargs):
+    # Claim, movement and stored response commit together: a crash at any
+    # point leaves neither, and the retry runs for real. A concurrent
+    # duplicate blocks on the key's unique index until this commits.
+    with transaction.atomic():
+        record, claimed = _claim(request.user, key, request_hash)
+        if not claimed:
+            return _replay(record, request_hash)
+
+        response = view(request, *args, **kwargs)
+
+        if _succeeded(response):
+            _store(record, response)
+        else:
+            transaction.set_rollback(True)
+
+        return response
+
+
+def _run_claimed(view, request, key, request_hash, *args, **kwargs):
+    record, claimed = _claim(request.user, key, request_hash)
+    if not claimed:
+        return _replay(record, request_hash)
+
+    try:
+        response = view(request, *args, **kwargs)
+    except BaseException:
+        record.delete()
+        raise
+
+    if _succeeded(response):
+        _store(record, response)
+    else:
+        record.delete()
+
+    return response
+
+
+def idempotent(view):
+    """
+    Honour an Idempotency-Key header on a mutating view. A retry with the
+    same key gets the stored response back without running the view.
+    Only 2xx responses are stored: a failed request moved no stock, so
+    retrying it for real is the right thing to do.
+
+    Normally the key is claimed, the view runs and its response is stored
+    in one transaction, the same one as the movement.
+
+    Group commit (INVENTORY_GROUP_COMMIT) only batches callers that aren't
+    already inside a transaction, so there the key is claimed first in a
+    short transaction of its own and the response stored after the view.
+    A retry that finds that claim still without a response gets 409: the
+    first request is still running, or died between committing its
+    movement and storing the response. Either way the movement is never
+    applied twice; purge_idempotency_keys clears such claims with the
+    rest after IDEMPOTENCY_KEY_TTL_HOURS.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return view(request, *args, **kwargs)
+
+        if len(key) > 255:
+            return Response({"message": "Idempotency-Key too long"}, status=400)
+
+        run = _run_claimed if settings.INVENTORY_GROUP_COMMIT else _run_atomic
+        return run(view, request, key, _request_hash(request), *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from api.models import IdempotencyRecord
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses older than the TTL"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ttl-hours",
+            type=int,
+            default=settings.IDEMPOTENCY_KEY_TTL_HOURS,
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows deleted per statement",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = now() - timedelta(hours=options["ttl_hours"])
+        total = 0
+
+        while True:
+            ids = list(
+                IdempotencyRecord.objects
+                .filter(created_at__lt=cutoff)
+                .values_list("id", flat=True)[:options["batch_size"]]
+            )
+            if not ids:
+                break
+
+            IdempotencyRecord.objects.filter(id__in=ids).delete()
+            total += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Purged {total} idempotency keys"))
+
+
+# Usage (schedule e.g. hourly)
+# python manage.py purge_idempotency_keys --ttl-hours 24
@@ -1,3 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
-# Create your models here.
+
+class IdempotencyRecord(models.Model):
+    """
+    Stored response of a stock-mutating request sent with an
+    Idempotency-Key header. Inserted without a status_code when the
+    request claims the key, before the view runs, and completed with the
+    response once the view succeeded (see api.idempotency).
+    """
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    request_hash = models.CharField(max_length=64)
+
+    # None while the claiming request is still running
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ("user", "key")
@@ -1,3 +1,740 @@
-from django.test import TestCase
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from company.models import Company, Product, Supplier, Warehouse
+from api.models import IdempotencyRecord
+from core.audit.archive import archive_months
+from core.audit.enums import AuditAction
+from core.audit.models import AuditLog
+from inventory.group_commit import GroupCommitWriter
+from inventory.models import (
+    InventoryDailyBalance, InventoryLedger, InventoryStock, StockCostLayer,
+)
+from inventory.reconciliation import correct_drift
+from inventory.services import record_daily_balance, stock_in_service, stock_out_service
+from rbac.models import Permission, Role, RolePermission
+
+
+class MonthlyStockReportTests(TestCase):
+    def setUp(self):
+        role = Role.objects.create(name="Viewer")
+        RolePermission.objects.create(
+            role=role,
+            permission=Permission.objects.create(code="inventory.view"),
+        )
+
+        self.user = User.objects.create_user(username="viewer", password="x")
+        self.company = Company.objects.create(name="Acme", created_by=self.user)
+        self.user.userprofile.company = self.company
+        self.user.userprofile.save()
+
+        self.warehouse = Warehouse.objects.create(
+            company=self.company, name="Main", code="WH-MAIN"
+        )
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _add_stock(self, quantity, movements=()):
+        product = Product.objects.create(
+            company=self.company,
+            sku=f"SKU-{uuid4().hex[:8]}",
+            name=f"Product {uuid4().hex[:4]}",
+            unit="pcs",
+        )
+        InventoryStock.objects.create(
+            product=product, warehouse=self.warehouse, quantity=quantity
+        )
+
+        balance = 0
+        for created_at, change in movements:
+            balance += change
+            ledger = InventoryLedger.objects.create(
+                product=product,
+                warehouse=self.warehouse,
+                change=change,
+                balance_after=balance,
+                reference_type="TEST",
+                reference_id=uuid4(),
+                created_by=self.user,
+            )
+            ledger.created_at = created_at
+            InventoryLedger.objects.filter(id=ledger.id).update(created_at=created_at)
+            record_daily_balance(ledger)
+
+        return product
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/reports/monthly-stock", {"month": "2025-03"})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_daily_running_balance(self):
+        product = self._add_stock(
+            quantity=12,
+            movements=[
+                (datetime(2025, 2, 20, tzinfo=dt_timezone.utc), 5),
+                (datetime(2025, 3, 2, 10, tzinfo=dt_timezone.utc), 10),
+                (datetime(2025, 3, 2, 18, tzinfo=dt_timezone.utc), -3),
+                (datetime(2025, 3, 31, 23, 30, tzinfo=dt_timezone.utc), -4),
+                (datetime(2025, 4, 5, tzinfo=dt_timezone.utc), 4),
+            ],
+        )
+
+        response = self.client.get("/api/reports/monthly-stock", {"month": "2025-03"})
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(data["days"], 31)
+
+        row = data["rows"][0]
+        self.assertEqual(row["product_id"], str(product.id))
+        self.assertEqual(row["opening"], 5)
+        self.assertEqual(row["daily"]["1"], 5)
+        self.assertEqual(row["daily"]["2"], 12)
+        self.assertEqual(row["daily"]["30"], 12)
+        self.assertEqual(row["closing"], 8)
+
+    def test_days_and_opening_share_the_ledger_changes(self):
+        product = self._add_stock(
+            quantity=12,
+            movements=[
+                (datetime(2025, 2, 20, tzinfo=dt_timezone.utc), 5),
+                (datetime(2025, 3, 2, tzinfo=dt_timezone.utc), 10),
+            ],
+        )
+        # A broken running balance doesn't leak into the report
+        InventoryLedger.objects.filter(product=product).update(balance_after=100)
+        InventoryDailyBalance.objects.filter(product=product).update(closing=100)
+
+        response = self.client.get("/api/reports/monthly-stock", {"month": "2025-03"})
+
+        row = response.json()["rows"][0]
+        self.assertEqual(row["opening"], 5)
+        self.assertEqual(row["daily"]["2"], 15)
+        self.assertEqual(row["closing"], 15)
+
+    def test_query_count_is_constant_in_stock_rows(self):
+        movement = [(datetime(2025, 3, 10, tzinfo=dt_timezone.utc), 1)]
+
+        for _ in range(2):
+            self._add_stock(quantity=1, movements=movement)
+        small = self._count_queries()
+
+        for _ in range(20):
+            self._add_stock(quantity=1, movements=movement)
+        large = self._count_queries()
+
+        self.assertEqual(small, large)
+
+
+class ApiTestCase(TestCase):
+    """
+    An authenticated client for a user whose role has `permissions`,
+    with an active company, one warehouse and one product.
+    """
+    permissions = ("inventory.view",)
+
+    def setUp(self):
+        self.role = Role.objects.create(name="Viewer")
+        for code in self.permissions:
+            RolePermission.objects.create(
+                role=self.role, permission=Permission.objects.create(code=code)
+            )
+
+        self.user = User.objects.create_user(username="viewer", password="x")
+        self.company = Company.objects.create(name="Acme", created_by=self.user)
+        self.user.userprofile.company = self.company
+        self.user.userprofile.save()
+
+        self.warehouse = Warehouse.objects.create(
+            company=self.company, name="Main", code="WH-MAIN"
+        )
+        self.product = self._product()
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _product(self, **fields):
+        return Product.objects.create(
+            company=self.company,
+            sku=f"SKU-{uuid4().hex[:8]}",
+            name=fields.pop("name", f"Product {uuid4().hex[:4]}"),
+            unit="pcs",
+            **fields,
+        )
+
+    def _stock_in(self, quantity, product=None, warehouse=None):
+        return stock_in_service(
+            actor=self.user,
+            product_id=(product or self.product).id,
+            warehouse_id=(warehouse or self.warehouse).id,
+            quantity=quantity,
+        )
+
+
+class BulkStockInApiTests(ApiTestCase):
+    permissions = ("inventory.stock_in",)
+
+    def test_bulk_stock_in(self):
+        response = self.client.post(
+            "/api/inventory/bulk-stock-in",
+            {
+                "warehouse_id": str(self.warehouse.id),
+                "items": [
+                    {"product_id": str(self.product.id), "quantity": 2},
+                    {"product_id": str(self.product.id), "quantity": 3},
+                ],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["processed"], 2)
+        self.assertEqual(
+            InventoryStock.objects.get(product=self.product, warehouse=self.warehouse).quantity, 5
+        )
+
+    def test_invalid_quantity_is_rejected(self):
+        response = self.client.post(
+            "/api/inventory/bulk-stock-in",
+            {
+                "warehouse_id": str(self.warehouse.id),
+                "items": [{"product_id": str(self.product.id), "quantity": 0}],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(InventoryStock.objects.exists())
+
+    def test_other_companies_products_are_rejected(self):
+        other = Company.objects.create(name="Other", created_by=self.user)
+        foreign = Product.objects.create(
+            company=other, sku="OTHER-1", name="Other", unit="pcs",
+        )
+
+        response = self.client.post(
+            "/api/inventory/bulk-stock-in",
+            {
+                "warehouse_id": str(self.warehouse.id),
+                "items": [
+                    {"product_id": str(self.product.id), "quantity": 1},
+                    {"product_id": str(foreign.id), "quantity": 1},
+                ],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "Invalid product")
+        self.assertFalse(InventoryStock.objects.exists())
+
+    def test_malformed_warehouse_is_rejected(self):
+        response = self.client.post(
+            "/api/inventory/bulk-stock-in",
+            {
+                "warehouse_id": "nope",
+                "items": [{"product_id": str(self.product.id), "quantity": 1}],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "Invalid warehouse for active company")
+
+
+class IdempotencyTests(ApiTestCase):
+    permissions = ("inventory.stock_out",)
+
+    def _stock_out(self, key, quantity=2):
+        return self.client.post(
+            "/api/inventory/stock-out",
+            {
+                "product_id": str(self.product.id),
+                "warehouse_id": str(self.warehouse.id),
+                "quantity": quantity,
+            },
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def _quantity(self):
+        return InventoryStock.objects.get(product=self.product, warehouse=self.warehouse).quantity
+
+    def test_retry_replays_stored_response(self):
+        self._stock_in(10)
+
+        first = self._stock_out("key-1")
+        second = self._stock_out("key-1")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(self._quantity(), 8)
+
+    def test_key_reused_for_different_request(self):
+        self._stock_in(10)
+        self._stock_out("key-1")
+
+        response = self._stock_out("key-1", quantity=3)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self._quantity(), 8)
+
+    def test_failed_request_is_not_stored(self):
+        self._stock_in(1)
+
+        response = self._stock_out("key-1")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        # The retry runs for real once it can succeed
+        self._stock_in(5)
+        response = self._stock_out("key-1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(self._quantity(), 4)
+
+    def test_concurrent_duplicate_replays(self):
+        self._stock_in(10)
+        self._stock_out("key-1")
+
+        # Both requests missed each other's record; the insert loses the race
+        with mock.patch("api.idempotency._existing", side_effect=[None, IdempotencyRecord.objects.get()]):
+            response = self._stock_out("key-1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        self.assertEqual(self._quantity(), 8)
+
+    def test_key_still_in_progress(self):
+        self._stock_in(10)
+        self._stock_out("key-1")
+        IdempotencyRecord.objects.update(status_code=None, response=None)
+
+        response = self._stock_out("key-1")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self._quantity(), 8)
+
+    def test_crash_before_storing_the_response_rolls_back_the_movement(self):
+        self._stock_in(10)
+
+        with mock.patch("api.idempotency._store", side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                self._stock_out("key-1")
+
+        self.assertFalse(IdempotencyRecord.objects.exists())
+        self.assertEqual(self._quantity(), 10)
+
+        # The retry isn't stuck behind a pending claim
+        response = self._stock_out("key-1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._quantity(), 8)
+        self.assertEqual(IdempotencyRecord.objects.get().status_code, 200)
+
+
+@override_settings(INVENTORY_GROUP_COMMIT=True)
+class IdempotentGroupCommitTests(TransactionTestCase):
+    """
+    A keyed stock-out still goes through the group-commit writer, which
+    only takes callers outside a transaction.
+    """
+    def setUp(self):
+        role = Role.objects.create(name="Viewer")
+        RolePermission.objects.create(
+            role=role, permission=Permission.objects.create(code="inventory.stock_out")
+        )
+
+        self.user = User.objects.create_user(username="viewer", password="x")
+        self.company = Company.objects.create(name="Acme", created_by=self.user)
+        self.user.userprofile.company = self.company
+        self.user.userprofile.save()
+
+        self.warehouse = Warehouse.objects.create(
+            company=self.company, name="Main", code="WH-MAIN"
+        )
+        self.product = Product.objects.create(
+            company=self.company, sku="SKU-1", name="Bolt", unit="pcs"
+        )
+        stock_in_service(
+            actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=10
+        )
+
+        self.writer = GroupCommitWriter(max_batch=50, max_wait=0.05)
+        self.addCleanup(self.writer.stop)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_keyed_stock_out_uses_writer(self):
+        with mock.patch("inventory.group_commit.get_writer", return_value=self.writer), \
+                mock.patch.object(self.writer, "_commit", wraps=self.writer._commit) as commit:
+            response = self.client.post(
+                "/api/inventory/stock-out",
+                {
+                    "product_id": str(self.product.id),
+                    "warehouse_id": str(self.warehouse.id),
+                    "quantity": 4,
+                },
+                format="json",
+                HTTP_IDEMPOTENCY_KEY="key-1",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        commit.assert_called_once()
+        self.assertEqual(
+            InventoryStock.objects.get(product=self.product, warehouse=self.warehouse).quantity, 6
+        )
+        self.assertEqual(IdempotencyRecord.objects.get().status_code, 200)
+
+
+class KeysetPaginationTests(ApiTestCase):
+    def _walk(self, url, limit=2, **params):
+        """
+        Follow next_cursor from the first page; returns the pages' items.
+        """
+        pages = []
+        cursor = ""
+        while cursor is not None:
+            response = self.client.get(url, {"cursor": cursor, "limit": limit, **params})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(data["meta"]["has_prev"], bool(cursor))
+            self.assertIsNone(data["meta"]["offset"])
+            pages.append(data["items"])
+            cursor = data["meta"]["next_cursor"]
+        return pages
+
+    def test_inventory_pages_cover_every_row_once(self):
+        # Equal names are ordered by id, so neither row is skipped
+        for name in ("Bolt", "Nut", "Nut", "Screw"):
+            self._stock_in(1, product=self._product(name=name))
+        self._stock_in(1)
+
+        pages = self._walk("/api/inventory")
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        rows = [row for page in pages for row in page]
+        self.assertEqual(len({row["product_id"] for row in rows}), 5)
+        names = [row["product_name"] for row in rows]
+        self.assertEqual(names, sorted(names))
+
+    def test_offset_page_hands_over_to_cursor(self):
+        for name in ("A", "B", "C"):
+            self._stock_in(1, product=self._product(name=name))
+
+        first = self.client.get("/api/inventory", {"limit": 2}).json()
+        self.assertEqual(first["meta"]["offset"], 0)
+
+        rest = self.client.get(
+            "/api/inventory", {"cursor": first["meta"]["next_cursor"], "limit": 2}
+        ).json()
+        self.assertEqual([row["product_name"] for row in rest["items"]], ["C"])
+        self.assertIsNone(rest["meta"]["next_cursor"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/inventory", {"cursor": "not-a-cursor"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_total_only_on_request(self):
+        self._stock_in(1)
+
+        plain = self.client.get("/api/inventory", {"cursor": ""}).json()
+        counted = self.client.get("/api/inventory", {"cursor": "", "with_total": "1"}).json()
+
+        self.assertIsNone(plain["meta"]["total"])
+        self.assertEqual(counted["meta"]["total"], 1)
+
+    def test_audit_pages_continue_into_the_archive(self):
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                entity="product",
+                entity_id=str(index),
+                action=AuditAction.UPDATE,
+                actor=self.user,
+                company=self.company,
+                new_data={"index": index},
+                created_at=start + timedelta(days=index * 20),
+            )
+            for index in range(5)
+        ])
+        AuditLog.objects.create(
+            entity="product",
+            entity_id="recent",
+            action=AuditAction.UPDATE,
+            actor=self.user,
+            company=self.company,
+        )
+        expected = list(
+            AuditLog.objects.order_by("-created_at", "-id").values_list("entity_id", flat=True)
+        )
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(AUDIT_ARCHIVE_DIR=directory):
+            archive_months(hot_months=6)
+            self.assertEqual(AuditLog.objects.count(), 1)
+
+            pages = self._walk("/api/audit", with_total="1")
+
+        self.assertEqual([row["entity_id"] for page in pages for row in page], expected)
+
+
+@override_settings(LIST_COUNT_EXACT_THRESHOLD=2)
+class ListCountTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        for entity_id in range(3):
+            AuditLog.objects.create(
+                entity="product",
+                entity_id=str(entity_id),
+                action=AuditAction.UPDATE,
+                actor=self.user,
+                company=self.company,
+            )
+
+    @override_settings(LIST_COUNT_STRATEGIES={"audit_list": "cached"})
+    def test_audit_total_from_cached_counter(self):
+        first = self.client.get("/api/audit", {"limit": 2}).json()["meta"]
+        second = self.client.get("/api/audit", {"limit": 2}).json()["meta"]
+
+        self.assertEqual((first["total"], first["total_exact"]), (3, True))
+        self.assertEqual((second["total"], second["total_exact"]), (3, False))
+        self.assertTrue(second["has_next"])
+
+    @override_settings(LIST_COUNT_STRATEGIES={"audit_list": "cached"})
+    def test_filtered_list_is_not_served_from_the_counter(self):
+        self.client.get("/api/audit")
+
+        meta = self.client.get("/api/audit", {"start_date": "2000-01-01"}).json()["meta"]
+
+        self.assertEqual((meta["total"], meta["total_exact"]), (3, True))
+
+
+class StockProjectionTests(ApiTestCase):
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_rows_carry_the_projected_fields(self):
+        supplier = Supplier.objects.create(belongs_to=self.company, name="Acme Supply")
+        product = self._product(name="Bolt", supplier=supplier)
+        self._stock_in(4, product=product)
+
+        [inventory] = self.client.get("/api/inventory").json()["items"]
+        [report] = self.client.get("/api/reports/stock").json()
+
+        self.assertEqual(inventory, {
+            "product_id": str(product.id),
+            "product_name": "Bolt",
+            "warehouse_id": str(self.warehouse.id),
+            "warehouse_name": "Main",
+            "warehouse_deleted_at": None,
+            "supplier_id": str(supplier.id),
+            "supplier_name": "Acme Supply",
+            "quantity": 4,
+            "unit": "pcs",
+        })
+        self.assertEqual(set(report), {
+            "product_id", "product_name", "warehouse_id", "warehouse_name", "quantity", "unit",
+        })
+
+    def test_query_count_is_constant_in_rows(self):
+        self._stock_in(1)
+        small = [self._count_queries(url) for url in ("/api/inventory", "/api/reports/stock")]
+
+        for _ in range(10):
+            self._stock_in(1, product=self._product())
+        large = [self._count_queries(url) for url in ("/api/inventory", "/api/reports/stock")]
+
+        self.assertEqual(small, large)
+
+
+class ConditionalGetTests(ApiTestCase):
+    permissions = ("inventory.view", "product.manage", "warehouse.manage", "supplier.manage")
+
+    def setUp(self):
+        super().setUp()
+        self._stock_in(5)
+
+    def _etag(self, url="/api/reports/valuation"):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.headers["ETag"]
+
+    def test_unchanged_stock_is_not_modified(self):
+        for url in ("/api/inventory", "/api/reports/stock", "/api/reports/valuation"):
+            etag = self._etag(url)
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers["ETag"], etag)
+
+    def test_unchanged_ledger_reports_are_not_modified(self):
+        for url in ("/api/reports/movement", "/api/reports/audit"):
+            etag = self._etag(url)
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, 304)
+
+    def test_validation_reads_no_stock_ledger_or_layers(self):
+        etag = self._etag()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/reports/valuation", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        sql = " ".join(query["sql"] for query in ctx.captured_queries)
+        for model in (InventoryStock, InventoryLedger, StockCostLayer):
+            self.assertNotIn(model._meta.db_table, sql)
+
+    def test_tags_differ_per_url(self):
+        self.assertNotEqual(self._etag("/api/inventory"), self._etag("/api/reports/stock"))
+
+    def test_stock_movement_changes_the_tag(self):
+        etag = self._etag()
+        self._stock_in(1)
+
+        response = self.client.get("/api/reports/valuation", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_drift_correction_changes_the_tag(self):
+        InventoryLedger.objects.update(change=3)
+        etag = self._etag("/api/reports/movement")
+
+        self.assertIsNotNone(correct_drift(
+            product_id=self.product.id, warehouse_id=self.warehouse.id, actor=self.user,
+        ))
+
+        self.assertNotEqual(self._etag("/api/reports/movement"), etag)
+
+    def test_product_rename_changes_the_tag(self):
+        etag = self._etag("/api/reports/stock")
+
+        self.client.put(
+            f"/api/products/{self.product.id}",
+            {"name": "Renamed", "sku": self.product.sku},
+            format="json",
+        )
+
+        self.assertNotEqual(self._etag("/api/reports/stock"), etag)
+
+    def test_warehouse_delete_changes_the_tag(self):
+        etag = self._etag()
+        self.assertEqual(len(self.client.get("/api/reports/valuation").json()), 1)
+
+        self.client.delete(f"/api/warehouses/{self.warehouse.id}")
+
+        response = self.client.get("/api/reports/valuation", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.json(), [])
+
+    def test_supplier_delete_changes_the_tag(self):
+        supplier = Supplier.objects.create(belongs_to=self.company, name="Acme Supply")
+        etag = self._etag("/api/inventory")
+
+        self.client.delete(f"/api/suppliers/{supplier.id}")
+
+        self.assertNotEqual(self._etag("/api/inventory"), etag)
+
+    def test_username_change_changes_the_tag(self):
+        etag = self._etag("/api/reports/audit")
+
+        self.client.put("/api/me", {"username": "renamed"}, format="json")
+
+        self.assertNotEqual(self._etag("/api/reports/audit"), etag)
+
+    def test_other_companies_do_not_change_the_tag(self):
+        etag = self._etag()
+        other = Company.objects.create(name="Other", created_by=self.user)
+        stock_in_service(
+            actor=self.user,
+            product_id=Product.objects.create(
+                company=other, sku="OTHER-1", name="Other", unit="pcs",
+            ).id,
+            warehouse_id=Warehouse.objects.create(
+                company=other, name="Other", code="WH-OTHER",
+            ).id,
+            quantity=3,
+        )
+
+        self.assertEqual(self._etag(), etag)
+
+    def test_users_without_permission_get_no_tag(self):
+        RolePermission.objects.filter(role=self.role).delete()
+
+        response = self.client.get("/api/reports/valuation", HTTP_IF_NONE_MATCH="*")
+
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn("ETag", response.headers)
+
+
+class StockAsOfReportTests(ApiTestCase):
+    def _move(self, at, quantity, product=None):
+        dated = list(InventoryLedger.objects.values_list("id", flat=True))
+        if quantity > 0:
+            self._stock_in(quantity, product=product)
+        else:
+            stock_out_service(
+                actor=self.user,
+                product_id=(product or self.product).id,
+                warehouse_id=self.warehouse.id,
+                quantity=-quantity,
+            )
+        InventoryLedger.objects.exclude(id__in=dated).update(created_at=at)
+
+    def _quantities(self, at):
+        response = self.client.get("/api/reports/stock-as-of", {"at": at.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        return {item["product_id"]: item["quantity"] for item in response.json()["items"]}
+
+    def test_quantities_at_each_cut_off(self):
+        other = self._product()
+
+        def day(n):
+            return datetime(2025, 3, n, 12, tzinfo=dt_timezone.utc)
+
+        self._move(day(1), 10)
+        self._move(day(3), -4)
+        self._move(day(3), 6, product=other)
+        self._move(day(5), 2)
+
+        self.assertEqual(self._quantities(day(1) - timedelta(seconds=1)), {})
+        self.assertEqual(self._quantities(day(1)), {str(self.product.id): 10})
+        self.assertEqual(self._quantities(day(4)), {
+            str(self.product.id): 6, str(other.id): 6,
+        })
+        self.assertEqual(self._quantities(day(6)), {
+            str(self.product.id): 8, str(other.id): 6,
+        })
+
+    def test_at_is_required(self):
+        for params in ({}, {"at": "yesterday"}):
+            response = self.client.get("/api/reports/stock-as-of", params)
+            self.assertEqual(response.status_code, 400)
@@ -11,6 +11,7 @@ urlpatterns = [
     # ================= Inventory =================
     path("inventory", views.inventory_list),
     path("inventory/stock-out", views.stock_out),
+    path("inventory/bulk-stock-in", views.bulk_stock_in),
     path("inventory/transfer", views.transfer_stock),
 
     # ================= Purchase Requisition =================
@@ -68,6 +69,7 @@ urlpatterns = [
     path("audit", views.audit_list),
     path("reports/monthly-stock", views.monthly_stock_report),
     path("reports/stock", views.stock_report),
+    path("reports/stock-as-of", views.stock_as_of_report),
     path("reports/movement", views.movement_report),
     path("reports/valuation", views.inventory_valuation_report),
     path("reports/low-stock", views.low_stock_report),
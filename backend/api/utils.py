@@ -1,4 +1,15 @@
-def paginate(qs, request, max_limit=200):
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from core.counting import count_rows
+from core.fastjson import dumps
+
+
+def _limit_offset(request, max_limit):
     try:
         limit = min(int(request.GET.get("limit", 50)), max_limit)
     except ValueError:
@@ -9,13 +20,184 @@ def paginate(qs, request, max_limit=200):
     except ValueError:
         offset = 0
 
-    total = qs.count()
-    items = qs[offset: offset + limit]
+    return limit, offset
+
+
+# ---------- Keyset (cursor) pagination ----------
+#
+# A list endpoint opts in by passing cursor_fields, its full ordering with a
+# unique last field, e.g. ("-created_at", "-id"). Clients then send
+# ?cursor= (empty for the first page) and follow meta["next_cursor"]; each
+# page is a range scan from the previous page's last row, so page 10,000
+# costs the same as page 1. Totals are only counted with ?with_total=1.
+# Requests without ?cursor keep the offset behaviour (and meta) unchanged.
+
+
+def encode_cursor(values):
+    # Full microsecond precision: a truncated timestamp would skip rows
+    return base64.urlsafe_b64encode(dumps(values)).decode().rstrip("=")
+
+
+def decode_cursor(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValidationError({"cursor": "Invalid cursor"})
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValidationError({"cursor": "Invalid cursor"})
+    return values
+
+
+def _cursor_value(item, field):
+    if isinstance(item, dict):
+        return item[field]
+
+    for attr in field.split("__"):
+        item = getattr(item, attr)
+    return item
+
+
+def cursor_for(item, cursor_fields):
+    return encode_cursor([_cursor_value(item, f.lstrip("-")) for f in cursor_fields])
+
+
+def keyset_filter(qs, cursor_fields, values):
+    """
+    Rows strictly after `values` in the cursor_fields ordering:
+    (a > x) OR (a = x AND b > y) OR ..., with < for descending fields.
+    """
+    condition = Q()
+    for i, field in enumerate(cursor_fields):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+
+        step = Q(**{f"{name}__{lookup}": values[i]})
+        for previous, value in zip(cursor_fields[:i], values[:i]):
+            step &= Q(**{previous.lstrip("-"): value})
+        condition |= step
+
+    return qs.filter(condition)
+
+
+def _cursor_page(rows, limit, cursor_fields, request, total, total_exact):
+    has_next = len(rows) > limit
+    items = rows[:limit]
 
     return items, {
+        "limit": limit,
+        "offset": None,
+        "total": total,
+        "total_exact": total_exact,
+        "has_next": has_next,
+        "has_prev": bool(request.GET.get("cursor")),
+        "next_cursor": cursor_for(items[-1], cursor_fields) if has_next else None,
+    }
+
+
+def _offset_meta(items, limit, offset, total, total_exact, has_next, cursor_fields):
+    meta = {
         "limit": limit,
         "offset": offset,
         "total": total,
-        "has_next": offset + limit < total,
+        "total_exact": total_exact,
+        "has_next": has_next,
         "has_prev": offset > 0,
     }
+    if cursor_fields is not None:
+        # Lets offset clients switch to cursors from any page
+        meta["next_cursor"] = (
+            cursor_for(list(items)[-1], cursor_fields) if has_next and items else None
+        )
+
+    return meta
+
+
+def _wants_cursor(request, cursor_fields):
+    return cursor_fields is not None and "cursor" in request.GET
+
+
+def _wants_total(request):
+    return request.GET.get("with_total") in ("1", "true")
+
+
+# ---------- Totals ----------
+#
+# How an endpoint counts its total is set per endpoint name in
+# LIST_COUNT_STRATEGIES (see core.counting); endpoints not listed count
+# exactly. meta["total_exact"] is False when the total is an estimate or a
+# cached counter, in which case has_next comes from fetching one extra row.
+
+
+def _count(qs, endpoint, counter):
+    strategy = settings.LIST_COUNT_STRATEGIES.get(endpoint, "exact")
+    return count_rows(qs, strategy=strategy, counter=counter)
+
+
+def paginate(qs, request, max_limit=200, cursor_fields=None, endpoint=None, counter=None):
+    limit, offset = _limit_offset(request, max_limit)
+
+    if _wants_cursor(request, cursor_fields):
+        page = qs.order_by(*cursor_fields)
+        token = request.GET.get("cursor")
+        if token:
+            page = keyset_filter(page, cursor_fields, decode_cursor(token, len(cursor_fields)))
+
+        total, exact = _count(qs, endpoint, counter) if _wants_total(request) else (None, None)
+        return _cursor_page(list(page[:limit + 1]), limit, cursor_fields, request, total, exact)
+
+    total, exact = _count(qs, endpoint, counter)
+    if exact:
+        items = qs[offset: offset + limit]
+        has_next = offset + limit < total
+    else:
+        rows = list(qs[offset: offset + limit + 1])
+        items, has_next = rows[:limit], len(rows) > limit
+
+    return items, _offset_meta(items, limit, offset, total, exact, has_next, cursor_fields)
+
+
+def paginate_with_tail(qs, tail, request, max_limit=200, cursor_fields=None, endpoint=None, counter=None):
+    """
+    paginate() over the rows of `qs` followed by those of `tail`, which
+    only needs count(), slicing and, for cursor pages, after(values, n)
+    (e.g. archived audit rows, all of which sort after `qs`).
+    """
+    limit, offset = _limit_offset(request, max_limit)
+
+    if _wants_cursor(request, cursor_fields):
+        token = request.GET.get("cursor")
+        values = decode_cursor(token, len(cursor_fields)) if token else None
+
+        page = qs.order_by(*cursor_fields)
+        if values is not None:
+            page = keyset_filter(page, cursor_fields, values)
+        rows = list(page[:limit + 1])
+
+        if len(rows) <= limit:
+            # Every tail row sorts after every head row, so the same
+            # cursor works whether it came from the head or the tail
+            rows += tail.after(values, limit + 1 - len(rows))
+
+        total, exact = None, None
+        if _wants_total(request):
+            head_total, exact = _count(qs, endpoint, counter)
+            total = head_total + tail.count()
+        return _cursor_page(rows, limit, cursor_fields, request, total, exact)
+
+    head_total, exact = _count(qs, endpoint, counter)
+    rows = list(qs[offset: offset + limit + 1]) if not exact or offset < head_total else []
+
+    if not exact and len(rows) <= limit:
+        # The head ends on this page, so where the tail starts must be exact
+        head_total = offset + len(rows) if rows else qs.count()
+        exact = True
+
+    total = head_total + tail.count()
+    items = rows[:limit]
+    if len(items) < limit:
+        start = max(offset - head_total, 0)
+        items += tail[start: start + limit - len(items)]
+
+    has_next = len(rows) > limit or offset + limit < total
+    return items, _offset_meta(items, limit, offset, total, exact, has_next, cursor_fields)
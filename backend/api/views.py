@@ -4,20 +4,25 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.exceptions import ValidationError
+from django.conf import settings
 from django.db import transaction
 
 
 import django.utils.timezone as timezone
 
 from django.http import JsonResponse, HttpResponseBadRequest
-from django.utils.dateparse import parse_date
-from api.utils import paginate
+from django.utils.dateparse import parse_date, parse_datetime
+from api.conditional import stock_conditional
+from api.utils import paginate, paginate_with_tail
+from api.idempotency import idempotent
 from django.db.models import Q
 
 from rbac.models import RolePermission
 from core.audit.models import AuditLog
-from core.audit.logger import AuditLogger
+from core.audit.logger import AUDIT_COUNTER, AuditLogger
 from core.audit.enums import AuditAction
+from core.audit.archive import ArchivedAuditRows, archive_boundary, load_manifest
+from core.audit.delta import expand_audit_rows
 from rbac.services import user_has_permission
 from inventory.models import Product, InventoryStock, InventoryLedger, Warehouse, InventoryOrder, InventoryIssue, GoodsReceiptNote, GoodsReceiptItem
 from company.models import Supplier
@@ -32,6 +37,8 @@ from inventory.services import (
     create_grn_service,
     approve_grn_service,
     reject_grn_service,
+    bump_company_stock_watermarks,
+    bump_stock_watermarks,
 )
 
 
@@ -72,13 +79,18 @@ def my_profile(request):
         })
 
     if request.method == "PUT":
+        renamed = request.data.get("username", user.username) != user.username
         user.username = request.data.get("username", user.username)
         profile.phone_number = request.data.get(
             "phone_number", profile.phone_number
         )
 
-        user.save()
-        profile.save()
+        with transaction.atomic():
+            user.save()
+            profile.save()
+            # Ledger reports show who made each movement
+            if renamed and profile.company:
+                bump_company_stock_watermarks(profile.company)
 
         AuditLogger.log(
             entity="user_profile",
@@ -145,13 +157,18 @@ def update_my_profile(request):
     user = request.user
     profile = user.userprofile
 
+    renamed = request.data.get("username", user.username) != user.username
     user.username = request.data.get("username", user.username)
     profile.phone_number = request.data.get(
         "phone_number", profile.phone_number
     )
 
-    user.save()
-    profile.save()
+    with transaction.atomic():
+        user.save()
+        profile.save()
+        # Ledger reports show who made each movement
+        if renamed and profile.company:
+            bump_company_stock_watermarks(profile.company)
 
     AuditLogger.log(
         entity="user_profile",
@@ -170,8 +187,14 @@ def update_my_profile(request):
 
 # ================ Inventory Views =================
 
+INVENTORY_LIST_FIELDS = (
+    "product_id", "product_name", "warehouse_id", "warehouse_name", "warehouse_deleted_at",
+    "supplier_id", "supplier_name", "quantity", "unit",
+)
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@stock_conditional("inventory.view")
 def inventory_list(request):
     if not user_has_permission(request.user, "inventory.view"):
         return Response({"message": "You don't have access to view Inventory"}, status=403)
@@ -185,32 +208,22 @@ def inventory_list(request):
             status=400
         )
 
-    qs = (
+    qs = stock_values(
         InventoryStock.objects
-        .select_related("product", "warehouse")
         .filter(
             warehouse__company=company,
         )
-        .order_by("product__name")
+        .order_by("product__name", "id"),
+        INVENTORY_LIST_FIELDS,
+        extra=("id",),
     )
 
-    items, meta = paginate(qs, request)
+    items, meta = paginate(
+        qs, request, cursor_fields=("product__name", "id"), endpoint="inventory_list"
+    )
 
     return Response({
-        "items": [
-            {
-                "product_id": s.product.id,
-                "product_name": s.product.name,
-                "warehouse_id": s.warehouse.id,
-                "warehouse_name": s.warehouse.name,
-                "warehouse_deleted_at": s.warehouse.deleted_at,
-                "supplier_id": s.product.supplier.id if s.product.supplier else None,
-                "supplier_name": s.product.supplier.name if s.product.supplier else None,
-                "quantity": s.quantity,
-                "unit": s.product.unit
-            }
-            for s in items
-        ],
+        "items": [stock_row(row, INVENTORY_LIST_FIELDS) for row in items],
         "meta": meta,
     })
 
@@ -295,7 +308,9 @@ def product_update_delete(request, pk):
         p.name = request.data["name"]
         p.sku = request.data["sku"]
         p.description = request.data.get("description", "")
-        p.save()
+        with transaction.atomic():
+            p.save()
+            bump_company_stock_watermarks(p.company)
 
         AuditLogger.log(
             entity="product",
@@ -315,7 +330,9 @@ def product_update_delete(request, pk):
 
     # DELETE (soft)
     p.deleted_at = timezone.now()
-    p.save()
+    with transaction.atomic():
+        p.save()
+        bump_company_stock_watermarks(p.company)
 
     AuditLogger.log(
         entity="product",
@@ -438,7 +455,9 @@ def warehouse_update_delete(request, pk):
 
         warehouse.name = request.data.get("name", warehouse.name)
         warehouse.location = request.data.get("location", warehouse.location)
-        warehouse.save()
+        with transaction.atomic():
+            warehouse.save()
+            bump_stock_watermarks([warehouse.id])
 
         AuditLogger.log(
             entity="warehouse",
@@ -463,7 +482,9 @@ def warehouse_update_delete(request, pk):
     # DELETE (soft)
     # --------------------
     warehouse.deleted_at = timezone.now()
-    warehouse.save(update_fields=["deleted_at"])
+    with transaction.atomic():
+        warehouse.save(update_fields=["deleted_at", "updated_at"])
+        bump_stock_watermarks([warehouse.id])
 
     AuditLogger.log(
         entity="warehouse",
@@ -581,7 +602,9 @@ def supplier_update_delete(request, pk):
 
         supplier.name = request.data.get("name", supplier.name)
         supplier.address = request.data.get("address", supplier.address)
-        supplier.save()
+        with transaction.atomic():
+            supplier.save()
+            bump_company_stock_watermarks(supplier.belongs_to)
 
         AuditLogger.log(
             entity="supplier",
@@ -606,7 +629,9 @@ def supplier_update_delete(request, pk):
     # DELETE (soft)
     # --------------------
     supplier.deleted_at = timezone.now()
-    supplier.save(update_fields=["deleted_at"])
+    with transaction.atomic():
+        supplier.save(update_fields=["deleted_at", "updated_at"])
+        bump_company_stock_watermarks(supplier.belongs_to)
 
     AuditLogger.log(
         entity="supplier",
@@ -625,6 +650,7 @@ from inventory.services import transfer_stock_service
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent
 def transfer_stock(request):
     if not user_has_permission(request.user, "inventory.transfer"):
         return Response({"message": "Forbidden"}, status=403)
@@ -645,19 +671,54 @@ def transfer_stock(request):
 # ================ Audit Views =================
 
 
+AUDIT_CURSOR = ("-created_at", "-id")
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def audit_list(request):
+    company = request.user.userprofile.company
+    start, end = local_day_bounds(request.GET.get("start_date"), request.GET.get("end_date"))
+
     qs = (
         AuditLog.objects
         .select_related("actor")
-        .order_by("-created_at")
+        .order_by("-created_at", "-id")
         .filter(
-            company=request.user.userprofile.company
+            company=company
         )
     )
+    if start:
+        qs = qs.filter(created_at__gte=start)
+    if end:
+        qs = qs.filter(created_at__lt=end)
 
-    items, meta = paginate(qs, request)
+    # The cached counter tracks the company's whole (hot) audit table
+    counter = None if start or end else (AUDIT_COUNTER, company.id)
+
+    # Rows before the archive boundary are served from the cold archive
+    manifest = load_manifest()
+    boundary = archive_boundary(company.id, manifest)
+
+    if boundary is None or (start and start >= boundary):
+        items, meta = paginate(
+            qs, request, cursor_fields=AUDIT_CURSOR, endpoint="audit_list", counter=counter
+        )
+    else:
+        items, meta = paginate_with_tail(
+            qs.filter(created_at__gte=boundary),
+            ArchivedAuditRows(company.id, start=start, end=end, manifest=manifest),
+            request,
+            cursor_fields=AUDIT_CURSOR,
+            endpoint="audit_list",
+            counter=counter,
+        )
+
+    # Delta rows are rebuilt into full snapshots unless ?raw=1
+    if request.GET.get("raw") == "1":
+        views = {a.id: (a.old_data, a.new_data) for a in items}
+    else:
+        views = expand_audit_rows(items)
 
     return Response({
         "items": [
@@ -671,8 +732,9 @@ def audit_list(request):
                     "id": str(a.actor.id) if a.actor else None,
                     "username": a.actor.username if a.actor else "system",
                 },
-                "old_data": a.old_data,
-                "new_data": a.new_data,
+                "old_data": views[a.id][0],
+                "new_data": views[a.id][1],
+                "delta": a.is_delta,
             }
             for a in items
         ],
@@ -682,15 +744,20 @@ def audit_list(request):
 # ================ Reports Views =================
 
 
-from reports.services import get_inventory_valuation, get_low_stock_report, get_audit_report, get_order_report, get_inventory_aging_report, get_monthly_stock_report
+from reports.services import get_inventory_valuation, get_low_stock_report, get_audit_report, get_order_report, get_inventory_aging_report, get_inventory_aging_queryset, aging_row, get_monthly_stock_report, get_stock_as_of, filter_ledger_dates, local_day_bounds, stock_values, stock_row
+
+STOCK_REPORT_FIELDS = (
+    "product_id", "product_name", "warehouse_id", "warehouse_name", "quantity", "unit",
+)
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@stock_conditional("inventory.view")
 def stock_report(request):
     if not user_has_permission(request.user, "inventory.view"):
         return Response({"message": "Forbidden"}, status=403)
 
-    qs = InventoryStock.objects.select_related("product", "warehouse").filter(
+    qs = InventoryStock.objects.filter(
         warehouse__company=request.user.userprofile.company
     )
 
@@ -703,20 +770,14 @@ def stock_report(request):
         qs = qs.filter(warehouse_id=warehouse_id)
 
     return Response([
-        {
-            "product_id": s.product.id,
-            "product_name": s.product.name,
-            "warehouse_id": s.warehouse.id,
-            "warehouse_name": s.warehouse.name,
-            "quantity": s.quantity,
-            "unit": s.product.unit,
-        }
-        for s in qs
+        stock_row(row, STOCK_REPORT_FIELDS)
+        for row in stock_values(qs, STOCK_REPORT_FIELDS)
     ])
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@stock_conditional("inventory.view")
 def monthly_stock_report(request):
     if not user_has_permission(request.user, "inventory.view"):
         return Response({"message": "Forbidden"}, status=403)
@@ -735,6 +796,34 @@ def monthly_stock_report(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@stock_conditional("inventory.view")
+def stock_as_of_report(request):
+    if not user_has_permission(request.user, "inventory.view"):
+        return Response({"message": "Forbidden"}, status=403)
+
+    at = request.GET.get("at")
+    try:
+        at = parse_datetime(at) if at else None
+    except ValueError:
+        at = None
+
+    if at is None:
+        return Response({"message": "at is required (ISO 8601 timestamp)"}, status=400)
+
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+
+    data = list(get_stock_as_of(
+        company=request.user.userprofile.company,
+        at=at,
+    ))
+
+    return Response({"at": at, "items": data})
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@stock_conditional("inventory.view")
 def movement_report(request):
     if not user_has_permission(request.user, "inventory.view"):
         return Response({"message": "Forbidden"}, status=403)
@@ -749,10 +838,7 @@ def movement_report(request):
     product_id = request.GET.get("product_id")
     warehouse_id = request.GET.get("warehouse_id")
 
-    if start_date:
-        qs = qs.filter(created_at__date__gte=parse_date(start_date))
-    if end_date:
-        qs = qs.filter(created_at__date__lte=parse_date(end_date))
+    qs = filter_ledger_dates(qs, start_date, end_date)
     if product_id:
         qs = qs.filter(product_id=product_id)
     if warehouse_id:
@@ -776,6 +862,7 @@ def movement_report(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@stock_conditional("inventory.view")
 def inventory_valuation_report(request):
     if not user_has_permission(request.user, "inventory.view"):
         return Response({"message": "Forbidden"}, status=403)
@@ -788,6 +875,7 @@ def inventory_valuation_report(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@stock_conditional("inventory.view")
 def low_stock_report(request):
     if not user_has_permission(request.user, "inventory.view"):
         return Response({"message": "Forbidden"}, status=403)
@@ -801,6 +889,7 @@ def low_stock_report(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@stock_conditional("inventory.view")
 def audit_report(request):
     if not user_has_permission(request.user, "inventory.view"):
         return Response({"message": "Forbidden"}, status=403)
@@ -833,11 +922,23 @@ def order_report(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@stock_conditional("inventory.view")
 def inventory_aging_report(request):
     if not user_has_permission(request.user, "inventory.view"):
         return Response({"message": "Forbidden"}, status=403)
 
     company = request.user.userprofile.company
+
+    # Paginated variant: ?limit=&offset= returns {"items", "meta"}
+    if "limit" in request.GET:
+        rows, meta = paginate(get_inventory_aging_queryset(company), request)
+        today = timezone.now().date()
+
+        return Response({
+            "items": [aging_row(r, today) for r in rows],
+            "meta": meta,
+        })
+
     data = get_inventory_aging_report(company)
     return Response(data)
 
@@ -846,6 +947,7 @@ def inventory_aging_report(request):
 # ================ Stock View =================
 
 from inventory.services import stock_in_service, stock_out_service
+from inventory.group_commit import group_stock_out
 
 # @api_view(["POST"])
 # @permission_classes([IsAuthenticated])
@@ -952,6 +1054,7 @@ from inventory.services import stock_in_service, stock_out_service
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent
 def stock_out(request):
     if not user_has_permission(request.user, "inventory.stock_out"):
         return Response({"message": "Forbidden"}, status=403)
@@ -963,8 +1066,10 @@ def stock_out(request):
     if not product_id or not warehouse_id or quantity <= 0:
         return Response({"message": "Invalid input"}, status=400)
 
+    service = group_stock_out if settings.INVENTORY_GROUP_COMMIT else stock_out_service
+
     try:
-        stock_out_service(
+        service(
             actor=get_actor(request),
             product_id=product_id,
             warehouse_id=warehouse_id,
@@ -978,55 +1083,55 @@ def stock_out(request):
 
 
 
-# @api_view(["POST"])
-# @permission_classes([IsAuthenticated])
-# def bulk_stock_in(request):
-#     if not user_has_permission(request.user, "inventory.stock_in"):
-#         return Response(
-#             {"message": "Forbidden"},
-#             status=403
-#         )
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def bulk_stock_in(request):
+    if not user_has_permission(request.user, "inventory.stock_in"):
+        return Response(
+            {"message": "Forbidden"},
+            status=403
+        )
 
-#     profile = request.user.userprofile
-#     company = profile.company
+    profile = request.user.userprofile
+    company = profile.company
 
-#     if not company:
-#         return Response(
-#             {"message": "No active company selected"},
-#             status=400
-#         )
+    if not company:
+        return Response(
+            {"message": "No active company selected"},
+            status=400
+        )
 
-#     warehouse_id = request.data.get("warehouse_id")
-#     items = request.data.get("items", [])
-#     reference = request.data.get("reference", "BARCODE_SCAN")
+    warehouse_id = request.data.get("warehouse_id")
+    items = request.data.get("items", [])
+    reference = request.data.get("reference", "BARCODE_SCAN")
 
-#     if not warehouse_id:
-#         return Response(
-#             {"message": "warehouse_id is required"},
-#             status=400
-#         )
+    if not warehouse_id:
+        return Response(
+            {"message": "warehouse_id is required"},
+            status=400
+        )
 
-#     try:
-#         result = bulk_stock_in_service(
-#             actor=get_actor(request),
-#             company=company,
-#             warehouse_id=warehouse_id,
-#             items=items,
-#             reference=reference,
-#         )
-#     except ValueError as e:
-#         return Response(
-#             {"message": str(e)},
-#             status=400
-#         )
+    try:
+        result = bulk_stock_in_service(
+            actor=get_actor(request),
+            company=company,
+            warehouse_id=warehouse_id,
+            items=items,
+            reference=reference,
+        )
+    except ValueError as e:
+        return Response(
+            {"message": str(e)},
+            status=400
+        )
 
-#     return Response(
-#         {
-#             "success": True,
-#             "processed": result["processed"],
-#             "reference_id": result["reference_id"],
-#         }
-#     )
+    return Response(
+        {
+            "success": True,
+            "processed": result["processed"],
+            "reference_id": result["reference_id"],
+        }
+    )
 
 # ================= PR Views =================
 
@@ -1291,6 +1396,7 @@ def grn_list_create(request):
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent
 def grn_approve(request, pk):
     if not user_has_permission(request.user, "inventory.grn.approve"):
         return Response({"message": "Forbidden"}, status=403)
@@ -1327,7 +1433,7 @@ from inventory.models import IssueSlip, IssueSlipItem
 from inventory.services import (
     approve_issue_slip_service,
     reject_issue_slip_service,
-    apply_issue,
+    execute_issue_slip_service,
 )
 
 @api_view(["GET", "POST"])
@@ -1433,22 +1539,10 @@ def issue_slip_approve(request, pk):
     if not user_has_permission(request.user, "inventory.issue_slip.approve"):
         return Response({"message": "Forbidden"}, status=403)
 
-    slip = IssueSlip.objects.get(id=pk)
-
-    if slip.status != IssueSlip.STATUS_PENDING:
-        return Response({"message": "Invalid state"}, status=400)
-
-    slip.status = IssueSlip.STATUS_APPROVED
-    slip.approved_by = request.user
-    slip.save(update_fields=["status", "approved_by"])
-
-    AuditLogger.log(
-        entity="issue_slip",
-        entity_id=slip.id,
-        action=AuditAction.UPDATE,
-        actor=request.user,
-        company=request.user.userprofile.company,
-    )
+    try:
+        approve_issue_slip_service(slip_id=pk, actor=request.user)
+    except ValueError as e:
+        return Response({"message": str(e)}, status=400)
 
     return Response({"status": "APPROVED"})
 
@@ -1473,61 +1567,14 @@ def issue_slip_reject(request, pk):
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
-@transaction.atomic
 def issue_slip_execute(request, pk):
     if not user_has_permission(request.user, "inventory.issue.execute"):
         return Response({"message": "Forbidden"}, status=403)
 
-    slip = (
-        IssueSlip.objects
-        .select_for_update()
-        .prefetch_related("items__product")
-        .get(id=pk)
-    )
-
-    if slip.status != IssueSlip.STATUS_APPROVED:
-        return Response(
-            {"message": "Only APPROVED slips can be executed"},
-            status=400
-        )
-
-    issues = []
-
-    for item in slip.items.all():
-        issue = InventoryIssue.objects.create(
-            issue_slip=slip,
-            product=item.product,
-            warehouse=slip.warehouse,
-            company=slip.company,
-            quantity=item.quantity,
-            issue_type=InventoryIssue.ISSUE_INTERNAL,
-            requested_by=slip.requested_by,
-            approved_by=request.user,
-            status=InventoryIssue.STATUS_APPROVED,
-            approved_at=timezone.now(),
-        )
-
-        # 🔥 ACTUAL STOCK DEDUCTION
-        apply_issue(issue)
-
-        issues.append(issue)
-
-    # Mark slip as ISSUED
-    slip.status = "ISSUED"
-    slip.issued_at = timezone.now()
-    slip.save()
-
-    AuditLogger.log(
-        entity="issue_slip",
-        entity_id=slip.id,
-        action=AuditAction.UPDATE,
-        actor=request.user,
-        company=request.user.userprofile.company,
-        new_data={
-            "status": "ISSUED",
-            "issue_count": len(issues),
-        },
-    )
+    try:
+        slip, issues = execute_issue_slip_service(slip_id=pk, actor=request.user)
+    except ValueError as e:
+        return Response({"message": str(e)}, status=400)
 
     return Response({
         "status": "ISSUED",
@@ -1558,10 +1605,12 @@ def order_list(request):
         .select_related("warehouse", "requested_by", "approved_by")
         .prefetch_related("items__product")
         .filter(warehouse__company=company)
-        .order_by("-created_at")
+        .order_by("-created_at", "-id")
     )
 
-    orders, meta = paginate(qs, request)
+    orders, meta = paginate(
+        qs, request, cursor_fields=("-created_at", "-id"), endpoint="order_list"
+    )
 
     return Response({
         "items": [
@@ -62,8 +62,22 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 
+# Audit rows older than AUDIT_HOT_MONTHS whole months are moved to gzip JSONL
+# segments under AUDIT_ARCHIVE_DIR by archive_audit_log (core.audit.archive).
+# An absolute path on durable storage; unset, nothing is archived.
+AUDIT_HOT_MONTHS = int(os.getenv("AUDIT_HOT_MONTHS", "6"))
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR") or None
+
+# JSON encoder for audit payloads and API responses (core.fastjson):
+# "auto" uses orjson when installed, "orjson" requires it, "stdlib" never uses it
+FAST_JSON_BACKEND = os.getenv("FAST_JSON_BACKEND", "auto")
+
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
 
@@ -156,6 +170,58 @@ TIME_ZONE = "Asia/Kolkata"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# Stock mutation strategy for stock_in_service / stock_out_service:
+# "pessimistic" (SELECT ... FOR UPDATE) or "optimistic" (version-checked UPDATE)
+INVENTORY_STOCK_CONCURRENCY = os.getenv("INVENTORY_STOCK_CONCURRENCY", "pessimistic")
+INVENTORY_OPTIMISTIC_RETRIES = int(os.getenv("INVENTORY_OPTIMISTIC_RETRIES", "5"))
+
+# Group-commit mode for the stock-out endpoint: movements are queued and a
+# writer thread commits whatever arrived within MAX_WAIT_MS as one transaction.
+# The queue is drained on SIGTERM and at exit, so workers must be stopped
+# gracefully (a SIGKILL loses the movements still queued in that worker)
+INVENTORY_GROUP_COMMIT = os.getenv("INVENTORY_GROUP_COMMIT", "False") == "True"
+INVENTORY_GROUP_COMMIT_MAX_BATCH = int(os.getenv("INVENTORY_GROUP_COMMIT_MAX_BATCH", "200"))
+INVENTORY_GROUP_COMMIT_MAX_WAIT_MS = float(os.getenv("INVENTORY_GROUP_COMMIT_MAX_WAIT_MS", "5"))
+
+# How long an approved issue slip holds its stock reservation before
+# expire_stock_reservations hands it back
+INVENTORY_RESERVATION_TTL_HOURS = int(os.getenv("INVENTORY_RESERVATION_TTL_HOURS", "48"))
+
+# Stored Idempotency-Key responses older than this are removed by purge_idempotency_keys
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+
+# Audit updates store only the fields that changed (core.audit.delta)
+AUDIT_LOG_DIFF = os.getenv("AUDIT_LOG_DIFF", "False") == "True"
+
+# Audit events go to the AuditOutbox table in the caller's transaction and
+# drain_audit_outbox writes them to AuditLog and the sinks below
+AUDIT_LOG_OUTBOX = os.getenv("AUDIT_LOG_OUTBOX", "False") == "True"
+AUDIT_OUTBOX_SINKS = []
+if os.getenv("AUDIT_OUTBOX_JSONL_PATH"):
+    AUDIT_OUTBOX_SINKS.append({
+        "class": "core.audit.outbox.JSONLSink",
+        "options": {"path": os.getenv("AUDIT_OUTBOX_JSONL_PATH")},
+    })
+if os.getenv("AUDIT_OUTBOX_WEBHOOK_URL"):
+    AUDIT_OUTBOX_SINKS.append({
+        "class": "core.audit.outbox.WebhookSink",
+        "options": {"url": os.getenv("AUDIT_OUTBOX_WEBHOOK_URL")},
+    })
+
+# Totals of paginated lists (core.counting), per endpoint: "exact",
+# "estimate" (planner estimate from EXPLAIN) or "cached" (per-company
+# counter in the default cache; use a shared cache such as Redis so every
+# worker sees the same counters). Lists under LIST_COUNT_EXACT_THRESHOLD
+# rows are always counted exactly; endpoints not listed count exactly.
+LIST_COUNT_STRATEGIES = {
+    "audit_list": os.getenv("AUDIT_LIST_COUNT_STRATEGY", "cached"),
+    "order_list": os.getenv("ORDER_LIST_COUNT_STRATEGY", "exact"),
+    "inventory_list": os.getenv("INVENTORY_LIST_COUNT_STRATEGY", "exact"),
+}
+LIST_COUNT_EXACT_THRESHOLD = int(os.getenv("LIST_COUNT_EXACT_THRESHOLD", "10000"))
+LIST_COUNT_CACHE_TIMEOUT = int(os.getenv("LIST_COUNT_CACHE_TIMEOUT", "300"))
+
+
 from datetime import timedelta
 
 CORS_ALLOW_CREDENTIALS = True
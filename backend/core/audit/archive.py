@@ -0,0 +1,531 @@
+"""
+Cold storage for old audit rows.
+
+archive_audit_log moves every whole month older than the hot window out of
+AuditLog into gzip-compressed JSONL segments, one per company and month:
+
+    <AUDIT_ARCHIVE_DIR>/<company_id>/<YYYY-MM>.jsonl.gz
+
+manifest.json in the same directory lists the segments with their row
+counts and time span. Segments hold full payloads (delta rows are expanded
+first), so they can be read without the rows they were replayed from.
+
+Each segment is a run of independent gzip members of _BLOCK_ROWS lines,
+and the manifest records every block's byte offset, row count and time
+span. A page decompresses only the blocks it returns rows from; gzip
+readers still see one ordinary file.
+
+Archiving is off unless AUDIT_ARCHIVE_DIR is set.
+
+For a company, AuditLog is only read from the end of its newest archived
+month on (archive_boundary), so rows that are still in the table after an
+interrupted run are never returned twice.
+"""
+import gzip
+import heapq
+import json
+import os
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+
+from core import partitioning
+from core.counting import invalidate_counter
+from core.fastjson import dumps
+
+from .delta import expand_audit_rows
+from .logger import AUDIT_COUNTER
+from .models import AuditLog
+
+
+TABLE = AuditLog._meta.db_table
+
+_CHUNK = 2000
+
+# Lines per gzip member of a segment: the unit a page decompresses
+_BLOCK_ROWS = 1000
+
+
+def archive_dir():
+    """
+    AUDIT_ARCHIVE_DIR, or None when archiving is off. Must be absolute,
+    so the archive doesn't move with the working directory.
+    """
+    path = settings.AUDIT_ARCHIVE_DIR
+    if not path:
+        return None
+
+    path = str(path)
+    if not os.path.isabs(path):
+        raise ImproperlyConfigured("AUDIT_ARCHIVE_DIR must be an absolute path")
+    return path
+
+
+def _archive_dir():
+    path = archive_dir()
+    if path is None:
+        raise ImproperlyConfigured("AUDIT_ARCHIVE_DIR is not set")
+    return path
+
+
+def _month_key(month):
+    return f"{month.year:04d}-{month.month:02d}"
+
+
+def _parse_month(key):
+    year, month = key.split("-")
+    return partitioning.month_start(datetime(int(year), int(month), 1))
+
+
+# ---------- Manifest ----------
+
+# (path, mtime_ns, size, manifest) of the last manifest read
+_manifest_cache = None
+
+
+def _read_manifest(path):
+    with open(path, encoding="utf-8") as fileobj:
+        return json.load(fileobj)
+
+
+def load_manifest():
+    """
+    The archive manifest, re-read only when the file changed since the
+    last call (it is replaced atomically, so a new mtime or size means a
+    new version). Shared between callers: treat it as read-only.
+    """
+    global _manifest_cache
+
+    directory = archive_dir()
+    if directory is None:
+        return {"segments": {}}
+
+    path = os.path.join(directory, "manifest.json")
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return {"segments": {}}
+
+    cached = _manifest_cache
+    if cached is not None and cached[:3] == (path, stat.st_mtime_ns, stat.st_size):
+        return cached[3]
+
+    manifest = _read_manifest(path)
+    _manifest_cache = (path, stat.st_mtime_ns, stat.st_size, manifest)
+    return manifest
+
+
+def _save_manifest(manifest):
+    path = os.path.join(_archive_dir(), "manifest.json")
+    tmp = f"{path}.tmp"
+
+    with open(tmp, "w", encoding="utf-8") as fileobj:
+        json.dump(manifest, fileobj, indent=2, sort_keys=True)
+        fileobj.flush()
+        os.fsync(fileobj.fileno())
+    os.replace(tmp, path)
+
+
+def company_segments(manifest, company_id):
+    """
+    [(month, segment)] for a company, newest first.
+    """
+    prefix = f"{company_id}/"
+    return sorted(
+        (
+            (_parse_month(key[len(prefix):]), segment)
+            for key, segment in manifest["segments"].items()
+            if key.startswith(prefix)
+        ),
+        key=lambda item: item[0],
+        reverse=True,
+    )
+
+
+def archive_boundary(company_id, manifest=None):
+    """
+    End of the company's newest archived month, or None.
+    """
+    segments = company_segments(manifest or load_manifest(), company_id)
+    if not segments:
+        return None
+    return partitioning.add_months(segments[0][0], 1)
+
+
+# ---------- Writing ----------
+
+def _archived_line(row, old_data, new_data):
+    return dumps({
+        "id": row.id,
+        "entity": row.entity,
+        "entity_id": row.entity_id,
+        "action": row.action,
+        "actor_id": row.actor_id,
+        "actor_username": row.actor.username if row.actor else None,
+        "old_data": old_data,
+        "new_data": new_data,
+        "created_at": row.created_at,
+    }) + b"\n"
+
+
+def _segment_lines(path):
+    """
+    Lines of an existing segment in file order, one gzip member at a
+    time, as ((created_at, id), created_at string, raw line).
+    """
+    with gzip.open(path, "rb") as fileobj:
+        for raw in fileobj:
+            line = json.loads(raw)
+            key = (parse_datetime(line["created_at"]), uuid.UUID(line["id"]))
+            yield key, line["created_at"], raw
+
+
+def _segment_blocks(path, segment):
+    """
+    [(offset, length, rows, first, last)] of a segment's blocks in file
+    order. Segments written before blocks were recorded are one block.
+    """
+    size = os.path.getsize(path)
+    blocks = segment.get("blocks") or [[0, segment["rows"], segment["first"], segment["last"]]]
+
+    return [
+        (offset, (blocks[index + 1][0] if index + 1 < len(blocks) else size) - offset, rows, first, last)
+        for index, (offset, rows, first, last) in enumerate(blocks)
+    ]
+
+
+def _read_block(path, offset, length):
+    with open(path, "rb") as fileobj:
+        fileobj.seek(offset)
+        data = gzip.decompress(fileobj.read(length))
+    return [json.loads(line) for line in data.splitlines()]
+
+
+def _write_segment(company_id, month):
+    """
+    Write the company's rows for `month` to its segment (merged with an
+    existing segment from an earlier, interrupted run). Returns the
+    segment entry and the ids written from the table.
+
+    Rows are streamed from the table in (created_at, id) order, merged
+    with the old segment's lines and written out a block at a time, so
+    only one chunk of rows and one block are held in memory.
+    """
+    relative = os.path.join(str(company_id), f"{_month_key(month)}.jsonl.gz")
+    path = os.path.join(_archive_dir(), relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    qs = (
+        AuditLog.objects
+        .select_related("actor")
+        .filter(
+            company_id=company_id,
+            created_at__gte=month,
+            created_at__lt=partitioning.add_months(month, 1),
+        )
+        .order_by("created_at", "id")
+    )
+
+    ids = []
+
+    def expand(chunk):
+        views = expand_audit_rows(chunk)
+        for row in chunk:
+            ids.append(row.id)
+            yield (
+                (row.created_at, row.id),
+                row.created_at.isoformat(),
+                _archived_line(row, *views[row.id]),
+            )
+
+    def table_lines():
+        chunk = []
+        for row in qs.iterator(chunk_size=_CHUNK):
+            chunk.append(row)
+            if len(chunk) == _CHUNK:
+                yield from expand(chunk)
+                chunk = []
+        yield from expand(chunk)
+
+    sources = [table_lines()]
+    if os.path.exists(path):
+        # Ties go to the old segment, so a row already in it is kept once
+        sources.insert(0, _segment_lines(path))
+
+    blocks = []
+    block = []
+    rows = 0
+    first = last = last_key = None
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as raw:
+        def flush():
+            blocks.append([raw.tell(), len(block), block[0][0], block[-1][0]])
+            raw.write(gzip.compress(b"".join(line for _, line in block)))
+            block.clear()
+
+        for key, created_at, line in heapq.merge(*sources, key=lambda item: item[0]):
+            if key == last_key:
+                continue
+            last_key = key
+
+            block.append((created_at, line))
+            rows += 1
+            first = first or created_at
+            last = created_at
+
+            if len(block) == _BLOCK_ROWS:
+                flush()
+        if block:
+            flush()
+
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+
+    return {
+        "path": relative,
+        "rows": rows,
+        "first": first,
+        "last": last,
+        "blocks": blocks,
+    }, ids
+
+
+def _promote_chain_heads(cutoff):
+    """
+    Store the first row at or after `cutoff` of every entity in full when
+    it is a delta, so the rows staying in the table can still be expanded
+    once the older ones are gone. Must run before anything is deleted.
+    """
+    earlier = AuditLog.objects.filter(
+        company_id=OuterRef("company_id"),
+        entity=OuterRef("entity"),
+        entity_id=OuterRef("entity_id"),
+        created_at__gte=cutoff,
+        created_at__lt=OuterRef("created_at"),
+    )
+    heads = (
+        AuditLog.objects
+        .filter(created_at__gte=cutoff, is_delta=True)
+        .exclude(Exists(earlier))
+        .order_by("id")
+    )
+
+    promoted = 0
+    while True:
+        chunk = list(heads[:_CHUNK])
+        if not chunk:
+            return promoted
+
+        views = expand_audit_rows(chunk)
+        for row in chunk:
+            row.old_data, row.new_data = views[row.id]
+            row.is_delta = False
+        AuditLog.objects.bulk_update(chunk, ["old_data", "new_data", "is_delta"])
+        promoted += len(chunk)
+
+
+def _delete_month(month, ids, archived_rows):
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == "postgresql" and partitioning.is_partitioned(cursor, TABLE):
+            name = partitioning.partition_name(TABLE, month)
+            if (month, name) in partitioning.month_partitions(cursor, TABLE):
+                cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(name)}")
+                # Nothing arrived since the segments were written
+                if cursor.fetchone()[0] == archived_rows:
+                    partitioning.drop_month_partition(cursor, TABLE, month)
+                    return
+
+        for offset in range(0, len(ids), _CHUNK):
+            AuditLog.objects.filter(id__in=ids[offset: offset + _CHUNK]).delete()
+
+
+def archive_months(*, hot_months, on_segment=None):
+    """
+    Archive every month that ended more than `hot_months` months ago and
+    remove its rows from AuditLog. Returns the number of rows archived.
+    """
+    os.makedirs(_archive_dir(), exist_ok=True)
+
+    cutoff = partitioning.add_months(partitioning.month_start(now()), -hot_months)
+    oldest = AuditLog.objects.filter(created_at__lt=cutoff).order_by("created_at").first()
+    if oldest is None:
+        return 0
+
+    _promote_chain_heads(cutoff)
+
+    path = os.path.join(_archive_dir(), "manifest.json")
+    manifest = _read_manifest(path) if os.path.exists(path) else {"segments": {}}
+    total = 0
+    month = partitioning.month_start(oldest.created_at)
+
+    while month < cutoff:
+        next_month = partitioning.add_months(month, 1)
+        companies = list(
+            AuditLog.objects
+            .filter(created_at__gte=month, created_at__lt=next_month)
+            .order_by()
+            .values_list("company_id", flat=True)
+            .distinct()
+        )
+
+        month_ids = []
+        archived_rows = 0
+        for company_id in companies:
+            segment, ids = _write_segment(company_id, month)
+            manifest["segments"][f"{company_id}/{_month_key(month)}"] = segment
+            month_ids += ids
+            archived_rows += len(ids)
+            if on_segment:
+                on_segment(company_id, month, segment)
+
+        # The manifest must list the segments before their rows go
+        _save_manifest(manifest)
+        _delete_month(month, month_ids, archived_rows)
+        for company_id in companies:
+            invalidate_counter(AUDIT_COUNTER, company_id)
+
+        total += archived_rows
+        month = next_month
+
+    return total
+
+
+# ---------- Reading ----------
+
+class ArchivedAuditRows:
+    """
+    Archived rows of one company in [start, end), newest first, as unsaved
+    AuditLog instances. Supports count(), slicing and after(), so it can
+    follow a queryset in api.utils.paginate_with_tail.
+
+    Rows are read block by block (see the module docstring): blocks wholly
+    inside [start, end) are counted and skipped from the manifest, and
+    only the blocks a page draws rows from are decompressed.
+    """
+
+    def __init__(self, company_id, *, start=None, end=None, manifest=None):
+        self.start = start
+        self.end = end
+        self.segments = [
+            (month, segment)
+            for month, segment in company_segments(manifest or load_manifest(), company_id)
+            if (end is None or month < end)
+            and (start is None or partitioning.add_months(month, 1) > start)
+        ]
+
+    def _blocks(self):
+        """
+        (path, offset, length, rows, first, last, covered) for every block
+        that can hold rows in range, newest first; `covered` blocks lie
+        wholly inside it.
+        """
+        for _, segment in self.segments:
+            path = os.path.join(_archive_dir(), segment["path"])
+            for offset, length, rows, first, last in reversed(_segment_blocks(path, segment)):
+                if not rows:
+                    continue
+                first, last = parse_datetime(first), parse_datetime(last)
+                if (self.start is not None and last < self.start) or (
+                    self.end is not None and first >= self.end
+                ):
+                    continue
+                covered = (self.start is None or first >= self.start) and (
+                    self.end is None or last < self.end
+                )
+                yield path, offset, length, rows, first, last, covered
+
+    def _lines(self, path, offset, length):
+        lines = _read_block(path, offset, length)
+        lines.reverse()
+
+        for line in lines:
+            created_at = parse_datetime(line["created_at"])
+            if self.start is not None and created_at < self.start:
+                continue
+            if self.end is not None and created_at >= self.end:
+                continue
+            yield line
+
+    def count(self):
+        total = 0
+        for path, offset, length, rows, _, _, covered in self._blocks():
+            if covered:
+                total += rows
+            else:
+                total += sum(1 for _ in self._lines(path, offset, length))
+        return total
+
+    def __getitem__(self, window):
+        start, stop = window.start or 0, window.stop
+        rows = []
+        skipped = 0
+
+        for path, offset, length, block_rows, _, _, covered in self._blocks():
+            if stop is not None and start + len(rows) >= stop:
+                break
+
+            # Whole blocks before the window are skipped from the manifest
+            if covered and skipped + block_rows <= start:
+                skipped += block_rows
+                continue
+
+            for line in self._lines(path, offset, length):
+                if skipped < start:
+                    skipped += 1
+                    continue
+                if stop is not None and start + len(rows) >= stop:
+                    break
+                rows.append(_to_audit_log(line))
+
+        return rows
+
+    def after(self, values, count):
+        """
+        Up to `count` rows after cursor values [created_at, id] in
+        (-created_at, -id) order; from the newest row when None.
+        """
+        if values is not None:
+            cursor = (parse_datetime(values[0]), uuid.UUID(values[1]))
+
+        rows = []
+        for path, offset, length, _, first, _, _ in self._blocks():
+            # Blocks entirely after the cursor are skipped unread
+            if values is not None and first > cursor[0]:
+                continue
+
+            for line in self._lines(path, offset, length):
+                if values is not None:
+                    if (parse_datetime(line["created_at"]), uuid.UUID(line["id"])) >= cursor:
+                        continue
+                rows.append(_to_audit_log(line))
+                if len(rows) == count:
+                    return rows
+
+        return rows
+
+
+def _to_audit_log(line):
+    actor = None
+    if line["actor_id"] is not None:
+        actor = User(id=line["actor_id"], username=line["actor_username"])
+
+    return AuditLog(
+        id=uuid.UUID(line["id"]),
+        entity=line["entity"],
+        entity_id=line["entity_id"],
+        action=line["action"],
+        actor=actor,
+        old_data=line["old_data"],
+        new_data=line["new_data"],
+        is_delta=False,
+        created_at=parse_datetime(line["created_at"]),
+    )
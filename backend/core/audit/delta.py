@@ -0,0 +1,142 @@
+"""
+Delta-encoded audit payloads.
+
+In diff mode (AUDIT_LOG_DIFF, or AuditLogger.log(diff=True)) an update
+stores only the fields that changed: old_data holds their previous values,
+new_data the new ones, and the row is flagged is_delta. Full views are
+rebuilt by replaying the entity's rows in (created_at, id) order from the
+nearest full row (a keyframe): each full row's new_data becomes the
+running state and each delta is applied on top of it.
+
+Fields that never change are only known from a keyframe, so an entity whose
+history starts with a delta shows just the fields seen so far.
+compact_audit_log rewrites existing rows into this form, losslessly, and
+keeps every Nth row of an entity in full so replays stay short.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import AuditLog
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def diff_payload(old, new):
+    """
+    (old, new) reduced to the keys whose value differs, or None when every
+    key changed (a delta would not be any smaller).
+    """
+    keys = list(old) + [key for key in new if key not in old]
+    changed = [
+        key for key in keys
+        if key not in old or key not in new or old[key] != new[key]
+    ]
+    if len(changed) == len(keys):
+        return None
+
+    return (
+        {key: old.get(key) for key in changed},
+        {key: new.get(key) for key in changed},
+    )
+
+
+def apply_row(state, *, is_delta, old_data, new_data):
+    """
+    Replay one row on top of `state`; returns (before, after, next state).
+    """
+    if not is_delta:
+        return old_data, new_data, dict(new_data or {})
+
+    after = {**state, **new_data}
+    return {**state, **old_data}, after, after
+
+
+def expand_audit_rows(rows):
+    """
+    Full (old_data, new_data) for each AuditLog in `rows`, keyed by id.
+    Rows stored in full come back as stored. The history behind the delta
+    rows is read in one query: per entity, from its last keyframe up to
+    its newest requested row.
+    """
+    views = {}
+    spans = {}
+
+    for row in rows:
+        if not row.is_delta:
+            views[row.id] = (row.old_data, row.new_data)
+            continue
+
+        key = (row.company_id, row.entity, row.entity_id)
+        first, last = spans.get(key, (row.created_at, row.created_at))
+        spans[key] = (min(first, row.created_at), max(last, row.created_at))
+
+    if not spans:
+        return views
+
+    windows = Q()
+    for (company_id, entity, entity_id), (first, last) in spans.items():
+        entity_rows = Q(company_id=company_id, entity=entity, entity_id=entity_id)
+        keyframe = (
+            AuditLog.objects
+            .filter(entity_rows, is_delta=False, created_at__lte=first)
+            .order_by("-created_at")
+            .values("created_at")[:1]
+        )
+        windows |= entity_rows & Q(
+            created_at__lte=last,
+            created_at__gte=Coalesce(Subquery(keyframe), Value(_EPOCH)),
+        )
+
+    wanted = {row.id for row in rows if row.is_delta}
+    current, state = None, {}
+
+    for company_id, entity, entity_id, row_id, is_delta, old_data, new_data in (
+        AuditLog.objects
+        .filter(windows)
+        .order_by("company_id", "entity", "entity_id", "created_at", "id")
+        .values_list("company_id", "entity", "entity_id", "id", "is_delta", "old_data", "new_data")
+    ):
+        if (company_id, entity, entity_id) != current:
+            current, state = (company_id, entity, entity_id), {}
+
+        before, after, state = apply_row(
+            state, is_delta=is_delta, old_data=old_data, new_data=new_data
+        )
+        if row_id in wanted:
+            views[row_id] = (before, after)
+
+    return views
+
+
+def compact_history(rows, *, keyframe_every=50):
+    """
+    Walk one entity's rows (AuditLog instances in (created_at, id) order)
+    and yield the ones whose stored form should change: every
+    `keyframe_every`-th row in full, the others as deltas where that is
+    smaller and replays back to exactly the same views.
+    """
+    state = {}
+
+    for index, row in enumerate(rows):
+        before, after, _ = apply_row(
+            state, is_delta=row.is_delta, old_data=row.old_data, new_data=row.new_data
+        )
+        target = (False, before, after)
+
+        if index % keyframe_every and isinstance(before, dict) and isinstance(after, dict):
+            diff = diff_payload(before, after)
+            if diff is not None:
+                replayed = apply_row(state, is_delta=True, old_data=diff[0], new_data=diff[1])
+                if replayed[:2] == (before, after):
+                    target = (True, *diff)
+
+        state = apply_row(
+            state, is_delta=target[0], old_data=target[1], new_data=target[2]
+        )[2]
+
+        if target != (row.is_delta, row.old_data, row.new_data):
+            row.is_delta, row.old_data, row.new_data = target
+            yield row
@@ -1,9 +1,18 @@
-from .models import AuditLog
+from .delta import diff_payload
+from .models import AuditLog, AuditOutbox
 from .enums import AuditAction
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
+from core.counting import bump_counter
+from core.fastjson import to_jsonable
 
+import collections
+import sys
+import threading
 import uuid
 import datetime
+from contextlib import ContextDecorator
 from decimal import Decimal
 
 def _json_safe(value):
@@ -29,6 +38,141 @@ def make_json_safe(data):
     return _json_safe(data)
 
 
+# Cached row counter (core.counting) of each company's AuditLog rows
+AUDIT_COUNTER = "audit_log"
+
+_local = threading.local()
+
+
+def count_inserted(rows):
+    for company_id, amount in collections.Counter(row.company_id for row in rows).items():
+        bump_counter(AUDIT_COUNTER, company_id, amount)
+
+
+def _frames():
+    if not hasattr(_local, "frames"):
+        _local.frames = []
+    return _local.frames
+
+
+class _AtomicAudit(ContextDecorator):
+    """
+    See atomic_audit(). Keeps no state of its own, so one instance can
+    decorate a function that re-enters itself.
+    """
+    def __enter__(self):
+        atomic = transaction.atomic()
+        atomic.__enter__()
+        _frames().append((atomic, [], {}))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        frames = _frames()
+        atomic, entries, deferred = frames.pop()
+
+        if exc_type is None:
+            try:
+                if frames:
+                    # The enclosing block writes them, or drops them on rollback
+                    frames[-1][1].extend(entries)
+                    for func, keys in deferred.items():
+                        frames[-1][2].setdefault(func, set()).update(keys)
+                else:
+                    if entries:
+                        AuditLog.objects.bulk_create(entries)
+                        count_inserted(entries)
+                    for func, keys in deferred.items():
+                        func(keys)
+            except BaseException:
+                atomic.__exit__(*sys.exc_info())
+                raise
+
+        return atomic.__exit__(exc_type, exc_value, traceback)
+
+
+def atomic_audit(func=None):
+    """
+    transaction.atomic() that also collects the audit rows logged inside
+    it. The outermost block inserts them with one bulk_create just before
+    it commits, in the same transaction, so they are durable exactly when
+    the changes they describe are. A nested block hands its rows to the
+    enclosing one, or drops them when it rolls back.
+
+    Usable as a decorator or a context manager, like transaction.atomic.
+    Rows logged in a plain transaction.atomic() block nested inside are
+    collected too, so blocks that may roll back while the caller carries
+    on should use atomic_audit() themselves.
+    """
+    if callable(func):
+        return _AtomicAudit()(func)
+    return _AtomicAudit()
+
+
+def before_commit(func, keys):
+    """
+    Call func(keys) as the last statement of the outermost atomic_audit()
+    block, with the keys of every before_commit(func, ...) made inside it
+    merged into one set; straight away outside one. Nested blocks hand
+    their keys on or drop them like audit rows.
+
+    For writes that lock rows shared by many transactions (counters): the
+    lock is taken once, after every other lock of the transaction, and
+    only held until the commit.
+    """
+    frames = _frames()
+    if frames:
+        frames[-1][2].setdefault(func, set()).update(keys)
+    else:
+        func(set(keys))
+
+
+def _event(row):
+    return {
+        "entity": row.entity,
+        "entity_id": row.entity_id,
+        "action": row.action,
+        "actor_id": row.actor_id,
+        "company_id": str(row.company_id),
+        "old_data": row.old_data,
+        "new_data": row.new_data,
+        "is_delta": row.is_delta,
+        "created_at": row.created_at.isoformat(),
+    }
+
+
+def _row(*, entity, entity_id, action, actor, company, old_data=None, new_data=None, diff=None):
+    old_data = to_jsonable(old_data)
+    new_data = to_jsonable(new_data)
+
+    is_delta = False
+    if settings.AUDIT_LOG_DIFF if diff is None else diff:
+        if isinstance(old_data, dict) and isinstance(new_data, dict):
+            changed = diff_payload(old_data, new_data)
+            if changed is not None:
+                old_data, new_data = changed
+                is_delta = True
+
+    return AuditLog(
+        entity=entity,
+        entity_id=str(entity_id),
+        action=action,
+        actor=actor,
+        company=company,
+        old_data=old_data,
+        new_data=new_data,
+        is_delta=is_delta,
+    )
+
+
+def _write(rows, eager):
+    if not eager and settings.AUDIT_LOG_OUTBOX:
+        AuditOutbox.objects.create(events=[_event(row) for row in rows])
+    elif not eager and _frames():
+        _frames()[-1][1].extend(rows)
+    else:
+        AuditLog.objects.bulk_create(rows)
+        count_inserted(rows)
+
+
 class AuditLogger:
     @staticmethod
     def log(
@@ -40,13 +184,36 @@ class AuditLogger:
         company,
         old_data=None,
         new_data=None,
+        eager=False,
+        diff=None,
     ):
-        AuditLog.objects.create(
+        """
+        Inside atomic_audit() the row is collected and inserted together
+        with every other row of that transaction just before it commits; a
+        rollback drops it. Elsewhere, or with eager=True, it is inserted
+        straight away, in the caller's transaction if there is one. With
+        AUDIT_LOG_OUTBOX on, the event goes to the outbox instead (see
+        core.audit.outbox) unless eager=True.
+
+        With diff=True (default: AUDIT_LOG_DIFF) an update that has both
+        payloads stores only the fields that changed; see core.audit.delta
+        for reading it back in full.
+        """
+        _write([_row(
             entity=entity,
-            entity_id=str(entity_id),
+            entity_id=entity_id,
             action=action,
             actor=actor,
             company=company,
-            old_data=make_json_safe(old_data),
-            new_data=make_json_safe(new_data),
-        )
\ No newline at end of file
+            old_data=old_data,
+            new_data=new_data,
+            diff=diff,
+        )], eager)
+
+    @staticmethod
+    def bulk_log(entries, eager=False, diff=None):
+        """
+        Log many audit rows at once. Each entry takes the same keyword
+        arguments as log(); collecting and diffing work the same way.
+        """
+        _write([_row(**e, diff=diff) for e in entries], eager)
@@ -1,6 +1,7 @@
 from django.conf import settings
 import uuid
 from django.db import models
+from django.utils import timezone
 
 from company.models import Company
 
@@ -17,6 +18,9 @@ class AuditLog(models.Model):
     old_data = models.JSONField(null=True, blank=True)
     new_data = models.JSONField(null=True, blank=True)
 
+    # old_data/new_data hold only the changed fields (see core.audit.delta)
+    is_delta = models.BooleanField(default=False)
+
     actor = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         null=True,
@@ -25,10 +29,24 @@ class AuditLog(models.Model):
         related_name="audit_logs",
     )
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the logger; rows drained from the outbox keep their original time
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         indexes = [
             models.Index(fields=["entity", "entity_id"]),
             models.Index(fields=["created_at"]),
+            # audit_list keyset pages: company, then (-created_at, -id)
+            models.Index(fields=["company", "-created_at", "-id"], name="auditlog_company_keyset_idx"),
         ]
+
+
+class AuditOutbox(models.Model):
+    """
+    Audit events written in the caller's transaction when AUDIT_LOG_OUTBOX
+    is on; drain_audit_outbox turns them into AuditLog rows and hands them
+    to the configured sinks. One row per log()/bulk_log() call.
+    """
+    id = models.BigAutoField(primary_key=True)
+    events = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
@@ -0,0 +1,123 @@
+"""
+Draining of the audit outbox (AUDIT_LOG_OUTBOX).
+
+AuditLogger writes a compact event list to AuditOutbox inside the caller's
+transaction, so a request only pays for that one insert. drain_outbox(),
+run in a loop by the drain_audit_outbox command, claims a batch with
+SELECT ... FOR UPDATE SKIP LOCKED (several workers can run side by side),
+writes the AuditLog rows, passes the events to every sink and deletes the
+batch, all in one transaction. A sink that raises rolls the batch back and
+it is retried, so sinks see events at least once.
+"""
+import json
+import urllib.request
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from .logger import count_inserted
+from .models import AuditLog, AuditOutbox
+
+
+class JSONLSink:
+    """
+    Appends one JSON line per event to a local file.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, events):
+        with open(self.path, "a", encoding="utf-8") as fileobj:
+            for event in events:
+                fileobj.write(json.dumps(event) + "\n")
+
+
+class WebhookSink:
+    """
+    POSTs each batch as {"events": [...]}; any non-2xx answer raises.
+    """
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, events):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"events": events}).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+def load_sinks():
+    return [
+        import_string(sink["class"])(**sink.get("options", {}))
+        for sink in settings.AUDIT_OUTBOX_SINKS
+    ]
+
+
+def drain_outbox(*, batch_size=500, sinks=()):
+    """
+    Move up to `batch_size` outbox rows into AuditLog and the sinks.
+    Returns the number of events drained (0 when the outbox is empty).
+    """
+    with transaction.atomic():
+        rows = list(
+            AuditOutbox.objects
+            .select_for_update(skip_locked=True)
+            .order_by("id")[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        events = [event for row in rows for event in row.events]
+
+        # The actor may have been deleted since the event was queued
+        actors = set(
+            User.objects
+            .filter(id__in={e["actor_id"] for e in events if e["actor_id"]})
+            .values_list("id", flat=True)
+        )
+
+        logs = AuditLog.objects.bulk_create([
+            AuditLog(
+                entity=e["entity"],
+                entity_id=e["entity_id"],
+                action=e["action"],
+                actor_id=e["actor_id"] if e["actor_id"] in actors else None,
+                company_id=e["company_id"],
+                old_data=e["old_data"],
+                new_data=e["new_data"],
+                is_delta=e.get("is_delta", False),
+                created_at=parse_datetime(e["created_at"]),
+            )
+            for e in events
+        ])
+        count_inserted(logs)
+
+        for sink in sinks:
+            sink.send(events)
+
+        AuditOutbox.objects.filter(id__in=[row.id for row in rows]).delete()
+
+    return len(events)
+
+
+def outbox_stats():
+    """
+    Backpressure metrics: rows waiting and the age of the oldest one.
+    """
+    stats = AuditOutbox.objects.aggregate(depth=Count("id"), oldest=Min("created_at"))
+    oldest = stats["oldest"]
+
+    return {
+        "depth": stats["depth"],
+        "lag_seconds": (now() - oldest).total_seconds() if oldest else 0.0,
+    }
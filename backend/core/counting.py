@@ -0,0 +1,110 @@
+"""
+Row counts for paginated list totals.
+
+count_rows() counts a queryset with one of three strategies:
+
+    "exact"     SELECT COUNT(*), always.
+    "estimate"  the planner's row estimate from EXPLAIN (PostgreSQL only;
+                other databases count exactly).
+    "cached"    a per-company counter kept in the cache, bumped when rows
+                are inserted and dropped when rows are deleted. Only
+                usable for the unfiltered listing the counter tracks;
+                other querysets fall back to "estimate".
+
+Below LIST_COUNT_EXACT_THRESHOLD rows every strategy counts exactly, so
+small companies always see exact totals. count_rows() returns
+(total, exact) so responses can say which one they got.
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+
+STRATEGIES = ("exact", "estimate", "cached")
+
+
+def _threshold():
+    return settings.LIST_COUNT_EXACT_THRESHOLD
+
+
+def counter_key(name, company_id):
+    return f"rowcount:{name}:{company_id}"
+
+
+def planner_estimate(qs):
+    """
+    The planner's estimate of the number of rows in `qs`, or None when the
+    database can't tell (anything but PostgreSQL).
+    """
+    connection = connections[qs.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    sql, params = qs.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def _exact(qs, counter):
+    total = qs.count()
+    if counter is not None:
+        cache.set(counter_key(*counter), total, settings.LIST_COUNT_CACHE_TIMEOUT)
+    return total, True
+
+
+def count_rows(qs, *, strategy="exact", counter=None):
+    """
+    (total, exact) for `qs`. `counter` is a (name, company_id) pair naming
+    the cached counter that tracks `qs`, when it tracks it exactly.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown count strategy: {strategy!r}")
+
+    if strategy == "cached" and counter is None:
+        strategy = "estimate"
+
+    if strategy == "estimate":
+        estimate = planner_estimate(qs)
+        if estimate is None or estimate < _threshold():
+            return qs.count(), True
+        return estimate, False
+
+    if strategy == "cached":
+        cached = cache.get(counter_key(*counter))
+        # A miss (expired, invalidated or never counted) recounts and reseeds
+        if cached is None or cached < _threshold():
+            return _exact(qs, counter)
+        return cached, False
+
+    return qs.count(), True
+
+
+def bump_counter(name, company_id, amount=1):
+    """
+    Add `amount` inserted rows to a counter once the transaction commits.
+    A counter that isn't cached is left alone; the next count seeds it.
+    """
+    def bump():
+        try:
+            cache.incr(counter_key(name, company_id), amount)
+        except ValueError:
+            pass
+
+    transaction.on_commit(bump)
+
+
+def invalidate_counter(name, company_id):
+    """
+    Drop a counter after rows were deleted; the next count reseeds it.
+    """
+    key = counter_key(name, company_id)
+    cache.delete(key)
+    # Also after commit, in case a count reseeded it in between
+    transaction.on_commit(lambda: cache.delete(key))
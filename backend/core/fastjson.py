@@ -0,0 +1,103 @@
+"""
+JSON encoding used for audit payloads and API responses.
+
+Two backends with the same behaviour: "orjson" (when installed) and
+"stdlib". Both handle UUID, datetime, date and Decimal (as a float, like
+make_json_safe and DRF's encoder); anything else falls back to DRF's
+encoder (lazy strings, querysets, timedeltas, ...). FAST_JSON_BACKEND
+picks one: "auto" (default) uses orjson when it can be imported.
+"""
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+_drf_encoder = JSONEncoder()
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return _drf_encoder.default(value)
+
+
+class _AuditEncoder(json.JSONEncoder):
+    # The stdlib counterpart of _default; datetimes keep isoformat() as-is
+    def default(self, value):
+        if isinstance(value, Decimal):
+            return float(value)
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        return _drf_encoder.default(value)
+
+
+class StdlibBackend:
+    name = "stdlib"
+
+    def dumps(self, data):
+        return json.dumps(
+            data, cls=_AuditEncoder, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    name = "orjson"
+
+    # OPT_UTC_Z matches DRF, which renders UTC datetimes with a "Z" suffix
+    RESPONSE_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z if orjson else 0
+
+    def dumps(self, data):
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps_response(self, data):
+        return orjson.dumps(data, default=_default, option=self.RESPONSE_OPTIONS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+
+    if _backend is None:
+        name = getattr(settings, "FAST_JSON_BACKEND", "auto")
+        if name == "orjson" and orjson is None:
+            raise ImportError("FAST_JSON_BACKEND is 'orjson' but orjson is not installed")
+        if name == "stdlib" or orjson is None:
+            _backend = StdlibBackend()
+        else:
+            _backend = OrjsonBackend()
+
+    return _backend
+
+
+def dumps(data):
+    return get_backend().dumps(data)
+
+
+def loads(data):
+    return get_backend().loads(data)
+
+
+def to_jsonable(data):
+    """
+    `data` with UUIDs, dates and Decimals turned into JSON types, ready for
+    a JSONField. One encode/decode pass in C with orjson instead of walking
+    the structure in Python.
+    """
+    if data is None:
+        return None
+    return loads(dumps(data))
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import partitioning
+from core.audit.archive import TABLE, archive_dir, archive_months
+
+
+class Command(BaseCommand):
+    help = (
+        "Move audit rows older than the hot window into gzip JSONL segments "
+        "(one per company and month) under AUDIT_ARCHIVE_DIR, and on "
+        "PostgreSQL keep the monthly partitions of the audit table in place"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hot-months",
+            type=int,
+            default=settings.AUDIT_HOT_MONTHS,
+            help="Whole months kept in the table besides the current one",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Create partitions this many months past the current one (PostgreSQL)",
+        )
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Convert the audit table to a partitioned table first (locks it during the copy)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if archive_dir() is None:
+                raise CommandError("AUDIT_ARCHIVE_DIR is not set")
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        if connection.vendor == "postgresql":
+            if options["convert"] and partitioning.convert_to_partitioned(
+                TABLE, months_ahead=options["months_ahead"]
+            ):
+                self.stdout.write("Audit table converted to monthly partitions")
+
+            with connection.cursor() as cursor:
+                partitioned = partitioning.is_partitioned(cursor, TABLE)
+            if partitioned:
+                for name in partitioning.ensure_partitions(TABLE, months_ahead=options["months_ahead"]):
+                    self.stdout.write(f"Created {name}")
+
+        def report(company_id, month, segment):
+            self.stdout.write(f"{company_id} {month:%Y-%m}: {segment['rows']} rows -> {segment['path']}")
+
+        total = archive_months(hot_months=options["hot_months"], on_segment=report)
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} audit rows"))
+
+
+# Usage (schedule daily)
+# python manage.py archive_audit_log --hot-months 6 --months-ahead 3
@@ -0,0 +1,118 @@
+import json
+import random
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+from rest_framework.renderers import JSONRenderer
+
+from core.audit.logger import make_json_safe
+from core.fastjson import StdlibBackend, get_backend, to_jsonable
+from core.renderers import FastJSONRenderer
+
+
+def _audit_list_payload(rows):
+    # Shape of api.views.audit_list for stock movements
+    start = now()
+    items = []
+    for i in range(rows):
+        quantity = random.randint(0, 500)
+        snapshot = {"product": uuid4(), "warehouse": uuid4(), "quantity": quantity, "version": i}
+        items.append({
+            "id": uuid4(),
+            "time": (start - timedelta(seconds=i)).isoformat(),
+            "entity": "inventory_stock",
+            "entity_id": str(uuid4()),
+            "action": "UPDATE",
+            "actor": {"id": str(random.randint(1, 50)), "username": f"user{i % 50}"},
+            "old_data": {**snapshot, "quantity": quantity + 1, "version": i - 1},
+            "new_data": snapshot,
+            "delta": False,
+        })
+    return {"items": items, "meta": {"limit": rows, "offset": 0, "total": rows * 10, "has_next": True, "has_prev": False}}
+
+
+def _po_list_payload(rows, lines=5):
+    # Shape of api.views.po_list: raw UUIDs, datetimes and Decimals
+    start = now()
+    return [
+        {
+            "id": uuid4(),
+            "warehouse_name": "Main warehouse",
+            "supplier_name": f"Supplier {i % 20}",
+            "status": "APPROVED",
+            "created_at": start - timedelta(hours=i),
+            "items": [
+                {
+                    "product_id": uuid4(),
+                    "product_name": f"Product {j}",
+                    "unit": "pcs",
+                    "quantity": random.randint(1, 100),
+                    "rate": Decimal(f"{random.randint(1, 9999)}.50"),
+                    "amount": Decimal(f"{random.randint(1, 99999)}.00"),
+                }
+                for j in range(lines)
+            ],
+            "grn_exists": True,
+            "grn": {
+                "id": uuid4(),
+                "status": "ACCEPTED",
+                "received_by": "storekeeper",
+                "created_at": start - timedelta(hours=i, minutes=30),
+                "items": [{"product_name": f"Product {j}", "quantity": 10} for j in range(lines)],
+            },
+        }
+        for i in range(rows)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the stdlib and fast (core.fastjson) JSON paths on payloads "
+        "shaped like audit_list and po_list responses and on audit snapshots."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200, help="Items per payload")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--number", type=int, default=20, help="Calls per timing run")
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        self.stdout.write(f"Fast backend: {backend.name}")
+        if isinstance(backend, StdlibBackend):
+            self.stdout.write(self.style.WARNING("orjson is not installed; both paths are stdlib"))
+
+        audit_list = _audit_list_payload(options["rows"])
+        po_list = _po_list_payload(options["rows"])
+        snapshots = [(item["old_data"], item["new_data"]) for item in audit_list["items"]]
+
+        drf, fast = JSONRenderer(), FastJSONRenderer()
+
+        cases = [
+            (
+                "audit payloads (per row)",
+                lambda: [(json.dumps(make_json_safe(o)), json.dumps(make_json_safe(n))) for o, n in snapshots],
+                lambda: [(json.dumps(to_jsonable(o)), json.dumps(to_jsonable(n))) for o, n in snapshots],
+            ),
+            ("audit_list response", lambda: drf.render(audit_list), lambda: fast.render(audit_list)),
+            ("po_list response", lambda: drf.render(po_list), lambda: fast.render(po_list)),
+        ]
+
+        for name, baseline, candidate in cases:
+            timings = []
+            for fn in (baseline, candidate):
+                best = min(timeit.repeat(fn, repeat=options["repeat"], number=options["number"]))
+                timings.append(best / options["number"] * 1000)
+
+            self.stdout.write(
+                f"{name:<26} stdlib {timings[0]:8.3f} ms   fast {timings[1]:8.3f} ms   "
+                f"{timings[0] / timings[1]:5.1f}x"
+            )
+
+
+# Usage
+# python manage.py benchmark_json --rows 200
@@ -0,0 +1,90 @@
+import json
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+
+from core.audit.delta import compact_history
+from core.audit.models import AuditLog
+
+
+def _payload_size(row):
+    return len(json.dumps(row.old_data)) + len(json.dumps(row.new_data))
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite audit rows as deltas holding only the changed fields "
+        "(see core.audit.delta), keeping every Nth row of an entity in full. "
+        "Rows are only rewritten when the change is lossless."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows updated per statement",
+        )
+        parser.add_argument(
+            "--keyframe-every",
+            type=int,
+            default=50,
+            help="Keep every Nth row of an entity in full",
+        )
+        parser.add_argument("--entity", help="Only this entity type, e.g. inventory_stock")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        qs = (
+            AuditLog.objects
+            .order_by("company_id", "entity", "entity_id", "created_at", "id")
+            .only("id", "company_id", "entity", "entity_id", "created_at", "is_delta", "old_data", "new_data")
+        )
+        if options["entity"]:
+            qs = qs.filter(entity=options["entity"])
+
+        stats = {"scanned": 0, "rewritten": 0, "before": 0, "after": 0, "last": 0}
+        batch = []
+
+        def flush():
+            if batch and not options["dry_run"]:
+                AuditLog.objects.bulk_update(batch, ["is_delta", "old_data", "new_data"])
+            batch.clear()
+
+        def measured(history):
+            for row in history:
+                stats["last"] = _payload_size(row)
+                stats["scanned"] += 1
+                stats["before"] += stats["last"]
+                stats["after"] += stats["last"]
+                yield row
+
+        # Histories are streamed, so one busy entity does not have to fit
+        # in memory. compact_history yields a row before reading the next,
+        # so stats["last"] is still that row's original size.
+        rows = qs.iterator(chunk_size=options["batch_size"])
+        for _, history in groupby(rows, key=lambda r: (r.company_id, r.entity, r.entity_id)):
+            for row in compact_history(measured(history), keyframe_every=options["keyframe_every"]):
+                stats["after"] += _payload_size(row) - stats["last"]
+                stats["rewritten"] += 1
+
+                batch.append(row)
+                if len(batch) >= options["batch_size"]:
+                    flush()
+                    self.stdout.write(f"{stats['scanned']} rows scanned, {stats['rewritten']} rewritten")
+
+        flush()
+
+        ratio = stats["before"] / stats["after"] if stats["after"] else 1
+        self.stdout.write(
+            f"Payload size {stats['before'] / 1024:.1f} KiB -> {stats['after'] / 1024:.1f} KiB ({ratio:.1f}x)"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would rewrite' if options['dry_run'] else 'Rewrote'} "
+            f"{stats['rewritten']} of {stats['scanned']} audit rows"
+        ))
+
+
+# Usage
+# python manage.py compact_audit_log --dry-run
+# python manage.py compact_audit_log --entity inventory_stock --keyframe-every 50
@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.audit.outbox import drain_outbox, load_sinks, outbox_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Write queued audit events (AUDIT_LOG_OUTBOX) to AuditLog and the "
+        "configured sinks. Runs until stopped unless --once is given; "
+        "several workers can drain side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Outbox rows claimed per transaction",
+        )
+        parser.add_argument(
+            "--idle-sleep",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the outbox is empty or a batch failed",
+        )
+        parser.add_argument(
+            "--stats-every",
+            type=float,
+            default=30.0,
+            help="Seconds between queue depth / lag reports",
+        )
+        parser.add_argument("--once", action="store_true", help="Stop when the outbox is empty")
+        parser.add_argument("--stats", action="store_true", help="Print queue depth and lag, then exit")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self._report(0)
+            return
+
+        sinks = load_sinks()
+        total = 0
+        next_report = time.monotonic() + options["stats_every"]
+
+        while True:
+            close_old_connections()
+
+            try:
+                drained = drain_outbox(batch_size=options["batch_size"], sinks=sinks)
+            except Exception as exc:
+                self.stderr.write(f"Batch failed, will retry: {exc}")
+                drained = 0
+                time.sleep(options["idle_sleep"])
+
+            total += drained
+
+            if time.monotonic() >= next_report:
+                self._report(total)
+                next_report = time.monotonic() + options["stats_every"]
+
+            if not drained:
+                if options["once"]:
+                    break
+                time.sleep(options["idle_sleep"])
+
+        self._report(total)
+        self.stdout.write(self.style.SUCCESS(f"Drained {total} audit events"))
+
+    def _report(self, total):
+        stats = outbox_stats()
+        self.stdout.write(
+            f"Outbox depth={stats['depth']} lag={stats['lag_seconds']:.1f}s drained={total}"
+        )
+
+
+# Usage (long-running worker; enable AUDIT_LOG_OUTBOX=True in the app)
+# AUDIT_OUTBOX_JSONL_PATH=/var/log/audit.jsonl python manage.py drain_audit_outbox --batch-size 500
+# python manage.py drain_audit_outbox --stats
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_auditoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='is_delta',
+            field=models.BooleanField(default=False),
+        ),
+    ]
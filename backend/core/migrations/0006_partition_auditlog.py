@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 21:20
+
+from django.db import migrations
+
+
+def partition_auditlog(apps, schema_editor):
+    # Monthly range partitions are a PostgreSQL feature; other backends
+    # keep the plain table. Large installations can run
+    # `archive_audit_log --convert` in a maintenance window first.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    from core import partitioning
+
+    partitioning.convert_to_partitioned(apps.get_model("core", "AuditLog")._meta.db_table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_auditlog_is_delta'),
+    ]
+
+    operations = [
+        # The partitioned table keeps every column and index, so the model
+        # state is unchanged and reversing leaves it partitioned.
+        migrations.RunPython(partition_auditlog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-18 21:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0007_alter_warehouse_location'),
+        ('core', '0006_partition_auditlog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['company', '-created_at', '-id'], name='auditlog_company_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,298 @@
+"""
+Monthly range partitioning of a table on its created_at column
+(PostgreSQL only).
+
+The parent table keeps its name, so the ORM is unaffected. Partitions are
+named <table>_yYYYYmMM and cover [first of month, first of next month) in
+UTC; a <table>_default partition catches rows outside the created months
+(backdated imports) until a month partition is created for them.
+"""
+import gzip
+import os
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def default_partition(table):
+    return f"{table}_default"
+
+
+def _bounds(month):
+    return (
+        f"'{month.isoformat()}'",
+        f"'{add_months(month, 1).isoformat()}'",
+    )
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+    row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def month_partitions(cursor, table):
+    """
+    Attached month partitions as [(month, name)], oldest first.
+    """
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+        """,
+        [table],
+    )
+
+    pattern = re.compile(rf"^{re.escape(table)}_y(\d{{4}})m(\d{{2}})$")
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = pattern.match(name)
+        if match:
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)
+            partitions.append((month, name))
+
+    return sorted(partitions)
+
+
+def _create_month_partition(cursor, table, month):
+    """
+    Create and attach the partition for `month`. Rows for that month that
+    landed in the default partition are moved into it first, otherwise
+    ATTACH would fail on the overlap.
+    """
+    name = partition_name(table, month)
+    low, high = _bounds(month)
+
+    cursor.execute(
+        f"CREATE TABLE {_qn(name)} (LIKE {_qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    )
+    cursor.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM {_qn(default_partition(table))}
+            WHERE created_at >= {low} AND created_at < {high}
+            RETURNING *
+        )
+        INSERT INTO {_qn(name)} SELECT * FROM moved
+        """
+    )
+    cursor.execute(
+        f"ALTER TABLE {_qn(table)} ATTACH PARTITION {_qn(name)} FOR VALUES FROM ({low}) TO ({high})"
+    )
+
+
+@transaction.atomic
+def ensure_partitions(table, *, months_ahead=3, start=None):
+    """
+    Make sure a partition exists for every month from `start` (default:
+    the current month) through `months_ahead` months from now. Returns
+    the names of the partitions created.
+    """
+    created = []
+
+    with connection.cursor() as cursor:
+        existing = {month for month, _ in month_partitions(cursor, table)}
+
+        month = month_start(start or now())
+        last = add_months(month_start(now()), months_ahead)
+
+        while month <= last:
+            if month not in existing:
+                _create_month_partition(cursor, table, month)
+                created.append(partition_name(table, month))
+            month = add_months(month, 1)
+
+    return created
+
+
+@transaction.atomic
+def convert_to_partitioned(table, *, months_ahead=3):
+    """
+    Rebuild `table` as a partitioned table: create the new parent with
+    the same columns, month partitions covering the existing rows, copy
+    the rows, drop the old table and recreate its indexes and foreign keys
+    on the new parent. The primary key becomes (id, created_at), since a
+    partitioned table's unique constraints must include the partition key.
+
+    Holds an ACCESS EXCLUSIVE lock on the table for the whole copy, so
+    large tables should be converted in a maintenance window. No-op when
+    the table is already partitioned.
+    """
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor, table):
+            return False
+
+        new_table = f"{table}_partitioned"
+
+        cursor.execute(f"LOCK TABLE {_qn(table)} IN ACCESS EXCLUSIVE MODE")
+
+        cursor.execute(
+            """
+            SELECT indexdef FROM pg_indexes
+            WHERE tablename = %s
+              AND indexname NOT IN (
+                  SELECT conname FROM pg_constraint
+                  WHERE conrelid = %s::regclass AND contype IN ('p', 'u')
+              )
+            """,
+            [table, table],
+        )
+        index_defs = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(f"SELECT MIN(created_at) FROM {_qn(table)}")
+        oldest = cursor.fetchone()[0] or now()
+
+        cursor.execute(
+            f"""
+            CREATE TABLE {_qn(new_table)}
+            (LIKE {_qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (created_at)
+            """
+        )
+        cursor.execute(f"ALTER TABLE {_qn(new_table)} ADD PRIMARY KEY (id, created_at)")
+        cursor.execute(
+            f"CREATE TABLE {_qn(default_partition(table))} PARTITION OF {_qn(new_table)} DEFAULT"
+        )
+
+        month = month_start(oldest)
+        last = add_months(month_start(now()), months_ahead)
+        while month <= last:
+            low, high = _bounds(month)
+            cursor.execute(
+                f"""
+                CREATE TABLE {_qn(partition_name(table, month))} PARTITION OF {_qn(new_table)}
+                FOR VALUES FROM ({low}) TO ({high})
+                """
+            )
+            month = add_months(month, 1)
+
+        cursor.execute(f"INSERT INTO {_qn(new_table)} SELECT * FROM {_qn(table)}")
+
+        cursor.execute(f"DROP TABLE {_qn(table)}")
+        cursor.execute(f"ALTER TABLE {_qn(new_table)} RENAME TO {_qn(table)}")
+        cursor.execute(
+            f"ALTER TABLE {_qn(table)} RENAME CONSTRAINT {_qn(new_table + '_pkey')} TO {_qn(table + '_pkey')}"
+        )
+
+        # Dropping the old table freed its index/constraint names
+        for index_def in index_defs:
+            cursor.execute(index_def)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {_qn(table)} ADD CONSTRAINT {_qn(name)} {definition}")
+
+    return True
+
+
+def drop_month_partition(cursor, table, month):
+    """
+    Detach and drop the partition for `month`, if attached.
+    """
+    name = partition_name(table, month)
+    if (month, name) not in month_partitions(cursor, table):
+        return False
+
+    cursor.execute(f"ALTER TABLE {_qn(table)} DETACH PARTITION {_qn(name)}")
+    cursor.execute(f"DROP TABLE {_qn(name)}")
+    return True
+
+
+def archive_cutoff(retention_months):
+    """
+    Start of the oldest month kept when `retention_months` are retained.
+    """
+    return add_months(month_start(now()), -retention_months)
+
+
+def expired_partitions(cursor, table, cutoff):
+    """
+    Attached month partitions that end at or before `cutoff`, oldest first.
+    """
+    return [
+        (month, name) for month, name in month_partitions(cursor, table)
+        if add_months(month, 1) <= cutoff
+    ]
+
+
+def archive_partitions(table, *, cutoff, archive_dir, lock_timeout="5s"):
+    """
+    Dump every month partition that ends at or before `cutoff` (see
+    archive_cutoff) to <archive_dir>/<partition>.csv.gz, then detach and
+    drop it. Returns [(partition, archive path, row count)].
+
+    Each partition is its own transaction. The export runs while the
+    partition is still attached, under a SHARE lock on that partition
+    only: reads carry on and only writes backdated into that month wait.
+    The parent's ACCESS EXCLUSIVE lock is taken last, for DETACH and
+    DROP, once the file is durable. If that lock isn't granted within
+    `lock_timeout`, the transaction rolls back and the partition stays
+    attached for the next run. A failed dump also leaves it attached.
+    """
+    archived = []
+
+    os.makedirs(archive_dir, exist_ok=True)
+
+    with connection.cursor() as cursor:
+        expired = expired_partitions(cursor, table, cutoff)
+
+    for month, name in expired:
+        path = os.path.join(archive_dir, f"{name}.csv.gz")
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {_qn(name)} IN SHARE MODE")
+            cursor.execute(f"SELECT COUNT(*) FROM {_qn(name)}")
+            rows = cursor.fetchone()[0]
+
+            # The file must be durable before the partition is dropped
+            with open(path, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as fileobj:
+                    _copy_out(cursor, f"COPY {_qn(name)} TO STDOUT WITH (FORMAT csv, HEADER)", fileobj)
+                raw.flush()
+                os.fsync(raw.fileno())
+
+            cursor.execute("SELECT set_config('lock_timeout', %s, true)", [lock_timeout])
+            cursor.execute(f"ALTER TABLE {_qn(table)} DETACH PARTITION {_qn(name)}")
+            cursor.execute(f"DROP TABLE {_qn(name)}")
+
+        archived.append((name, path, rows))
+
+    return archived
+
+
+def _copy_out(cursor, sql, fileobj):
+    if hasattr(cursor, "copy_expert"):  # psycopg2
+        cursor.copy_expert(sql, fileobj)
+    else:  # psycopg 3
+        with cursor.copy(sql) as copy:
+            for data in copy:
+                fileobj.write(data)
@@ -0,0 +1,27 @@
+from rest_framework.renderers import JSONRenderer
+
+from core.fastjson import get_backend
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding through core.fastjson (orjson when available).
+    Indented or ASCII-only output still goes through DRF's own encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        backend = get_backend()
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+
+        if indent is not None or self.ensure_ascii or not hasattr(backend, "dumps_response"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = backend.dumps_response(data)
+
+        # Same escaping as JSONRenderer, so the output stays a JavaScript subset
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
@@ -1,3 +1,507 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from company.models import Company
+from core.audit import archive
+from core.audit.archive import ArchivedAuditRows, archive_dir, archive_months, load_manifest
+from core.audit.delta import compact_history, expand_audit_rows
+from core.audit.enums import AuditAction
+from core.audit.logger import AUDIT_COUNTER, AuditLogger, atomic_audit, before_commit
+from core.audit.models import AuditLog, AuditOutbox
+from core.audit.outbox import JSONLSink, drain_outbox, outbox_stats
+from core.counting import bump_counter, count_rows, counter_key, invalidate_counter
+from core.fastjson import OrjsonBackend, StdlibBackend, orjson
+from core.renderers import FastJSONRenderer
+from rbac.models import Role
+
+
+class AuditTestCase(TestCase):
+    def setUp(self):
+        Role.objects.get_or_create(name="Viewer")  # new users get this role
+
+        self.user = User.objects.create_user(username="owner", password="x")
+        self.company = Company.objects.create(name="Acme", created_by=self.user)
+
+    def _log(self, entity_id, **kwargs):
+        AuditLogger.log(
+            entity="product",
+            entity_id=entity_id,
+            action=AuditAction.UPDATE,
+            actor=self.user,
+            company=self.company,
+            new_data={"name": f"Product {entity_id}"},
+            **kwargs,
+        )
+
+    def _logged(self):
+        return sorted(AuditLog.objects.values_list("entity_id", flat=True))
+
+
+class AtomicAuditTests(AuditTestCase):
+    def test_commit_writes_one_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with atomic_audit():
+                for entity_id in range(3):
+                    self._log(entity_id)
+                self.assertFalse(AuditLog.objects.exists())
+
+        self.assertEqual(self._logged(), ["0", "1", "2"])
+        inserts = [
+            q["sql"] for q in ctx.captured_queries
+            if q["sql"].startswith("INSERT") and AuditLog._meta.db_table in q["sql"]
+        ]
+        self.assertEqual(len(inserts), 1)
+
+    def test_rollback_drops_rows(self):
+        with self.assertRaises(ValueError):
+            with atomic_audit():
+                self._log(1)
+                raise ValueError("boom")
+
+        self.assertEqual(self._logged(), [])
+
+        # Nothing left over for the next transaction
+        with atomic_audit():
+            self._log(2)
+        self.assertEqual(self._logged(), ["2"])
+
+    def test_nested_rollback_drops_only_its_rows(self):
+        with atomic_audit():
+            self._log(1)
+            try:
+                with atomic_audit():
+                    self._log(2)
+                    raise ValueError("boom")
+            except ValueError:
+                pass
+            with atomic_audit():
+                self._log(3)
+
+        self.assertEqual(self._logged(), ["1", "3"])
+
+    def test_decorator(self):
+        @atomic_audit
+        def update(entity_id):
+            self._log(entity_id)
+
+        update(1)
+
+        self.assertEqual(self._logged(), ["1"])
+
+    def test_before_commit_runs_once_with_every_key(self):
+        calls = []
+
+        with atomic_audit():
+            before_commit(calls.append, [1])
+            with atomic_audit():
+                before_commit(calls.append, [2])
+            try:
+                with atomic_audit():
+                    before_commit(calls.append, [3])
+                    raise ValueError("boom")
+            except ValueError:
+                pass
+            before_commit(calls.append, [1])
+            self.assertEqual(calls, [])
+
+        self.assertEqual(calls, [{1, 2}])
+
+        # Outside atomic_audit() it runs straight away
+        before_commit(calls.append, [4])
+        self.assertEqual(calls, [{1, 2}, {4}])
+
+    def test_eager_and_unbuffered_rows_are_written_at_once(self):
+        self._log(1)
+        self.assertEqual(self._logged(), ["1"])
+
+        with atomic_audit():
+            self._log(2, eager=True)
+            self.assertEqual(self._logged(), ["1", "2"])
+
+
+class ExpandAuditRowsTests(AuditTestCase):
+    def _history(self, entity_id, *payloads):
+        """
+        A keyframe with the first payload, then one delta row per later
+        payload (only the changed keys), an hour apart.
+        """
+        start = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        rows = [AuditLog(
+            entity="product",
+            entity_id=entity_id,
+            action=AuditAction.CREATE,
+            company=self.company,
+            new_data=payloads[0],
+            created_at=start,
+        )]
+        for index, (before, after) in enumerate(zip(payloads, payloads[1:]), start=1):
+            changed = [key for key in after if before.get(key) != after[key]]
+            rows.append(AuditLog(
+                entity="product",
+                entity_id=entity_id,
+                action=AuditAction.UPDATE,
+                company=self.company,
+                old_data={key: before.get(key) for key in changed},
+                new_data={key: after[key] for key in changed},
+                is_delta=True,
+                created_at=start + timedelta(hours=index),
+            ))
+        return AuditLog.objects.bulk_create(rows)
+
+    def test_deltas_expand_to_full_payloads(self):
+        rows = self._history(
+            "1",
+            {"name": "Bolt", "price": 1},
+            {"name": "Bolt", "price": 2},
+            {"name": "Bolt M8", "price": 2},
+        )
+
+        views = expand_audit_rows(rows)
+
+        self.assertEqual(views[rows[0].id], (None, {"name": "Bolt", "price": 1}))
+        self.assertEqual(
+            views[rows[2].id],
+            ({"name": "Bolt", "price": 2}, {"name": "Bolt M8", "price": 2}),
+        )
+
+    def test_one_query_for_every_entity(self):
+        rows = []
+        for entity_id in ("1", "2", "3"):
+            rows += self._history(entity_id, {"name": "a", "price": 1}, {"name": "a", "price": 2})
+        deltas = [row for row in rows if row.is_delta]
+
+        with self.assertNumQueries(1):
+            views = expand_audit_rows(deltas)
+
+        self.assertEqual(len(views), 3)
+        for row in deltas:
+            self.assertEqual(views[row.id], ({"name": "a", "price": 1}, {"name": "a", "price": 2}))
+
+    def test_compaction_is_lossless(self):
+        start = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        payloads = [{"name": "Bolt", "price": price, "unit": "pcs"} for price in range(1, 6)]
+        rows = AuditLog.objects.bulk_create([
+            AuditLog(
+                entity="product",
+                entity_id="1",
+                action=AuditAction.UPDATE,
+                company=self.company,
+                old_data=before,
+                new_data=after,
+                created_at=start + timedelta(hours=index),
+            )
+            for index, (before, after) in enumerate(zip(payloads, payloads[1:]))
+        ])
+        full = expand_audit_rows(rows)
+
+        rewritten = list(compact_history(rows, keyframe_every=3))
+        AuditLog.objects.bulk_update(rewritten, ["is_delta", "old_data", "new_data"])
+
+        stored = list(AuditLog.objects.order_by("created_at"))
+        self.assertEqual([row.is_delta for row in stored], [False, True, True, False])
+        self.assertEqual(stored[1].new_data, {"price": 3})
+        self.assertEqual(expand_audit_rows(stored), full)
+
+
+@override_settings(AUDIT_LOG_OUTBOX=True)
+class AuditOutboxTests(AuditTestCase):
+    class RecordingSink:
+        def __init__(self, fail=False):
+            self.events = []
+            self.fail = fail
+
+        def send(self, events):
+            if self.fail:
+                raise ConnectionError("sink down")
+            self.events += events
+
+    def test_events_wait_in_the_outbox(self):
+        self._log(1)
+        AuditLogger.bulk_log([
+            {
+                "entity": "product",
+                "entity_id": 2,
+                "action": AuditAction.CREATE,
+                "actor": self.user,
+                "company": self.company,
+                "new_data": {"name": "Product 2"},
+            },
+        ])
+
+        self.assertEqual(AuditOutbox.objects.count(), 2)
+        self.assertEqual(self._logged(), [])
+        self.assertEqual(outbox_stats()["depth"], 2)
+
+    def test_drain_moves_events_to_log_and_sinks(self):
+        self._log(1)
+        self._log(2)
+        sink = self.RecordingSink()
+
+        self.assertEqual(drain_outbox(sinks=[sink]), 2)
+
+        self.assertEqual(self._logged(), ["1", "2"])
+        self.assertEqual([event["entity_id"] for event in sink.events], ["1", "2"])
+        self.assertFalse(AuditOutbox.objects.exists())
+        self.assertEqual(drain_outbox(sinks=[sink]), 0)
+
+    def test_failing_sink_keeps_the_batch(self):
+        self._log(1)
+
+        with self.assertRaises(ConnectionError):
+            drain_outbox(sinks=[self.RecordingSink(fail=True)])
+
+        self.assertEqual(AuditOutbox.objects.count(), 1)
+        self.assertEqual(self._logged(), [])
+
+    def test_jsonl_sink(self):
+        self._log(1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "audit.jsonl")
+            drain_outbox(sinks=[JSONLSink(path)])
+
+            with open(path, encoding="utf-8") as fileobj:
+                events = [json.loads(line) for line in fileobj]
+
+        self.assertEqual([(e["entity"], e["entity_id"]) for e in events], [("product", "1")])
+
+
+class FastJSONTests(TestCase):
+    DATA = {
+        "id": uuid.UUID("6f1c0c6e-3b1d-4d2e-9a4e-0d0b6b8e2f10"),
+        "at": datetime(2025, 3, 1, 12, 30, tzinfo=dt_timezone.utc),
+        "day": date(2025, 3, 1),
+        "price": Decimal("12.50"),
+        "name": "Bolt \u2028 M8 – zinc",
+        "items": [1, None, True],
+    }
+
+    def _backends(self):
+        backends = [StdlibBackend()]
+        if orjson is not None:
+            backends.append(OrjsonBackend())
+        return backends
+
+    def test_backends_agree_on_audit_payloads(self):
+        for backend in self._backends():
+            with self.subTest(backend=backend.name):
+                self.assertEqual(backend.loads(backend.dumps(self.DATA)), {
+                    "id": "6f1c0c6e-3b1d-4d2e-9a4e-0d0b6b8e2f10",
+                    "at": "2025-03-01T12:30:00+00:00",
+                    "day": "2025-03-01",
+                    "price": 12.5,
+                    "name": "Bolt \u2028 M8 – zinc",
+                    "items": [1, None, True],
+                })
+
+    @skipUnless(orjson is not None, "orjson is not installed")
+    def test_renderer_matches_drf(self):
+        expected = JSONRenderer().render(self.DATA)
+
+        with mock.patch("core.renderers.get_backend", return_value=OrjsonBackend()):
+            rendered = FastJSONRenderer().render(self.DATA)
+
+        self.assertEqual(rendered, expected)
+
+    def test_renderer_falls_back_for_indented_output(self):
+        expected = JSONRenderer().render(self.DATA, "application/json; indent=2")
+
+        self.assertEqual(
+            FastJSONRenderer().render(self.DATA, "application/json; indent=2"), expected
+        )
+
+
+class AuditArchiveTests(AuditTestCase):
+    def setUp(self):
+        super().setUp()
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(AUDIT_ARCHIVE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        # Small blocks, so a segment spans several
+        patcher = mock.patch.object(archive, "_BLOCK_ROWS", 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        self.old = AuditLog.objects.bulk_create([
+            AuditLog(
+                entity="product",
+                entity_id=str(index),
+                action=AuditAction.UPDATE,
+                actor=self.user,
+                company=self.company,
+                new_data={"index": index},
+                created_at=start + timedelta(days=index * 5),
+            )
+            for index in range(10)  # January and February 2025
+        ])
+        self._log("recent")
+
+    def _newest_first(self):
+        return [str(row.id) for row in sorted(self.old, key=lambda row: row.created_at, reverse=True)]
+
+    def test_round_trip(self):
+        self.assertEqual(archive_months(hot_months=6), 10)
+
+        self.assertEqual(self._logged(), ["recent"])
+        segments = load_manifest()["segments"]
+        self.assertEqual(sorted(segment["rows"] for segment in segments.values()), [3, 7])
+        self.assertEqual(
+            [len(segment["blocks"]) for _, segment in sorted(segments.items())], [3, 1]
+        )
+
+        rows = ArchivedAuditRows(self.company.id)
+        self.assertEqual(rows.count(), 10)
+        self.assertEqual([str(row.id) for row in rows[0:10]], self._newest_first())
+        self.assertEqual(rows[0:10][0].new_data, {"index": 9})
+        self.assertEqual(rows[0:10][0].actor.username, "owner")
+
+        page = rows.after(None, 4)
+        rest = rows.after([page[-1].created_at.isoformat(), str(page[-1].id)], 10)
+        self.assertEqual([str(row.id) for row in page + rest], self._newest_first())
+
+    def test_rerun_merges_with_an_interrupted_segment(self):
+        # A run that wrote January's segment but died before the manifest
+        archive._write_segment(self.company.id, datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+
+        with mock.patch.object(archive, "_CHUNK", 2):
+            self.assertEqual(archive_months(hot_months=6), 10)
+
+        segments = load_manifest()["segments"]
+        self.assertEqual(sorted(segment["rows"] for segment in segments.values()), [3, 7])
+        rows = ArchivedAuditRows(self.company.id)
+        self.assertEqual([str(row.id) for row in rows[0:20]], self._newest_first())
+
+    def test_page_reads_only_its_blocks(self):
+        archive_months(hot_months=6)
+        rows = ArchivedAuditRows(self.company.id)
+
+        with mock.patch.object(archive, "_read_block", wraps=archive._read_block) as read:
+            page = rows[4:6]
+
+        # February's 3 rows and January's newest block are skipped unread
+        self.assertEqual([str(row.id) for row in page], self._newest_first()[4:6])
+        self.assertEqual(read.call_count, 1)
+
+    def test_date_range_counts(self):
+        archive_months(hot_months=6)
+
+        rows = ArchivedAuditRows(
+            self.company.id,
+            start=datetime(2025, 1, 10, tzinfo=dt_timezone.utc),
+            end=datetime(2025, 2, 1, tzinfo=dt_timezone.utc),
+        )
+
+        # Jan 11, 16, 21, 26 and 31
+        self.assertEqual(rows.count(), 5)
+        self.assertEqual(len(rows[0:10]), 5)
+
+    def test_manifest_is_cached_until_it_changes(self):
+        archive_months(hot_months=6)
+
+        with mock.patch.object(archive, "_read_manifest", wraps=archive._read_manifest) as read:
+            first = load_manifest()
+            self.assertIs(load_manifest(), first)
+            self.assertEqual(read.call_count, 1)
+
+            path = os.path.join(archive_dir(), "manifest.json")
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+            load_manifest()
+            self.assertEqual(read.call_count, 2)
+
+    def test_archive_dir_setting(self):
+        with override_settings(AUDIT_ARCHIVE_DIR=None):
+            self.assertIsNone(archive_dir())
+            self.assertEqual(load_manifest(), {"segments": {}})
+
+        with override_settings(AUDIT_ARCHIVE_DIR="relative/archive"):
+            with self.assertRaises(ImproperlyConfigured):
+                archive_dir()
+
+
+@override_settings(LIST_COUNT_EXACT_THRESHOLD=2)
+class CountRowsTests(AuditTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        self.qs = AuditLog.objects.filter(company=self.company)
+        self.counter = (AUDIT_COUNTER, self.company.id)
+
+    def _seed(self, count):
+        for entity_id in range(count):
+            self._log(entity_id)
+
+    def test_exact(self):
+        self._seed(3)
+
+        self.assertEqual(count_rows(self.qs), (3, True))
+
+    def test_estimate_counts_exactly_without_a_planner(self):
+        self._seed(3)
+
+        with mock.patch("core.counting.planner_estimate", return_value=None):
+            self.assertEqual(count_rows(self.qs, strategy="estimate"), (3, True))
+        with mock.patch("core.counting.planner_estimate", return_value=1000):
+            self.assertEqual(count_rows(self.qs, strategy="estimate"), (1000, False))
+        # Small estimates are recounted
+        with mock.patch("core.counting.planner_estimate", return_value=1):
+            self.assertEqual(count_rows(self.qs, strategy="estimate"), (3, True))
+
+    def test_cached_counter_is_seeded_then_served(self):
+        self._seed(3)
+
+        self.assertEqual(count_rows(self.qs, strategy="cached", counter=self.counter), (3, True))
+        self.assertEqual(cache.get(counter_key(*self.counter)), 3)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                count_rows(self.qs, strategy="cached", counter=self.counter), (3, False)
+            )
+
+    def test_counter_follows_inserts_and_deletes(self):
+        self._seed(3)
+        count_rows(self.qs, strategy="cached", counter=self.counter)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._log("new")
+        self.assertEqual(cache.get(counter_key(*self.counter)), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_counter(*self.counter)
+        self.assertIsNone(cache.get(counter_key(*self.counter)))
+
+        # A counter nobody seeded stays unseeded
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_counter(AUDIT_COUNTER, self.company.id)
+        self.assertIsNone(cache.get(counter_key(*self.counter)))
+
+    def test_cached_without_counter_estimates(self):
+        self._seed(3)
+
+        with mock.patch("core.counting.planner_estimate", return_value=500) as estimate:
+            self.assertEqual(count_rows(self.qs, strategy="cached"), (500, False))
+        estimate.assert_called_once()
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            count_rows(self.qs, strategy="guess")
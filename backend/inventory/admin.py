@@ -5,14 +5,15 @@ from inventory.models import (
     InventoryOrder,
     InventoryOrderItem,
     InventoryIssue,
+    StockReservation,
 )
 
 @admin.register(InventoryStock)
 class InventoryStockAdmin(admin.ModelAdmin):
-    list_display = ("product", "warehouse", "quantity", "version")
+    list_display = ("product", "warehouse", "quantity", "reserved", "version")
     search_fields = ("product__name", "warehouse__name")
     list_filter = ("warehouse",)
-    readonly_fields = ("version",)
+    readonly_fields = ("reserved", "version")
 
 @admin.register(InventoryLedger)
 class InventoryLedgerAdmin(admin.ModelAdmin):
@@ -118,3 +119,20 @@ class InventoryIssueAdmin(admin.ModelAdmin):
             "fields": ("requested_by", "approved_by", "created_at"),
         }),
     )
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = (
+        "product",
+        "warehouse",
+        "quantity",
+        "status",
+        "reference_type",
+        "expires_at",
+    )
+    list_filter = ("status", "warehouse")
+    search_fields = ("product__name", "reference_id")
+    readonly_fields = [f.name for f in StockReservation._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class InventoryConfig(AppConfig):
     name = 'inventory'
+
+    def ready(self):
+        from django.conf import settings
+
+        if settings.INVENTORY_GROUP_COMMIT:
+            from inventory.group_commit import install_shutdown_hooks
+
+            install_shutdown_hooks()
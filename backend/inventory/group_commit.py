@@ -0,0 +1,390 @@
+import atexit
+import os
+import queue
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from uuid import UUID, uuid4
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from core.audit.enums import AuditAction
+from core.audit.logger import AuditLogger
+from inventory.models import InventoryStock, InventoryLedger, StockCostLayer, Product, Warehouse
+from inventory.services import (
+    _lock_stock_rows,
+    _stock_snapshot,
+    consume_cost_layers_bulk,
+    record_daily_balances,
+    stock_in_service,
+    stock_out_service,
+)
+
+
+class _Movement:
+    __slots__ = (
+        "actor", "product_id", "warehouse_id", "change", "reason",
+        "reference_type", "reference_id", "future",
+    )
+
+    def __init__(self, *, actor, product_id, warehouse_id, change, reason, reference_type, reference_id):
+        try:
+            self.product_id = str(UUID(str(product_id)))
+            self.warehouse_id = str(UUID(str(warehouse_id)))
+        except ValueError:
+            raise ValueError("Invalid product or warehouse")
+
+        self.actor = actor
+        self.change = change
+        self.reason = reason
+        self.reference_type = reference_type
+        self.reference_id = reference_id or uuid4()
+        self.future = Future()
+
+
+class GroupCommitWriter:
+    """
+    Single writer thread that drains queued stock movements and commits
+    everything that arrived within `max_wait` seconds (up to `max_batch`
+    movements) as one transaction: one ordered lock on the stock rows,
+    one bulk UPDATE of the net quantities, and bulk inserts of the
+    individual ledger, daily balance, cost layer and audit rows.
+
+    Each movement is still validated on its own, in arrival order, so an
+    outbound line that would go negative fails alone without sinking the
+    rest of the batch. Callers block on a Future that resolves once their
+    batch has committed.
+
+    stop() closes the writer to new movements, commits everything already
+    queued and joins the thread; it runs at interpreter exit and on
+    SIGTERM (install_shutdown_hooks), so a recycled worker doesn't drop
+    the movements its callers are waiting on.
+    """
+
+    def __init__(self, *, max_batch=200, max_wait=0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def submit(self, movement):
+        """
+        Queue `movement`; returns its Future, or None once the writer is
+        shutting down (the caller then takes the per-request path).
+        """
+        with self._lock:
+            if self._closed:
+                return None
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="inventory-group-commit", daemon=True
+                )
+                self._thread.start()
+
+            self._queue.put(movement)
+
+        return movement.future
+
+    def stop(self):
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            if thread is not None and thread.is_alive():
+                # Nothing can be queued behind this, so every caller is answered
+                self._queue.put(None)
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                batch = self._collect()
+                if batch is None:
+                    return
+
+                close_old_connections()
+                try:
+                    self._commit(batch)
+                except Exception as exc:
+                    for movement in batch:
+                        if not movement.future.done():
+                            movement.future.set_exception(exc)
+        finally:
+            connection.close()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                movement = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if movement is None:
+                # Finish this batch, then exit on the next _collect()
+                self._queue.put(None)
+                break
+            batch.append(movement)
+
+        return batch
+
+    def _commit(self, batch):
+        results = []
+
+        with transaction.atomic():
+            products = {
+                str(p.id): p
+                for p in Product.objects.filter(id__in={m.product_id for m in batch})
+            }
+            warehouses = {
+                str(w.id): w
+                for w in Warehouse.objects.select_related("company").filter(
+                    id__in={m.warehouse_id for m in batch}
+                )
+            }
+
+            accepted = []
+            for movement in batch:
+                if movement.product_id not in products or movement.warehouse_id not in warehouses:
+                    movement.future.set_exception(ValueError("Invalid product or warehouse"))
+                else:
+                    accepted.append(movement)
+
+            if not accepted:
+                return
+
+            # Inbound movements may be the first for their product/warehouse
+            InventoryStock.objects.bulk_create(
+                [
+                    InventoryStock(product_id=m.product_id, warehouse_id=m.warehouse_id, quantity=0)
+                    for m in accepted
+                    if m.change > 0
+                ],
+                ignore_conflicts=True,
+            )
+            stocks = {
+                (str(p), str(w)): s
+                for (p, w), s in _lock_stock_rows(
+                    {(m.product_id, m.warehouse_id) for m in accepted}
+                ).items()
+            }
+
+            touched = {}
+            ledgers = []
+            layers = []
+            audits = []
+            demands = Counter()
+
+            for movement in accepted:
+                key = (movement.product_id, movement.warehouse_id)
+                stock = stocks.get(key)
+
+                if stock is None or stock.quantity - stock.reserved + movement.change < 0:
+                    movement.future.set_exception(ValueError("Insufficient stock"))
+                    continue
+
+                product = products[movement.product_id]
+                warehouse = warehouses[movement.warehouse_id]
+
+                touched[key] = stock
+                old_stock = _stock_snapshot(stock)
+                stock.quantity += movement.change
+                stock.version += 1
+
+                ledger = InventoryLedger(
+                    product=product,
+                    warehouse=warehouse,
+                    change=movement.change,
+                    balance_after=stock.quantity,
+                    reference_type=movement.reference_type,
+                    reference_id=movement.reference_id,
+                    reason=movement.reason,
+                    created_by=movement.actor,
+                )
+                ledgers.append(ledger)
+
+                if movement.change > 0:
+                    layers.append(StockCostLayer(
+                        product=product,
+                        warehouse=warehouse,
+                        quantity_received=movement.change,
+                        quantity_remaining=movement.change,
+                        unit_cost=product.cost_price,
+                        reference_type=movement.reference_type,
+                        reference_id=movement.reference_id,
+                    ))
+                else:
+                    demands[(stock.product_id, stock.warehouse_id)] -= movement.change
+
+                new_stock = _stock_snapshot(stock)
+                audits.append({
+                    "entity": "inventory_stock",
+                    "entity_id": stock.id,
+                    "action": AuditAction.UPDATE,
+                    "actor": movement.actor,
+                    "company": warehouse.company,
+                    "old_data": old_stock,
+                    "new_data": new_stock,
+                })
+                results.append((movement, new_stock, ledger))
+
+            if not results:
+                return
+
+            InventoryStock.objects.bulk_update(touched.values(), ["quantity", "version"])
+            InventoryLedger.objects.bulk_create(ledgers)
+            record_daily_balances(ledgers)
+            StockCostLayer.objects.bulk_create(layers)
+            if demands:
+                consume_cost_layers_bulk(demands)
+            AuditLogger.bulk_log(audits)
+
+        for movement, new_stock, ledger in results:
+            movement.future.set_result((new_stock, ledger))
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_hooks_installed = False
+
+
+def get_writer():
+    global _writer
+
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = GroupCommitWriter(
+                    max_batch=getattr(settings, "INVENTORY_GROUP_COMMIT_MAX_BATCH", 200),
+                    max_wait=getattr(settings, "INVENTORY_GROUP_COMMIT_MAX_WAIT_MS", 5) / 1000,
+                )
+                atexit.register(_writer.stop)
+
+    return _writer
+
+
+def stop_writer():
+    if _writer is not None:
+        _writer.stop()
+
+
+def install_shutdown_hooks():
+    """
+    Drain the writer on SIGTERM, then hand the signal to whatever handler
+    was installed before (the server's graceful shutdown, or the default
+    exit). Signal handlers can only be set from the main thread, so this
+    runs from InventoryConfig.ready(); elsewhere only the atexit hook
+    registered by get_writer() applies.
+    """
+    global _hooks_installed
+
+    if _hooks_installed or threading.current_thread() is not threading.main_thread():
+        return
+    _hooks_installed = True
+
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def on_sigterm(signum, frame):
+        stop_writer()
+
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+
+def _submit(*, actor, product_id, warehouse_id, change, reason, reference_type, reference_id, fallback):
+    # A caller already inside a transaction can't wait on another
+    # connection's commit (it may hold locks the writer needs), so it
+    # keeps the per-request path and joins its own transaction.
+    if connection.in_atomic_block:
+        return fallback()
+
+    future = get_writer().submit(_Movement(
+        actor=actor,
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        change=change,
+        reason=reason,
+        reference_type=reference_type,
+        reference_id=reference_id,
+    ))
+    if future is None:
+        return fallback()
+
+    return future.result()
+
+
+def group_stock_in(*, actor, product_id, warehouse_id, quantity, reason=None, reference_type="STOCK_IN", reference_id=None):
+    """
+    stock_in_service through the group-commit writer. Blocks until the
+    batch holding this movement has committed; returns (stock, ledger)
+    where stock is the audit snapshot of the row after the movement.
+    """
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
+
+    return _submit(
+        actor=actor,
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        change=quantity,
+        reason=reason,
+        reference_type=reference_type,
+        reference_id=reference_id,
+        fallback=lambda: stock_in_service(
+            actor=actor,
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            quantity=quantity,
+            reason=reason,
+            reference_type=reference_type,
+            reference_id=reference_id,
+        ),
+    )
+
+
+def group_stock_out(*, actor, product_id, warehouse_id, quantity, reason=None, reference_type="STOCK_OUT", reference_id=None):
+    """
+    stock_out_service through the group-commit writer. Raises
+    ValueError("Insufficient stock") for this movement only.
+    """
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
+
+    return _submit(
+        actor=actor,
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        change=-quantity,
+        reason=reason,
+        reference_type=reference_type,
+        reference_id=reference_id,
+        fallback=lambda: stock_out_service(
+            actor=actor,
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            quantity=quantity,
+            reason=reason,
+            reference_type=reference_type,
+            reference_id=reference_id,
+        ),
+    )
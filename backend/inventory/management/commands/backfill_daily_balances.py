@@ -0,0 +1,103 @@
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from inventory.models import InventoryStock, InventoryLedger, InventoryDailyBalance
+from inventory.services import balance_date
+
+
+class Command(BaseCommand):
+    help = "Rebuild InventoryDailyBalance from the existing InventoryLedger (archived months are kept)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of stock rows rebuilt per transaction",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        last_id = None
+        total_rows = 0
+        total_stocks = 0
+
+        while True:
+            qs = InventoryStock.objects.order_by("id")
+            if last_id is not None:
+                qs = qs.filter(id__gt=last_id)
+
+            stock_ids = list(qs.values_list("id", flat=True)[:chunk_size])
+            if not stock_ids:
+                break
+
+            total_rows += self._rebuild_chunk(stock_ids)
+            total_stocks += len(stock_ids)
+            last_id = stock_ids[-1]
+
+            self.stdout.write(f"{total_stocks} stock rows, {total_rows} daily balances")
+
+        self.stdout.write(self.style.SUCCESS("Daily balances backfilled successfully"))
+
+    @transaction.atomic
+    def _rebuild_chunk(self, stock_ids):
+        # Same lock the stock services take, so live movements wait for the chunk
+        keys = set(
+            InventoryStock.objects
+            .select_for_update()
+            .filter(id__in=stock_ids)
+            .order_by("id")
+            .values_list("product_id", "warehouse_id")
+        )
+        pairs = reduce(or_, (Q(product_id=p, warehouse_id=w) for p, w in keys))
+
+        ledger = (
+            InventoryLedger.objects
+            .filter(pairs)
+            .order_by("created_at")
+            .values_list("product_id", "warehouse_id", "created_at", "change", "balance_after")
+        )
+
+        balances = {}
+
+        for product_id, warehouse_id, created_at, change, balance_after in ledger.iterator(chunk_size=2000):
+            date = balance_date(created_at)
+
+            row = balances.get((product_id, warehouse_id, date))
+            if row is None:
+                row = balances[(product_id, warehouse_id, date)] = InventoryDailyBalance(
+                    product_id=product_id,
+                    warehouse_id=warehouse_id,
+                    date=date,
+                    closing=0,
+                )
+
+            row.closing = balance_after
+            if change > 0:
+                row.quantity_in += change
+            else:
+                row.quantity_out -= change
+
+        # Only the days the ledger still covers are rebuilt; the rows of
+        # archived ledger partitions keep their daily balances
+        first_days = {}
+        for product_id, warehouse_id, date in balances:
+            key = (product_id, warehouse_id)
+            first_days[key] = min(date, first_days.get(key, date))
+
+        if first_days:
+            InventoryDailyBalance.objects.filter(reduce(or_, (
+                Q(product_id=p, warehouse_id=w, date__gte=date)
+                for (p, w), date in first_days.items()
+            ))).delete()
+        InventoryDailyBalance.objects.bulk_create(balances.values(), batch_size=1000)
+
+        return len(balances)
+
+
+# Usage
+# python manage.py backfill_daily_balances --chunk-size 500
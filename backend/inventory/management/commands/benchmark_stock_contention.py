@@ -0,0 +1,128 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from inventory.group_commit import group_stock_in, group_stock_out
+from inventory.models import InventoryStock
+from inventory.services import (
+    CONCURRENCY_OPTIMISTIC,
+    CONCURRENCY_PESSIMISTIC,
+    stock_in_service,
+    stock_out_service,
+)
+
+GROUP_COMMIT = "group-commit"
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer one product/warehouse from several threads and compare the "
+        "locking, optimistic and group-commit stock mutation paths. Every worker alternates "
+        "+1 / -1 movements, so the stock quantity is unchanged afterwards "
+        "(ledger and audit rows are written). Run against a non-production database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--product", required=True, help="Product id")
+        parser.add_argument("--warehouse", required=True, help="Warehouse id")
+        parser.add_argument("--username", required=True, help="Actor for the movements")
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--ops", type=int, default=100, help="Movements per thread")
+        parser.add_argument(
+            "--mode",
+            choices=[CONCURRENCY_PESSIMISTIC, CONCURRENCY_OPTIMISTIC, GROUP_COMMIT, "all"],
+            default="all",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            actor = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError("Unknown user")
+
+        if not InventoryStock.objects.filter(
+            product_id=options["product"],
+            warehouse_id=options["warehouse"],
+            quantity__gt=0,
+        ).exists():
+            raise CommandError("Stock row must exist with a positive quantity")
+
+        modes = (
+            [CONCURRENCY_PESSIMISTIC, CONCURRENCY_OPTIMISTIC, GROUP_COMMIT]
+            if options["mode"] == "all"
+            else [options["mode"]]
+        )
+
+        for mode in modes:
+            self._run(mode, actor, options)
+
+    def _run(self, mode, actor, options):
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+
+        def worker():
+            local_latencies = []
+            local_failures = 0
+
+            try:
+                for i in range(options["ops"]):
+                    started = time.perf_counter()
+                    try:
+                        if mode == GROUP_COMMIT:
+                            service = group_stock_in if i % 2 == 0 else group_stock_out
+                            service(
+                                actor=actor,
+                                product_id=options["product"],
+                                warehouse_id=options["warehouse"],
+                                quantity=1,
+                                reason="contention benchmark",
+                            )
+                        else:
+                            service = stock_in_service if i % 2 == 0 else stock_out_service
+                            service(
+                                actor=actor,
+                                product_id=options["product"],
+                                warehouse_id=options["warehouse"],
+                                quantity=1,
+                                reason="contention benchmark",
+                                concurrency=mode,
+                            )
+                    except ValueError:
+                        local_failures += 1
+                    local_latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+            with lock:
+                latencies.extend(local_latencies)
+                failures.append(local_failures)
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+
+        self.stdout.write(
+            f"{mode:<12} ops={len(latencies)} "
+            f"throughput={len(latencies) / elapsed:.1f}/s "
+            f"p50={statistics.median(latencies) * 1000:.1f}ms "
+            f"p95={p95 * 1000:.1f}ms "
+            f"failed={sum(failures)}"
+        )
+
+
+# Usage
+# python manage.py benchmark_stock_contention --product <id> --warehouse <id> --username admin --threads 16 --ops 200
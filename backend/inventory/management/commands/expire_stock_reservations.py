@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from inventory.services import expire_stock_reservations
+
+
+class Command(BaseCommand):
+    help = "Expire stale stock reservations and hand the quantity back to available stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Reservations expired per transaction",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+
+        while True:
+            expired = expire_stock_reservations(batch_size=options["batch_size"])
+            if not expired:
+                break
+            total += expired
+            self.stdout.write(f"{total} reservations expired")
+
+        self.stdout.write(self.style.SUCCESS(f"Expired {total} stock reservations"))
+
+
+# Usage (schedule e.g. every 5 minutes)
+# python manage.py expire_stock_reservations --batch-size 500
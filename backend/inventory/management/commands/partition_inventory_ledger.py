@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from inventory.partitioning import archive_partitions, convert_to_partitioned, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain monthly range partitions of InventoryLedger (PostgreSQL): "
+        "convert the table, create upcoming partitions and archive old ones"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Convert the ledger to a partitioned table first (locks it during the copy)",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Create partitions this many months past the current one",
+        )
+        parser.add_argument(
+            "--retention-months",
+            type=int,
+            help="Detach and archive partitions that ended more than this many months ago",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            help="Directory for archived partitions (<partition>.csv.gz)",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Ledger partitioning requires PostgreSQL")
+
+        if options["retention_months"] is not None and not options["archive_dir"]:
+            raise CommandError("--retention-months needs --archive-dir")
+
+        if options["convert"]:
+            if convert_to_partitioned(months_ahead=options["months_ahead"]):
+                self.stdout.write("Ledger converted to monthly partitions")
+            else:
+                self.stdout.write("Ledger is already partitioned")
+
+        for name in ensure_partitions(months_ahead=options["months_ahead"]):
+            self.stdout.write(f"Created {name}")
+
+        if options["retention_months"] is not None:
+            for name, path, rows in archive_partitions(
+                retention_months=options["retention_months"],
+                archive_dir=options["archive_dir"],
+            ):
+                self.stdout.write(f"Archived {name} ({rows} rows) -> {path}")
+
+        self.stdout.write(self.style.SUCCESS("Ledger partitions up to date"))
+
+
+# Usage (schedule daily; --convert only once, in a maintenance window)
+# python manage.py partition_inventory_ledger --convert
+# python manage.py partition_inventory_ledger --months-ahead 3 --retention-months 36 --archive-dir /backups/ledger
@@ -0,0 +1,114 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from company.models import Warehouse
+from inventory.reconciliation import correct_drift, init_worker, reconcile_warehouse
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that every stock row equals the sum of its ledger changes and "
+        "that balance_after forms an unbroken chain. Warehouses are checked "
+        "in parallel, one process (and DB connection) per worker; the report is JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--warehouse", action="append", help="Only these warehouse ids")
+        parser.add_argument(
+            "--max-breaks",
+            type=int,
+            default=100,
+            help="Chain breaks reported per warehouse",
+        )
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Append RECONCILIATION ledger rows so the ledger sums to the stock quantity",
+        )
+        parser.add_argument("--username", help="Actor for corrective ledger rows (with --fix)")
+
+    def handle(self, *args, **options):
+        actor = None
+        if options["fix"]:
+            if not options["username"]:
+                raise CommandError("--fix needs --username")
+            try:
+                actor = get_user_model().objects.get(username=options["username"])
+            except get_user_model().DoesNotExist:
+                raise CommandError("Unknown user")
+
+        warehouses = Warehouse.objects.order_by("id")
+        if options["warehouse"]:
+            warehouses = warehouses.filter(id__in=options["warehouse"])
+        warehouse_ids = list(warehouses.values_list("id", flat=True))
+
+        started = time.perf_counter()
+        results = []
+
+        # Forked workers must not share the parent's connection
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=init_worker) as pool:
+            futures = [
+                pool.submit(reconcile_warehouse, warehouse_id, options["max_breaks"])
+                for warehouse_id in warehouse_ids
+            ]
+            for future in as_completed(futures):
+                results.append(future.result())
+
+        results.sort(key=lambda r: r["warehouse_id"])
+        drift = [d for r in results for d in r["drift"]]
+
+        corrections = []
+        if options["fix"]:
+            for d in drift:
+                ledger = correct_drift(
+                    product_id=d["product_id"],
+                    warehouse_id=d["warehouse_id"],
+                    actor=actor,
+                )
+                if ledger is not None:
+                    corrections.append({
+                        "ledger_id": str(ledger.id),
+                        "product_id": d["product_id"],
+                        "warehouse_id": d["warehouse_id"],
+                        "change": ledger.change,
+                    })
+
+        report = {
+            "warehouses": len(results),
+            "pairs": sum(r["pairs"] for r in results),
+            "drift": drift,
+            "chain_breaks": [b for r in results for b in r["chain_breaks"]],
+            "corrections": corrections,
+            "elapsed_seconds": round(time.perf_counter() - started, 2),
+        }
+
+        payload = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(payload)
+        else:
+            self.stdout.write(payload)
+
+        summary = (
+            f"{report['pairs']} pairs in {report['warehouses']} warehouses: "
+            f"{len(report['drift'])} drifted, {len(report['chain_breaks'])} chain breaks"
+        )
+        if drift or report["chain_breaks"]:
+            self.stderr.write(self.style.WARNING(summary))
+        else:
+            self.stderr.write(self.style.SUCCESS(summary))
+
+
+# Usage
+# python manage.py reconcile_inventory --workers 8 --output /tmp/reconcile.json
+# python manage.py reconcile_inventory --warehouse <id> --fix --username admin
@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from inventory.replay import (
+    build_shadow,
+    live_only_pairs,
+    peak_memory_mb,
+    replay_ledger,
+    shadow_diff,
+    swap_shadow,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild InventoryStock by replaying the ledger into a shadow table, "
+        "optionally up to a cutoff, and optionally swap it in for the live table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cutoff", help="Replay ledger rows created at or before this ISO timestamp")
+        parser.add_argument(
+            "--swap",
+            action="store_true",
+            help="Swap the rebuilt table in for the live one (otherwise only report the differences)",
+        )
+        parser.add_argument("--drop-old", action="store_true", help="Drop the replaced table after --swap")
+        parser.add_argument("--chunk-size", type=int, default=20000, help="Rows fetched per server-side cursor round trip")
+        parser.add_argument("--progress-every", type=int, default=1_000_000)
+        parser.add_argument(
+            "--margin-minutes",
+            type=int,
+            default=10,
+            help="Catch-up window before the replay high-water mark (longest expected movement transaction)",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Stock replay requires PostgreSQL")
+
+        cutoff = None
+        if options["cutoff"]:
+            cutoff = parse_datetime(options["cutoff"])
+            if cutoff is None:
+                raise CommandError("Invalid --cutoff")
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff)
+
+        margin = timedelta(minutes=options["margin_minutes"])
+
+        def progress(rows, pairs, elapsed):
+            self.stdout.write(
+                f"{rows} rows, {pairs} pairs, "
+                f"{rows / elapsed if elapsed else 0:.0f} rows/s, "
+                f"peak {peak_memory_mb():.0f} MB"
+            )
+
+        replay = replay_ledger(
+            cutoff=cutoff,
+            chunk_size=options["chunk_size"],
+            progress_every=options["progress_every"],
+            on_progress=progress,
+            catch_up_margin=margin,
+        )
+
+        build_shadow(replay.balances)
+        diff = shadow_diff()
+        self.stdout.write(f"{len(diff)} stock rows differ from the replayed ledger")
+        for product_id, warehouse_id, live, rebuilt in diff[:20]:
+            self.stdout.write(f"  {product_id} @ {warehouse_id}: live={live} replayed={rebuilt}")
+
+        if not cutoff:
+            live_only = live_only_pairs()
+            if live_only:
+                self.stdout.write(self.style.WARNING(
+                    f"{len(live_only)} stock rows hold stock with no ledger rows; --swap will refuse"
+                ))
+                for product_id, warehouse_id, live in live_only[:20]:
+                    self.stdout.write(f"  {product_id} @ {warehouse_id}: live={live}")
+
+        if not options["swap"]:
+            self.stdout.write("Shadow table left in place; re-run with --swap to apply")
+            return
+
+        # A cutoff rebuild restores the position at that time on purpose,
+        # so later movements are not caught up
+        try:
+            old = swap_shadow(
+                replay=None if cutoff else replay,
+                catch_up_margin=margin,
+                drop_old=options["drop_old"],
+            )
+        except ValueError as e:
+            raise CommandError(f"Swap refused: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            "Stock table swapped" + (f"; previous table kept as {old}" if old else "")
+        ))
+
+
+# Usage
+# python manage.py replay_inventory_stock                  # dry run: build shadow, report differences
+# python manage.py replay_inventory_stock --swap
+# python manage.py replay_inventory_stock --cutoff 2025-03-31T23:59:59Z --swap
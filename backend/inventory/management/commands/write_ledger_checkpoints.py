@@ -0,0 +1,66 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from inventory.services import write_boundary_checkpoints
+
+
+def _parse_month(value):
+    try:
+        year, month = map(int, value.split("-"))
+        return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+    except ValueError:
+        raise CommandError(f"Invalid month: {value} (expected YYYY-MM)")
+
+
+def _next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Write InventoryCheckpoint rows (balance + ledger high-water mark) at "
+        "month boundaries so historic balances only replay the ledger tail"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--month",
+            help="Boundary month YYYY-MM; the checkpoint is taken at its first instant (UTC). Default: current month",
+        )
+        parser.add_argument(
+            "--from",
+            dest="from_month",
+            help="Also (re)write every monthly boundary from this YYYY-MM onwards, oldest first",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of stock rows checkpointed per transaction",
+        )
+
+    def handle(self, *args, **options):
+        current = now()
+        last = _parse_month(options["month"]) if options["month"] else datetime(
+            current.year, current.month, 1, tzinfo=dt_timezone.utc
+        )
+        month = _parse_month(options["from_month"]) if options["from_month"] else last
+
+        if month > last:
+            raise CommandError("--from must not be after --month")
+
+        while month <= last:
+            written = write_boundary_checkpoints(month, chunk_size=options["chunk_size"])
+            self.stdout.write(f"{month:%Y-%m}: {written} checkpoints")
+            month = _next_month(month)
+
+        self.stdout.write(self.style.SUCCESS("Ledger checkpoints written successfully"))
+
+
+# Usage (schedule on the 1st of each month)
+# python manage.py write_ledger_checkpoints
+# python manage.py write_ledger_checkpoints --from 2024-01   # backfill / rebuild after backdated entries
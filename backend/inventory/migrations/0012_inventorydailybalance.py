@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-18 17:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0007_alter_warehouse_location'),
+        ('inventory', '0011_alter_purchaserequisition_status_issueslipitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryDailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('closing', models.IntegerField()),
+                ('quantity_in', models.IntegerField(default=0)),
+                ('quantity_out', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='company.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='company.warehouse')),
+            ],
+            options={
+                'unique_together': {('product', 'warehouse', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-18 17:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0007_alter_warehouse_location'),
+        ('inventory', '0012_inventorydailybalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventoryledger',
+            index=models.Index(fields=['warehouse', 'product', 'created_at'], include=('balance_after',), name='inv_ledger_wh_prod_created_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 18:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0007_alter_warehouse_location'),
+        ('inventory', '0013_inventoryledger_wh_prod_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCostLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity_received', models.PositiveIntegerField()),
+                ('quantity_remaining', models.PositiveIntegerField()),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('reference_type', models.CharField(max_length=50)),
+                ('reference_id', models.UUIDField()),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='company.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='company.warehouse')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('quantity_remaining__gt', 0)), fields=['product', 'warehouse', 'received_at'], name='stock_cost_layer_open_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 19:40
+
+from django.db import migrations
+
+
+def partition_ledger(apps, schema_editor):
+    # Monthly range partitions are a PostgreSQL feature; other backends
+    # keep the plain table. Already-converted databases are left as is,
+    # so large installations can run `partition_inventory_ledger --convert`
+    # in a maintenance window before migrating.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    from inventory.partitioning import convert_to_partitioned
+
+    convert_to_partitioned()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_stockreservation'),
+    ]
+
+    operations = [
+        # The partitioned table keeps every column and index, so the model
+        # state is unchanged and reversing leaves it partitioned.
+        migrations.RunPython(partition_ledger, migrations.RunPython.noop),
+    ]
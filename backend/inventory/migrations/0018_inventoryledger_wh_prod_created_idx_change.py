@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 22:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0007_alter_warehouse_location'),
+        ('inventory', '0017_inventorycheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='inventoryledger',
+            name='inv_ledger_wh_prod_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='inventoryledger',
+            index=models.Index(fields=['warehouse', 'product', 'created_at'], include=('change',), name='inv_ledger_wh_prod_created_idx'),
+        ),
+    ]
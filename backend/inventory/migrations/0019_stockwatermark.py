@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-18 22:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0007_alter_warehouse_location'),
+        ('inventory', '0018_inventoryledger_wh_prod_created_idx_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockWatermark',
+            fields=[
+                ('warehouse', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, primary_key=True, related_name='stock_watermark', serialize=False, to='company.warehouse')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
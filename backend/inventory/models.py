@@ -3,6 +3,7 @@ from django.db import models
 from company.models import Product, Warehouse, Company, Supplier
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.utils import timezone
 
 
 class InventoryStock(models.Model):
@@ -12,6 +13,8 @@ class InventoryStock(models.Model):
     warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT)
 
     quantity = models.IntegerField(default=0)
+    # Sum of ACTIVE StockReservation quantities; available = quantity - reserved
+    reserved = models.IntegerField(default=0)
     version = models.IntegerField(default=1)
 
     class Meta:
@@ -39,6 +42,148 @@ class InventoryLedger(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Per-pair ledger ranges for the historic reports, which sum
+            # `change` from the nearest checkpoint (annotate_balance_at);
+            # carrying it lets Postgres answer with an index-only scan.
+            models.Index(
+                fields=["warehouse", "product", "created_at"],
+                include=["change"],
+                name="inv_ledger_wh_prod_created_idx",
+            ),
+        ]
+
+
+class InventoryDailyBalance(models.Model):
+    """
+    End-of-day stock position per product/warehouse, kept in step with
+    InventoryLedger so historic reports don't have to replay the ledger.
+    Dates are UTC days of the ledger created_at.
+    """
+    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT)
+
+    date = models.DateField()
+
+    closing = models.IntegerField()
+    quantity_in = models.IntegerField(default=0)
+    quantity_out = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("product", "warehouse", "date")
+
+
+class InventoryCheckpoint(models.Model):
+    """
+    Balance per product/warehouse at a period boundary: the sum of every
+    ledger row created before `at`. The last of those rows is kept as the
+    ledger high-water mark. Balances at later times only need the ledger
+    rows from `at` onwards.
+    """
+    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT)
+
+    at = models.DateTimeField()
+    balance = models.IntegerField()
+
+    last_ledger_id = models.UUIDField()
+    last_ledger_at = models.DateTimeField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("product", "warehouse", "at")
+
+
+class StockWatermark(models.Model):
+    """
+    Change counter per warehouse behind the stock ETags (stock_watermark).
+    Every ledger write bumps it in its own transaction, and so do edits of
+    the products, suppliers, warehouses and usernames the stock reads show.
+    """
+    warehouse = models.OneToOneField(
+        Warehouse, on_delete=models.PROTECT, primary_key=True, related_name="stock_watermark"
+    )
+    version = models.BigIntegerField(default=0)
+
+
+class StockCostLayer(models.Model):
+    """
+    One FIFO layer per receipt. Outbound movements drain the oldest open
+    layers first, so open layers are what is physically left on the shelf.
+    """
+    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT)
+
+    quantity_received = models.PositiveIntegerField()
+    quantity_remaining = models.PositiveIntegerField()
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+
+    reference_type = models.CharField(max_length=50)
+    reference_id = models.UUIDField()
+
+    received_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["product", "warehouse", "received_at"],
+                condition=models.Q(quantity_remaining__gt=0),
+                name="stock_cost_layer_open_idx",
+            ),
+        ]
+
+
+class StockReservation(models.Model):
+    """
+    Quantity set aside for an owner (e.g. an approved issue slip) until it
+    is consumed by the actual movement, released, or expires. Active
+    reservations are mirrored in InventoryStock.reserved so availability
+    checks stay a single guarded UPDATE on the stock row.
+    """
+    STATUS_ACTIVE = "ACTIVE"
+    STATUS_CONSUMED = "CONSUMED"
+    STATUS_RELEASED = "RELEASED"
+    STATUS_EXPIRED = "EXPIRED"
+
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, "Active"),
+        (STATUS_CONSUMED, "Consumed"),
+        (STATUS_RELEASED, "Released"),
+        (STATUS_EXPIRED, "Expired"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT)
+
+    quantity = models.PositiveIntegerField()
+
+    # Owner of the reservation
+    reference_type = models.CharField(max_length=50)
+    reference_id = models.UUIDField()
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+
+    created_by = models.ForeignKey(
+        User, on_delete=models.PROTECT, related_name="stock_reservations"
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["reference_type", "reference_id"], name="stock_reservation_ref_idx"),
+            models.Index(
+                fields=["expires_at"],
+                condition=models.Q(status="ACTIVE"),
+                name="stock_reservation_active_idx",
+            ),
+        ]
+
 
 class PurchaseRequisition(models.Model):
     STATUS_DRAFT = "DRAFT"
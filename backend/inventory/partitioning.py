@@ -0,0 +1,55 @@
+"""
+Monthly range partitioning of InventoryLedger (PostgreSQL only), on top
+of core.partitioning.
+"""
+from django.db import connection
+
+from core import partitioning
+from inventory.models import InventoryLedger
+from inventory.services import write_boundary_checkpoints
+
+
+TABLE = InventoryLedger._meta.db_table
+DEFAULT_PARTITION = partitioning.default_partition(TABLE)
+
+
+def partition_name(month):
+    return partitioning.partition_name(TABLE, month)
+
+
+def is_partitioned(cursor):
+    return partitioning.is_partitioned(cursor, TABLE)
+
+
+def month_partitions(cursor):
+    return partitioning.month_partitions(cursor, TABLE)
+
+
+def ensure_partitions(*, months_ahead=3, start=None):
+    return partitioning.ensure_partitions(TABLE, months_ahead=months_ahead, start=start)
+
+
+def convert_to_partitioned(*, months_ahead=3):
+    return partitioning.convert_to_partitioned(TABLE, months_ahead=months_ahead)
+
+
+def archive_partitions(*, retention_months, archive_dir):
+    """
+    Archive the ledger months older than `retention_months` (see
+    core.partitioning.archive_partitions). Every pair is checkpointed at
+    the cut-off first, so the ledger that is left still adds up: its
+    consumers start each pair from that checkpoint.
+    """
+    cutoff = partitioning.archive_cutoff(retention_months)
+
+    with connection.cursor() as cursor:
+        if not partitioning.expired_partitions(cursor, TABLE, cutoff):
+            return []
+
+    # A checkpoint left by an earlier, partly failed run is kept: the rows
+    # it was built from may already be archived
+    write_boundary_checkpoints(cutoff, keep_existing=True)
+
+    return partitioning.archive_partitions(
+        TABLE, cutoff=cutoff, archive_dir=archive_dir
+    )
@@ -0,0 +1,171 @@
+"""
+Ledger/stock reconciliation, one warehouse at a time so the work can be
+spread over a process pool (see the reconcile_inventory command).
+
+Per warehouse it runs two set-based queries, both served in
+(warehouse, product, created_at) order by the ledger index:
+
+- drift: SUM(change) per product compared with InventoryStock.quantity
+- chain breaks: rows whose balance_after != previous balance_after + change
+
+Both start each pair from ledger_base(): 0, or the checkpoint written at
+the cut-off once old ledger months were archived.
+
+All reads of a warehouse share one snapshot, so a movement committing
+halfway through can't show up as drift.
+"""
+from contextlib import contextmanager
+
+import django
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum, Window
+from django.db.models.functions import Coalesce, Lag
+
+from inventory.models import InventoryLedger, InventoryStock
+from inventory.services import ledger_base, record_daily_balance
+
+
+def init_worker():
+    # Each worker opens its own connection on first use
+    django.setup()
+
+
+@contextmanager
+def _snapshot():
+    """
+    A transaction whose reads all see the same snapshot. PostgreSQL's
+    default READ COMMITTED takes a new one per statement, so the level is
+    raised for this transaction; SQLite transactions already are.
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        yield
+
+
+def reconcile_warehouse(warehouse_id, max_breaks=100):
+    with _snapshot():
+        return _reconcile_warehouse(warehouse_id, max_breaks)
+
+
+def _reconcile_warehouse(warehouse_id, max_breaks):
+    totals = dict(
+        InventoryLedger.objects
+        .filter(warehouse_id=warehouse_id)
+        .order_by()
+        .values("product_id")
+        .annotate(total=Sum("change"))
+        .values_list("product_id", "total")
+    )
+    stocks = {
+        product_id: (quantity, base)
+        for product_id, quantity, base in (
+            InventoryStock.objects
+            .filter(warehouse_id=warehouse_id)
+            .annotate(base=ledger_base())
+            .values_list("product_id", "quantity", "base")
+        )
+    }
+
+    drift = []
+    for product_id in stocks.keys() | totals.keys():
+        # Checkpoints only exist for stock rows, so ledger-only pairs start from 0
+        quantity, base = stocks.get(product_id, (0, 0))
+        ledger_total = base + totals.get(product_id, 0)
+        if quantity != ledger_total:
+            drift.append({
+                "product_id": str(product_id),
+                "warehouse_id": str(warehouse_id),
+                "stock_quantity": quantity,
+                "ledger_total": ledger_total,
+                "difference": quantity - ledger_total,
+            })
+
+    # Ties on created_at are broken by id, the same order used everywhere
+    # rows are replayed; the first row of a pair must start from its base,
+    # which is only looked up for that row.
+    breaks = (
+        InventoryLedger.objects
+        .filter(warehouse_id=warehouse_id)
+        .annotate(
+            previous_balance=Coalesce(
+                Window(
+                    Lag("balance_after"),
+                    partition_by=[F("product_id")],
+                    order_by=[F("created_at").asc(), F("id").asc()],
+                ),
+                ledger_base(),
+            ),
+        )
+        .filter(~Q(balance_after=F("previous_balance") + F("change")))
+        .order_by("product_id", "created_at", "id")
+        .values_list("id", "product_id", "created_at", "change", "balance_after", "previous_balance")
+    )
+
+    chain_breaks = [
+        {
+            "ledger_id": str(ledger_id),
+            "product_id": str(product_id),
+            "warehouse_id": str(warehouse_id),
+            "created_at": created_at.isoformat(),
+            "change": change,
+            "balance_after": balance_after,
+            "expected_balance_after": previous_balance + change,
+        }
+        for ledger_id, product_id, created_at, change, balance_after, previous_balance in breaks[:max_breaks]
+    ]
+
+    return {
+        "warehouse_id": str(warehouse_id),
+        "pairs": len(stocks.keys() | totals.keys()),
+        "drift": drift,
+        "chain_breaks": chain_breaks,
+    }
+
+
+@transaction.atomic
+def correct_drift(*, product_id, warehouse_id, actor):
+    """
+    Append a RECONCILIATION ledger row that brings SUM(change) back in line
+    with the stock row, which is what every movement validates against.
+    Re-checked under the stock row lock; returns the ledger row or None.
+    The stock row's version is bumped like any other movement's, so
+    optimistic writers and cached reads notice the new ledger row.
+    """
+    stock = (
+        InventoryStock.objects
+        .select_for_update()
+        .filter(product_id=product_id, warehouse_id=warehouse_id)
+        .annotate(base=ledger_base())
+        .first()
+    )
+    quantity = stock.quantity if stock else 0
+
+    ledger_total = (stock.base if stock else 0) + ((
+        InventoryLedger.objects
+        .filter(product_id=product_id, warehouse_id=warehouse_id)
+        .aggregate(total=Sum("change"))["total"]
+    ) or 0)
+
+    if quantity == ledger_total:
+        return None
+
+    ledger = InventoryLedger.objects.create(
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        change=quantity - ledger_total,
+        balance_after=quantity,
+        reference_type="RECONCILIATION",
+        reference_id=stock.id if stock else warehouse_id,
+        reason="Ledger corrected to match stock by reconcile_inventory",
+        created_by=actor,
+    )
+    record_daily_balance(ledger)
+
+    if stock:
+        stock.version += 1
+        stock.save(update_fields=["version"])
+
+    return ledger
@@ -0,0 +1,307 @@
+"""
+Rebuild InventoryStock from the ledger without holding locks on the live
+table while the ledger is read.
+
+1. replay_ledger() streams the ledger (server-side cursor, created_at
+   order) and folds it into an in-memory map of net quantity per
+   (product_id, warehouse_id), keyed by the 32 raw UUID bytes to keep it
+   compact. Pairs whose old ledger months were archived start from the
+   checkpoint at the cut-off.
+2. build_shadow() writes the result into <stock table>_shadow.
+3. swap_shadow() locks the live table briefly, applies ledger rows written
+   since the replay, carries over ids/reservations/versions and swaps the
+   tables by renaming them (and their indexes) in one transaction
+   (PostgreSQL).
+"""
+import resource
+import time
+from collections import deque
+from datetime import timedelta
+from uuid import UUID, uuid4
+
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from inventory.models import InventoryLedger, InventoryStock
+from inventory.services import ledger_base
+
+
+TABLE = InventoryStock._meta.db_table
+SHADOW = f"{TABLE}_shadow"
+LEDGER = InventoryLedger._meta.db_table
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Replay:
+    """
+    Result of replay_ledger(): `balances` maps product.bytes +
+    warehouse.bytes -> net quantity; `high_water_mark` is the created_at
+    of the last row read and `tail_ids` the ids read within
+    `catch_up_margin` of it (see swap_shadow).
+    """
+    def __init__(self):
+        self.balances = {}
+        self.high_water_mark = None
+        self.tail_ids = []
+        self.rows = 0
+
+
+def replay_ledger(
+    *,
+    cutoff=None,
+    chunk_size=20000,
+    progress_every=1_000_000,
+    on_progress=None,
+    catch_up_margin=timedelta(minutes=10),
+):
+    """
+    Fold every ledger row created at or before `cutoff` (all rows when
+    None) into net quantities per product/warehouse. Each pair starts
+    from ledger_base(): the checkpoint written at the cut-off once old
+    ledger months were archived, so the replay adds up a truncated
+    ledger the same way a complete one does.
+    """
+    qs = InventoryLedger.objects.order_by("created_at", "id")
+    if cutoff is not None:
+        qs = qs.filter(created_at__lte=cutoff)
+
+    replay = Replay()
+    balances = replay.balances
+
+    bases = (
+        InventoryStock.objects
+        .annotate(base=ledger_base())
+        .exclude(base=0)
+        .values_list("product_id", "warehouse_id", "base")
+    )
+    for product_id, warehouse_id, base in bases.iterator(chunk_size=chunk_size):
+        balances[product_id.bytes + warehouse_id.bytes] = base
+    tail = deque()
+    started = time.perf_counter()
+
+    for ledger_id, product_id, warehouse_id, change, created_at in qs.values_list(
+        "id", "product_id", "warehouse_id", "change", "created_at"
+    ).iterator(chunk_size=chunk_size):
+        key = product_id.bytes + warehouse_id.bytes
+        balances[key] = balances.get(key, 0) + change
+
+        tail.append((created_at, ledger_id))
+        while tail[0][0] < created_at - catch_up_margin:
+            tail.popleft()
+
+        replay.rows += 1
+        if on_progress and replay.rows % progress_every == 0:
+            on_progress(replay.rows, len(balances), time.perf_counter() - started)
+
+    if tail:
+        replay.high_water_mark = tail[-1][0]
+        replay.tail_ids = [ledger_id for _, ledger_id in tail]
+
+    if on_progress:
+        on_progress(replay.rows, len(balances), time.perf_counter() - started)
+
+    return replay
+
+
+def build_shadow(balances, *, batch_size=5000):
+    """
+    (Re)create the shadow table with the live table's columns, indexes and
+    constraints, and fill it from `balances`. Ids are placeholders until
+    swap_shadow() carries the live ids over.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {_qn(SHADOW)}")
+        cursor.execute(f"CREATE TABLE {_qn(SHADOW)} (LIKE {_qn(TABLE)} INCLUDING ALL)")
+
+        sql = (
+            f"INSERT INTO {_qn(SHADOW)} (id, product_id, warehouse_id, quantity, reserved, version) "
+            f"VALUES (%s, %s, %s, %s, 0, 1)"
+        )
+
+        batch = []
+        for key, quantity in balances.items():
+            batch.append((uuid4(), UUID(bytes=key[:16]), UUID(bytes=key[16:]), quantity))
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+        cursor.execute(f"ANALYZE {_qn(SHADOW)}")
+
+
+def live_only_pairs():
+    """
+    Live stock rows holding stock that the shadow has no row for, as
+    (product_id, warehouse_id, live quantity): stock that never went
+    through the ledger, which a swap would zero out.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT l.product_id, l.warehouse_id, l.quantity
+            FROM {_qn(TABLE)} l
+            WHERE l.quantity <> 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM {_qn(SHADOW)} s
+                  WHERE s.product_id = l.product_id AND s.warehouse_id = l.warehouse_id
+              )
+            """
+        )
+        return cursor.fetchall()
+
+
+def _indexes(cursor, table):
+    """
+    {(unique, definition without names): index name} for `table`, so the
+    shadow's generated index names can be matched to the live ones.
+    Renaming an index also renames the constraint it backs.
+    """
+    cursor.execute(
+        """
+        SELECT i.relname, x.indisunique, pg_get_indexdef(x.indexrelid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass
+        """,
+        [table],
+    )
+    return {
+        (unique, definition.split(" USING ", 1)[1]): name
+        for name, unique, definition in cursor.fetchall()
+    }
+
+
+def _refuse(problem, rows):
+    listed = ", ".join(f"{product_id} @ {warehouse_id}" for product_id, warehouse_id, *_ in rows[:20])
+    raise ValueError(f"{len(rows)} stock rows {problem}: {listed}")
+
+
+def shadow_diff():
+    """
+    Rows where the shadow disagrees with the live table, as
+    (product_id, warehouse_id, live quantity, rebuilt quantity).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT COALESCE(l.product_id, s.product_id),
+                   COALESCE(l.warehouse_id, s.warehouse_id),
+                   l.quantity, COALESCE(s.quantity, 0)
+            FROM {_qn(TABLE)} l
+            FULL OUTER JOIN {_qn(SHADOW)} s
+              ON s.product_id = l.product_id AND s.warehouse_id = l.warehouse_id
+            WHERE l.quantity IS DISTINCT FROM COALESCE(s.quantity, 0)
+            """
+        )
+        return cursor.fetchall()
+
+
+@transaction.atomic
+def swap_shadow(*, replay=None, catch_up_margin=timedelta(minutes=10), drop_old=False):
+    """
+    Swap the shadow table in for the live one. The live table is locked
+    (ACCESS EXCLUSIVE) only for the final steps:
+
+    - with a `replay` (omit it for cutoff rebuilds), ledger rows the
+      replay did not see are folded into the shadow, so movements made
+      while it ran survive. Rows are looked for from `catch_up_margin`
+      before the high-water mark, because a transaction that committed
+      late can carry an earlier created_at; ids already replayed there
+      are skipped.
+    - live ids, reserved quantities and versions are carried over; pairs
+      that only exist live are copied with quantity 0. Outside a cutoff
+      rebuild (with a `replay`), live-only pairs that hold stock refuse
+      the swap, since that stock never went through the ledger.
+    - a pair left reserving more than it holds refuses the swap
+    - the live foreign keys are recreated on the shadow, the tables are
+      renamed and the shadow's indexes (with the unique constraints they
+      back) take over the live names
+
+    A refused swap raises ValueError naming the pairs and leaves the live
+    table untouched. The old table is kept as <table>_replaced_<timestamp>
+    (its indexes renamed <that name>_<n>) unless `drop_old`. Returns the
+    old table's new name (or None when dropped).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {_qn(TABLE)} IN ACCESS EXCLUSIVE MODE")
+
+        if replay is not None:
+            live_only = live_only_pairs()
+            if live_only:
+                _refuse("hold stock with no ledger rows", live_only)
+
+        if replay is not None and replay.high_water_mark is not None:
+            cursor.execute(
+                f"""
+                INSERT INTO {_qn(SHADOW)} AS s (id, product_id, warehouse_id, quantity, reserved, version)
+                SELECT gen_random_uuid(), product_id, warehouse_id, SUM(change), 0, 1
+                FROM {_qn(LEDGER)}
+                WHERE created_at >= %s AND NOT (id = ANY(%s))
+                GROUP BY product_id, warehouse_id
+                ON CONFLICT (product_id, warehouse_id)
+                DO UPDATE SET quantity = s.quantity + EXCLUDED.quantity
+                """,
+                [replay.high_water_mark - catch_up_margin, replay.tail_ids],
+            )
+
+        cursor.execute(
+            f"""
+            INSERT INTO {_qn(SHADOW)} (id, product_id, warehouse_id, quantity, reserved, version)
+            SELECT id, product_id, warehouse_id, 0, reserved, version + 1
+            FROM {_qn(TABLE)}
+            ON CONFLICT (product_id, warehouse_id)
+            DO UPDATE SET id = EXCLUDED.id,
+                          reserved = EXCLUDED.reserved,
+                          version = EXCLUDED.version
+            """
+        )
+
+        cursor.execute(
+            f"""
+            SELECT product_id, warehouse_id, quantity, reserved
+            FROM {_qn(SHADOW)}
+            WHERE reserved > quantity
+            """
+        )
+        over_reserved = cursor.fetchall()
+        if over_reserved:
+            _refuse("would reserve more than they hold", over_reserved)
+
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [TABLE],
+        )
+        for name, definition in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {_qn(SHADOW)} ADD CONSTRAINT {_qn(name)} {definition}")
+
+        live_indexes = _indexes(cursor, TABLE)
+        shadow_indexes = _indexes(cursor, SHADOW)
+
+        old = f"{TABLE}_replaced_{now():%Y%m%d%H%M%S}"
+        cursor.execute(f"ALTER TABLE {_qn(TABLE)} RENAME TO {_qn(old)}")
+        cursor.execute(f"ALTER TABLE {_qn(SHADOW)} RENAME TO {_qn(TABLE)}")
+
+        # Index names are unique per schema, so the old table's go first
+        if drop_old:
+            cursor.execute(f"DROP TABLE {_qn(old)}")
+        else:
+            for number, name in enumerate(live_indexes.values(), start=1):
+                cursor.execute(f"ALTER INDEX {_qn(name)} RENAME TO {_qn(f'{old}_{number}')}")
+
+        for key, name in shadow_indexes.items():
+            if key in live_indexes:
+                cursor.execute(f"ALTER INDEX {_qn(name)} RENAME TO {_qn(live_indexes[key])}")
+
+    return None if drop_old else old
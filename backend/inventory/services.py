@@ -1,13 +1,21 @@
+import logging
 import uuid
+from collections import Counter
+from functools import reduce
+from operator import or_
 from uuid import uuid4
-from django.db import transaction
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When, Window
+from django.db.models.functions import Coalesce
 from django.utils.timezone import now
-from django.forms.models import model_to_dict
 
 from core.audit.enums import AuditAction
-from core.audit.logger import AuditLogger
+from core.audit.logger import AuditLogger, atomic_audit, before_commit
 from rbac.services import user_has_permission
-from inventory.models import InventoryStock, InventoryLedger, InventoryOrder, Product, Warehouse, InventoryIssue, InventoryOrderItem, PurchaseRequisition, PurchaseRequisitionItem, GoodsReceiptNote, GoodsReceiptItem
+from inventory.models import InventoryStock, InventoryLedger, InventoryDailyBalance, InventoryCheckpoint, StockCostLayer, StockReservation, StockWatermark, InventoryOrder, Product, Warehouse, InventoryIssue, InventoryOrderItem, PurchaseRequisition, PurchaseRequisitionItem, GoodsReceiptNote, GoodsReceiptItem
 from users.models import UserProfile
 
 from django.contrib.auth import get_user_model
@@ -16,18 +24,535 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+log = logging.getLogger(__name__)
+
+
+def apply_stock_delta(*, product_id, warehouse_id, delta, reserved_delta=0):
+    """
+    Single round-trip stock movement: `quantity = quantity + delta` as one
+    UPDATE ... RETURNING, guarded so the quantity never drops below what
+    is reserved. Positive deltas upsert with INSERT ... ON CONFLICT, so a
+    missing stock row is created in the same statement.
+
+    `reserved_delta` moves the reserved counter in the same statement:
+    (0, +q) reserves q, (-q, -q) consumes a reservation, (0, -q) releases it.
+
+    The updated row stays locked until the surrounding transaction ends,
+    which is what serializes the ledger/layer writes that follow it.
+    Returns an unsaved InventoryStock carrying the new quantity/version;
+    raises ValueError("Insufficient stock") when the guard rejects it.
+    """
+    table = connection.ops.quote_name(InventoryStock._meta.db_table)
+    params = {
+        "id": InventoryStock._meta.pk.get_db_prep_value(uuid4(), connection),
+        "product_id": InventoryStock._meta.get_field("product").get_db_prep_value(product_id, connection),
+        "warehouse_id": InventoryStock._meta.get_field("warehouse").get_db_prep_value(warehouse_id, connection),
+        "delta": delta,
+        "reserved_delta": reserved_delta,
+    }
 
-def _get_or_create_stock(product, warehouse):
-    stock, created = InventoryStock.objects.select_for_update().get_or_create(
-        product=product,
-        warehouse=warehouse,
-        defaults={"quantity": 0}
+    if delta > 0 and not reserved_delta:
+        sql = f"""
+            INSERT INTO {table} (id, product_id, warehouse_id, quantity, reserved, version)
+            VALUES (%(id)s, %(product_id)s, %(warehouse_id)s, %(delta)s, 0, 1)
+            ON CONFLICT (product_id, warehouse_id) DO UPDATE
+            SET quantity = {table}.quantity + EXCLUDED.quantity,
+                version = {table}.version + 1
+            RETURNING id, quantity, reserved, version
+        """
+    else:
+        sql = f"""
+            UPDATE {table}
+            SET quantity = quantity + %(delta)s,
+                reserved = reserved + %(reserved_delta)s,
+                version = version + 1
+            WHERE product_id = %(product_id)s
+              AND warehouse_id = %(warehouse_id)s
+              AND quantity + %(delta)s >= reserved + %(reserved_delta)s
+            RETURNING id, quantity, reserved, version
+        """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    if row is None:
+        raise ValueError("Insufficient stock")
+
+    stock_id, quantity, reserved, version = row
+
+    return InventoryStock(
+        id=InventoryStock._meta.pk.to_python(stock_id),
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        quantity=quantity,
+        reserved=reserved,
+        version=version,
+    )
+
+
+def _stock_snapshot(stock, delta=0):
+    """
+    Audit view of a stock row (same keys as model_to_dict), optionally as
+    it was before `delta` was applied.
+    """
+    return {
+        "product": stock.product_id,
+        "warehouse": stock.warehouse_id,
+        "quantity": stock.quantity - delta,
+        "reserved": stock.reserved,
+        "version": stock.version - (1 if delta else 0),
+    }
+
+
+CONCURRENCY_PESSIMISTIC = "pessimistic"
+CONCURRENCY_OPTIMISTIC = "optimistic"
+
+
+def _concurrency_mode(concurrency):
+    mode = concurrency or getattr(
+        settings, "INVENTORY_STOCK_CONCURRENCY", CONCURRENCY_PESSIMISTIC
     )
-    return stock
+    if mode not in (CONCURRENCY_PESSIMISTIC, CONCURRENCY_OPTIMISTIC):
+        raise ValueError(f"Unknown stock concurrency mode: {mode}")
+    return mode
+
+
+def _apply_stock_delta_optimistic(product, warehouse, delta):
+    """
+    Apply `delta` with a version-checked conditional UPDATE instead of
+    SELECT ... FOR UPDATE, re-reading and retrying on version conflicts.
+    Returns (old_stock, stock) like the locking path.
+    """
+    retries = getattr(settings, "INVENTORY_OPTIMISTIC_RETRIES", 5)
+
+    for _ in range(retries):
+        stock = InventoryStock.objects.filter(product=product, warehouse=warehouse).first()
+
+        if stock is None:
+            if delta < 0:
+                raise ValueError("Insufficient stock")
+            stock, _ = InventoryStock.objects.get_or_create(
+                product=product,
+                warehouse=warehouse,
+                defaults={"quantity": 0},
+            )
 
+        if stock.quantity - stock.reserved + delta < 0:
+            raise ValueError("Insufficient stock")
 
+        updated = (
+            InventoryStock.objects
+            .filter(id=stock.id, version=stock.version, quantity__gte=F("reserved") - delta)
+            .update(quantity=F("quantity") + delta, version=F("version") + 1)
+        )
 
-@transaction.atomic
+        if updated:
+            stock.quantity += delta
+            stock.version += 1
+            return _stock_snapshot(stock, delta), stock
+
+    raise ValueError("Stock is being updated concurrently, please retry")
+
+
+def _apply_stock_delta(product, warehouse, delta, concurrency=None):
+    if _concurrency_mode(concurrency) == CONCURRENCY_OPTIMISTIC:
+        return _apply_stock_delta_optimistic(product, warehouse, delta)
+
+    stock = apply_stock_delta(
+        product_id=product.id,
+        warehouse_id=warehouse.id,
+        delta=delta,
+    )
+
+    return _stock_snapshot(stock, delta), stock
+
+
+def balance_date(created_at):
+    return created_at.astimezone(dt_timezone.utc).date()
+
+
+def record_daily_balance(ledger):
+    """
+    Fold a freshly written ledger row into its InventoryDailyBalance row
+    and move its warehouse's StockWatermark. Must run in the ledger's
+    transaction while the stock row is locked.
+    """
+    bump_stock_watermarks([ledger.warehouse_id])
+
+    date = balance_date(ledger.created_at)
+    quantity_in = max(ledger.change, 0)
+    quantity_out = max(-ledger.change, 0)
+
+    updated = (
+        InventoryDailyBalance.objects
+        .filter(
+            product_id=ledger.product_id,
+            warehouse_id=ledger.warehouse_id,
+            date=date,
+        )
+        .update(
+            closing=ledger.balance_after,
+            quantity_in=F("quantity_in") + quantity_in,
+            quantity_out=F("quantity_out") + quantity_out,
+        )
+    )
+
+    if not updated:
+        InventoryDailyBalance.objects.create(
+            product_id=ledger.product_id,
+            warehouse_id=ledger.warehouse_id,
+            date=date,
+            closing=ledger.balance_after,
+            quantity_in=quantity_in,
+            quantity_out=quantity_out,
+        )
+
+
+
+def record_daily_balances(ledgers):
+    """
+    Set-based record_daily_balance for a batch of ledger rows written in
+    chronological order: one SELECT, one bulk UPDATE and one bulk INSERT.
+    """
+    if not ledgers:
+        return
+
+    bump_stock_watermarks({ledger.warehouse_id for ledger in ledgers})
+
+    totals = {}
+    for ledger in ledgers:
+        key = (ledger.product_id, ledger.warehouse_id, balance_date(ledger.created_at))
+        closing, quantity_in, quantity_out = totals.get(key, (0, 0, 0))
+        totals[key] = (
+            ledger.balance_after,
+            quantity_in + max(ledger.change, 0),
+            quantity_out + max(-ledger.change, 0),
+        )
+
+    existing = (
+        InventoryDailyBalance.objects
+        .filter(
+            product_id__in={k[0] for k in totals},
+            warehouse_id__in={k[1] for k in totals},
+            date__in={k[2] for k in totals},
+        )
+    )
+
+    to_update = []
+    for row in existing:
+        key = (row.product_id, row.warehouse_id, row.date)
+        if key not in totals:
+            continue
+        closing, quantity_in, quantity_out = totals.pop(key)
+        row.closing = closing
+        row.quantity_in += quantity_in
+        row.quantity_out += quantity_out
+        to_update.append(row)
+
+    InventoryDailyBalance.objects.bulk_update(
+        to_update, ["closing", "quantity_in", "quantity_out"]
+    )
+    InventoryDailyBalance.objects.bulk_create([
+        InventoryDailyBalance(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            date=date,
+            closing=closing,
+            quantity_in=quantity_in,
+            quantity_out=quantity_out,
+        )
+        for (product_id, warehouse_id, date), (closing, quantity_in, quantity_out) in totals.items()
+    ])
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def annotate_balance_at(qs, at, *, inclusive=True, name="balance_at", rebuild=False):
+    """
+    Annotate rows that have product/warehouse FKs (usually InventoryStock)
+    with their ledger balance at `at`. The balance is the nearest
+    InventoryCheckpoint at or before `at`, plus the ledger changes from
+    that checkpoint up to `at`. Only the tail of the ledger is read.
+    `inclusive=False` leaves out rows stamped exactly `at`, which gives the
+    opening balance of a period starting at `at`. `rebuild=True` ignores
+    a checkpoint sitting exactly on `at`, for recomputing that checkpoint.
+    """
+    checkpoints = (
+        InventoryCheckpoint.objects
+        .filter(product=OuterRef("product"), warehouse=OuterRef("warehouse"))
+        .filter(**{"at__lt" if rebuild else "at__lte": at})
+        .order_by("-at")
+    )
+
+    qs = qs.annotate(
+        **{
+            f"{name}_checkpoint": Coalesce(
+                Subquery(checkpoints.values("at")[:1]),
+                Value(_EPOCH, output_field=DateTimeField()),
+            ),
+            f"{name}_base": Coalesce(Subquery(checkpoints.values("balance")[:1]), 0),
+        }
+    )
+
+    upper = {"created_at__lte": at} if inclusive else {"created_at__lt": at}
+    changes = (
+        InventoryLedger.objects
+        .filter(
+            product=OuterRef("product"),
+            warehouse=OuterRef("warehouse"),
+            created_at__gte=OuterRef(f"{name}_checkpoint"),
+            **upper,
+        )
+        .order_by()
+        .values("product")
+        .annotate(total=Sum("change"))
+        .values("total")
+    )
+
+    return qs.annotate(
+        **{name: F(f"{name}_base") + Coalesce(Subquery(changes), 0)}
+    )
+
+
+_FOREVER = datetime(9999, 12, 31, tzinfo=dt_timezone.utc)
+
+
+def ledger_base():
+    """
+    Expression for rows that have product/warehouse FKs: the balance the
+    retained ledger of their pair starts from. That is the latest
+    InventoryCheckpoint at or before the pair's oldest ledger row, or 0.
+    Once old ledger months are archived (inventory.partitioning) it's the
+    checkpoint at the cut-off; until then no checkpoint is that old, since
+    a checkpoint only exists after a ledger row, and the base is 0.
+    """
+    oldest = (
+        InventoryLedger.objects
+        .filter(product=OuterRef(OuterRef("product")), warehouse=OuterRef(OuterRef("warehouse")))
+        .order_by("created_at")
+        .values("created_at")[:1]
+    )
+    checkpoints = (
+        InventoryCheckpoint.objects
+        .filter(
+            product=OuterRef("product"),
+            warehouse=OuterRef("warehouse"),
+            at__lte=Coalesce(Subquery(oldest), Value(_FOREVER, output_field=DateTimeField())),
+        )
+        .order_by("-at")
+        .values("balance")[:1]
+    )
+    return Coalesce(Subquery(checkpoints), 0)
+
+
+def _bump_stock_watermarks(warehouse_ids):
+    table = connection.ops.quote_name(StockWatermark._meta.db_table)
+    field = StockWatermark._meta.pk
+
+    # One upsert; sorted so concurrent bumps lock the rows in one order
+    ids = [field.get_db_prep_value(warehouse_id, connection) for warehouse_id in sorted(warehouse_ids, key=str)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (warehouse_id, version)
+            VALUES {", ".join(["(%s, 1)"] * len(ids))}
+            ON CONFLICT (warehouse_id) DO UPDATE
+            SET version = {table}.version + 1
+            """,
+            ids,
+        )
+
+
+def bump_stock_watermarks(warehouse_ids):
+    """
+    Move the StockWatermark of each warehouse in `warehouse_ids`, in the
+    caller's transaction. Inside atomic_audit() the bump is left to the
+    end of the transaction, so the counter rows, which every movement of
+    a warehouse shares, are locked last and only until the commit.
+    """
+    warehouse_ids = set(warehouse_ids)
+    if warehouse_ids:
+        before_commit(_bump_stock_watermarks, warehouse_ids)
+
+
+def bump_company_stock_watermarks(company):
+    """
+    bump_stock_watermarks for every warehouse of `company`, for edits that
+    show in all of them (products, suppliers).
+    """
+    bump_stock_watermarks(
+        Warehouse.objects.filter(company=company).values_list("id", flat=True)
+    )
+
+
+def stock_watermark(company):
+    """
+    (warehouse_id, version) of the company's StockWatermark rows: they
+    move with every ledger write (stock, cost layers and ledger-derived
+    reports) and every edit of what the stock reads show. One primary-key
+    range instead of aggregating the stock, ledger or cost layers, read in
+    the caller's snapshot.
+    """
+    return list(
+        StockWatermark.objects
+        .filter(warehouse__company=company)
+        .order_by("warehouse_id")
+        .values_list("warehouse_id", "version")
+    )
+
+
+def write_checkpoints(*, stock_ids, at):
+    """
+    Write (or rebuild) the InventoryCheckpoint at boundary `at` for the
+    given stock rows, set-based: the balances come from
+    annotate_balance_at, so each checkpoint builds on the previous one.
+    Pairs with no ledger row before `at` get no checkpoint.
+    """
+    last_ledger = (
+        InventoryLedger.objects
+        .filter(product=OuterRef("product"), warehouse=OuterRef("warehouse"), created_at__lt=at)
+        .order_by("-created_at", "-id")
+    )
+
+    rows = (
+        annotate_balance_at(
+            InventoryStock.objects.filter(id__in=stock_ids),
+            at,
+            inclusive=False,
+            rebuild=True,
+        )
+        .annotate(
+            last_ledger_id=Subquery(last_ledger.values("id")[:1]),
+            last_ledger_at=Subquery(last_ledger.values("created_at")[:1]),
+        )
+        .filter(last_ledger_id__isnull=False)
+        .values_list("product_id", "warehouse_id", "balance_at", "last_ledger_id", "last_ledger_at")
+    )
+
+    checkpoints = [
+        InventoryCheckpoint(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            at=at,
+            balance=balance,
+            last_ledger_id=last_ledger_id,
+            last_ledger_at=last_ledger_at,
+        )
+        for product_id, warehouse_id, balance, last_ledger_id, last_ledger_at in rows
+    ]
+
+    InventoryCheckpoint.objects.bulk_create(
+        checkpoints,
+        update_conflicts=True,
+        unique_fields=["product", "warehouse", "at"],
+        update_fields=["balance", "last_ledger_id", "last_ledger_at"],
+    )
+
+    return len(checkpoints)
+
+
+def write_boundary_checkpoints(at, *, chunk_size=500, keep_existing=False):
+    """
+    write_checkpoints at `at` for every stock row, `chunk_size` rows per
+    transaction. `keep_existing` leaves pairs already checkpointed at `at`
+    alone, for when the ledger rows they were built from may be gone.
+    """
+    existing = InventoryCheckpoint.objects.filter(
+        product=OuterRef("product"), warehouse=OuterRef("warehouse"), at=at
+    )
+
+    last_id = None
+    written = 0
+
+    while True:
+        qs = InventoryStock.objects.order_by("id")
+        if keep_existing:
+            qs = qs.filter(~Exists(existing))
+        if last_id is not None:
+            qs = qs.filter(id__gt=last_id)
+
+        stock_ids = list(qs.values_list("id", flat=True)[:chunk_size])
+        if not stock_ids:
+            return written
+
+        with transaction.atomic():
+            written += write_checkpoints(stock_ids=stock_ids, at=at)
+
+        last_id = stock_ids[-1]
+
+
+def add_cost_layer(*, product_id, warehouse_id, quantity, unit_cost, reference_type, reference_id):
+    return StockCostLayer.objects.create(
+        product_id=product_id,
+        warehouse_id=warehouse_id,
+        quantity_received=quantity,
+        quantity_remaining=quantity,
+        unit_cost=unit_cost,
+        reference_type=reference_type,
+        reference_id=reference_id,
+    )
+
+
+def _layer_order():
+    return [F("received_at").asc(), F("id").asc()]
+
+
+def _log_uncovered(product_id, warehouse_id, quantity, left):
+    # Expected for stock received before cost layers existed; anything
+    # else means the layers drifted from InventoryStock
+    if left > 0:
+        log.warning(
+            "Cost layers covered %s of %s units for product %s in warehouse %s",
+            quantity - left, quantity, product_id, warehouse_id,
+        )
+
+
+def consume_cost_layers(*, product_id, warehouse_id, quantity):
+    """
+    Drain `quantity` units from the oldest open layers (FIFO) with one
+    SELECT and one bulk UPDATE. The caller must hold the stock row lock,
+    which is what serializes layer changes for the product/warehouse.
+
+    Returns the consumed slices as (quantity, unit_cost, received_at).
+    Stock received before cost layers existed has no layer; that part of
+    the quantity is simply not represented in the slices (and is logged).
+    """
+    layers = list(
+        StockCostLayer.objects
+        .filter(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            quantity_remaining__gt=0,
+        )
+        .annotate(
+            drained_before=Window(
+                Sum("quantity_remaining"),
+                order_by=_layer_order(),
+            ) - F("quantity_remaining"),
+        )
+        .filter(drained_before__lt=quantity)
+        .order_by("received_at", "id")
+    )
+
+    slices = []
+    left = quantity
+
+    for layer in layers:
+        take = min(layer.quantity_remaining, left)
+        layer.quantity_remaining -= take
+        left -= take
+        slices.append((take, layer.unit_cost, layer.received_at))
+
+    StockCostLayer.objects.bulk_update(layers, ["quantity_remaining"])
+    _log_uncovered(product_id, warehouse_id, quantity, left)
+
+    return slices
+
+
+
+@atomic_audit
 def stock_in_service(
     *,
     actor,
@@ -37,6 +562,8 @@ def stock_in_service(
     reason=None,
     reference_type="STOCK_IN",
     reference_id=None,
+    unit_cost=None,
+    concurrency=None,
 ):
     if not isinstance(actor, User):
         raise ValueError("actor must be a User instance")
@@ -48,26 +575,30 @@ def stock_in_service(
         reference_id = uuid4()
 
     product = Product.objects.get(id=product_id)
-    warehouse = Warehouse.objects.get(id=warehouse_id)
+    warehouse = Warehouse.objects.select_related("company").get(id=warehouse_id)
 
-    stock = _get_or_create_stock(product, warehouse)
-    old_stock = model_to_dict(stock)
-
-    new_quantity = stock.quantity + quantity
-    stock.quantity = new_quantity
-    stock.version += 1
-    stock.save()
+    old_stock, stock = _apply_stock_delta(product, warehouse, quantity, concurrency)
 
     ledger = InventoryLedger.objects.create(
         product=product,
         warehouse=warehouse,
         change=quantity,
-        balance_after=new_quantity,
+        balance_after=stock.quantity,
         reference_type=reference_type,
         reference_id=reference_id,
         reason=reason,
         created_by=actor,
     )
+    record_daily_balance(ledger)
+
+    add_cost_layer(
+        product_id=product.id,
+        warehouse_id=warehouse.id,
+        quantity=quantity,
+        unit_cost=product.cost_price if unit_cost is None else unit_cost,
+        reference_type=reference_type,
+        reference_id=reference_id,
+    )
 
     AuditLogger.log(
         entity="inventory_stock",
@@ -76,14 +607,14 @@ def stock_in_service(
         actor=actor,
         company=warehouse.company,
         old_data=old_stock,
-        new_data=model_to_dict(stock),
+        new_data=_stock_snapshot(stock),
     )
 
     return stock, ledger
 
 
 
-@transaction.atomic
+@atomic_audit
 def stock_out_service(
     *,
     actor,
@@ -93,6 +624,7 @@ def stock_out_service(
     reference_type="STOCK_OUT",
     reference_id=None,
     reason=None,
+    concurrency=None,
 ):
     if not isinstance(actor, User):
         raise ValueError("actor must be a User instance")
@@ -101,35 +633,30 @@ def stock_out_service(
         raise ValueError("Quantity must be positive")
 
     product = Product.objects.get(id=product_id)
-    warehouse = Warehouse.objects.get(id=warehouse_id)
+    warehouse = Warehouse.objects.select_related("company").get(id=warehouse_id)
 
-    stock = InventoryStock.objects.select_for_update().get(
-        product=product,
-        warehouse=warehouse
-    )
-
-    if stock.quantity < quantity:
-        raise ValueError("Insufficient stock")
     if reference_id is None:
         reference_id = uuid4()
 
-    old_stock = model_to_dict(stock)
+    old_stock, stock = _apply_stock_delta(product, warehouse, -quantity, concurrency)
 
-    new_quantity = stock.quantity - quantity
-    stock.quantity = new_quantity
-    stock.version += 1
-    stock.save()
-
-    InventoryLedger.objects.create(
+    ledger = InventoryLedger.objects.create(
         product=product,
         warehouse=warehouse,
         change=-quantity,
-        balance_after=new_quantity,
+        balance_after=stock.quantity,
         reference_type=reference_type,
         reference_id=reference_id,
         reason=reason,
         created_by=actor,
     )
+    record_daily_balance(ledger)
+
+    consume_cost_layers(
+        product_id=product.id,
+        warehouse_id=warehouse.id,
+        quantity=quantity,
+    )
 
     AuditLogger.log(
         entity="inventory_stock",
@@ -138,12 +665,12 @@ def stock_out_service(
         actor=actor,
         company=warehouse.company,
         old_data=old_stock,
-        new_data=model_to_dict(stock),
+        new_data=_stock_snapshot(stock),
     )
 
 
 
-@transaction.atomic
+@atomic_audit
 def bulk_stock_in_service(
     *,
     actor,
@@ -158,47 +685,67 @@ def bulk_stock_in_service(
     if not items:
         raise ValueError("No items provided")
 
-    # Lock warehouse
     try:
-        warehouse = (
-            Warehouse.objects
-            .select_for_update()
-            .get(id=warehouse_id, company=company)
-        )
-    except Warehouse.DoesNotExist:
+        warehouse = Warehouse.objects.get(id=warehouse_id, company=company)
+    except (Warehouse.DoesNotExist, ValidationError, ValueError):
         raise ValueError("Invalid warehouse for active company")
 
-    reference_id = uuid4()
-
+    lines = []
     for item in items:
-        product_id = item.get("product_id")
         quantity = int(item.get("quantity", 0))
-
         if quantity <= 0:
             raise ValueError("Quantity must be greater than zero")
+        lines.append((str(item.get("product_id")), quantity))
 
-        try:
-            product = Product.objects.get(
-                id=product_id,
-                deleted_at__isnull=True,
-            )
-        except Product.DoesNotExist:
-            raise ValueError("Invalid product")
+    product_ids = {product_id for product_id, _ in lines}
 
-        # Lock or create stock row
-        stock, _ = InventoryStock.objects.select_for_update().get_or_create(
-            product=product,
-            warehouse=warehouse,
-            defaults={"quantity": 0},
+    try:
+        products = {
+            str(p.id): p
+            for p in Product.objects.filter(
+                id__in=product_ids, company=company, deleted_at__isnull=True
+            )
+        }
+    except (ValueError, ValidationError):
+        raise ValueError("Invalid product")
+
+    if len(products) != len(product_ids):
+        raise ValueError("Invalid product")
+
+    # Create missing stock rows, then lock every affected row in one
+    # pk-ordered query so concurrent batches can't deadlock each other
+    InventoryStock.objects.bulk_create(
+        [
+            InventoryStock(product=p, warehouse=warehouse, quantity=0)
+            for p in products.values()
+        ],
+        ignore_conflicts=True,
+    )
+    stocks = {
+        str(s.product_id): s
+        for s in (
+            InventoryStock.objects
+            .select_for_update()
+            .filter(warehouse=warehouse, product_id__in=product_ids)
+            .order_by("id")
         )
+    }
 
-        old_stock = model_to_dict(stock)
+    reference_id = uuid4()
+    ledgers = []
+    layers = []
+    audits = []
+
+    for product_id, quantity in lines:
+        product = products[product_id]
+        stock = stocks[product_id]
+
+        old_stock = _stock_snapshot(stock)
 
         stock.quantity += quantity
         stock.version += 1
-        stock.save()
 
-        InventoryLedger.objects.create(
+        ledgers.append(InventoryLedger(
             product=product,
             warehouse=warehouse,
             change=quantity,
@@ -206,17 +753,33 @@ def bulk_stock_in_service(
             reference_type=reference,
             reference_id=reference_id,
             created_by=actor,
-        )
+        ))
 
-        AuditLogger.log(
-            entity="inventory_stock",
-            entity_id=stock.id,
-            action=AuditAction.UPDATE,
-            actor=actor,
-            company=warehouse.company,
-            old_data=old_stock,
-            new_data=model_to_dict(stock),
-        )
+        layers.append(StockCostLayer(
+            product=product,
+            warehouse=warehouse,
+            quantity_received=quantity,
+            quantity_remaining=quantity,
+            unit_cost=product.cost_price,
+            reference_type=reference,
+            reference_id=reference_id,
+        ))
+
+        audits.append({
+            "entity": "inventory_stock",
+            "entity_id": stock.id,
+            "action": AuditAction.UPDATE,
+            "actor": actor,
+            "company": company,
+            "old_data": old_stock,
+            "new_data": _stock_snapshot(stock),
+        })
+
+    InventoryStock.objects.bulk_update(stocks.values(), ["quantity", "version"])
+    InventoryLedger.objects.bulk_create(ledgers)
+    record_daily_balances(ledgers)
+    StockCostLayer.objects.bulk_create(layers)
+    AuditLogger.bulk_log(audits)
 
     return {
         "processed": len(items),
@@ -225,7 +788,7 @@ def bulk_stock_in_service(
 
 
 
-@transaction.atomic
+@atomic_audit
 def transfer_stock_service(
     *,
     actor,
@@ -246,24 +809,30 @@ def transfer_stock_service(
 
     product = Product.objects.get(id=product_id)
     from_wh = Warehouse.objects.get(id=from_warehouse_id)
-    to_wh = Warehouse.objects.get(id=to_warehouse_id)
+    to_wh = Warehouse.objects.select_related("company").get(id=to_warehouse_id)
 
     # ensure same company
     if from_wh.company_id != to_wh.company_id:
         raise ValueError("Cross-company transfer not allowed")
 
-    from_stock = _get_or_create_stock(product, from_wh)
-    if from_stock.quantity < quantity:
-        raise ValueError("Insufficient stock")
+    # Touch the two stock rows in a fixed (warehouse id) order so opposite
+    # transfers of the same product can't deadlock
+    stocks = {}
+    for warehouse_id, delta in sorted(
+        [(from_wh.id, -quantity), (to_wh.id, quantity)],
+        key=lambda m: str(m[0]),
+    ):
+        stocks[warehouse_id] = apply_stock_delta(
+            product_id=product.id,
+            warehouse_id=warehouse_id,
+            delta=delta,
+        )
 
-    to_stock = _get_or_create_stock(product, to_wh)
+    from_stock = stocks[from_wh.id]
+    to_stock = stocks[to_wh.id]
 
     # OUT
-    from_stock.quantity -= quantity
-    from_stock.version += 1
-    from_stock.save()
-
-    InventoryLedger.objects.create(
+    ledger = InventoryLedger.objects.create(
         product=product,
         warehouse=from_wh,
         change=-quantity,
@@ -273,13 +842,10 @@ def transfer_stock_service(
         reason=reason,
         created_by=actor,
     )
+    record_daily_balance(ledger)
 
     # IN
-    to_stock.quantity += quantity
-    to_stock.version += 1
-    to_stock.save()
-
-    InventoryLedger.objects.create(
+    ledger = InventoryLedger.objects.create(
         product=product,
         warehouse=to_wh,
         change=quantity,
@@ -289,6 +855,27 @@ def transfer_stock_service(
         reason=reason,
         created_by=actor,
     )
+    record_daily_balance(ledger)
+
+    # Layers move with the goods, keeping their cost and receipt date
+    slices = consume_cost_layers(
+        product_id=product.id,
+        warehouse_id=from_wh.id,
+        quantity=quantity,
+    )
+    StockCostLayer.objects.bulk_create([
+        StockCostLayer(
+            product=product,
+            warehouse=to_wh,
+            quantity_received=qty,
+            quantity_remaining=qty,
+            unit_cost=unit_cost,
+            reference_type="TRANSFER_IN",
+            reference_id=from_stock.id,
+            received_at=received_at,
+        )
+        for qty, unit_cost, received_at in slices
+    ])
 
     AuditLogger.log(
         entity="inventory_transfer",
@@ -303,7 +890,7 @@ def transfer_stock_service(
 
 
 
-@transaction.atomic
+@atomic_audit
 def request_order_service(
     *,
     warehouse_id,
@@ -363,7 +950,7 @@ def request_order_service(
 
 
 
-@transaction.atomic
+@atomic_audit
 def approve_order_service(*, order_id, actor):
     order = (
         InventoryOrder.objects
@@ -393,7 +980,7 @@ def approve_order_service(*, order_id, actor):
 
 
 
-@transaction.atomic
+@atomic_audit
 def reject_order_service(
     *,
     order_id,
@@ -427,52 +1014,249 @@ def reject_order_service(
     )
 
 
-def apply_grn(grn: GoodsReceiptNote):
-    for item in grn.items.all():
-        stock, _ = InventoryStock.objects.select_for_update().get_or_create(
-            product=item.product,
-            warehouse=grn.order.warehouse,
+def _lock_stock_rows(pairs):
+    """
+    Lock the stock rows for the given (product_id, warehouse_id) pairs in
+    one query, always in primary key order, so two batches touching the
+    same rows acquire the locks in the same order and can't deadlock.
+    """
+    condition = reduce(or_, (Q(product_id=p, warehouse_id=w) for p, w in pairs))
+
+    return {
+        (s.product_id, s.warehouse_id): s
+        for s in (
+            InventoryStock.objects
+            .select_for_update()
+            .filter(condition)
+            .order_by("id")
+        )
+    }
+
+
+def consume_cost_layers_bulk(demands):
+    """
+    consume_cost_layers for many (product_id, warehouse_id) -> quantity
+    demands at once: one SELECT of the layers that get drained (the same
+    running-sum window, partitioned per pair) and one bulk UPDATE.
+    """
+    condition = reduce(or_, (Q(product_id=p, warehouse_id=w) for p, w in demands))
+    demand = Case(
+        *(When(product_id=p, warehouse_id=w, then=Value(q)) for (p, w), q in demands.items()),
+        output_field=IntegerField(),
+    )
+
+    layers = list(
+        StockCostLayer.objects
+        .filter(condition, quantity_remaining__gt=0)
+        .annotate(
+            drained_before=Window(
+                Sum("quantity_remaining"),
+                partition_by=[F("product_id"), F("warehouse_id")],
+                order_by=_layer_order(),
+            ) - F("quantity_remaining"),
+            demand=demand,
         )
+        .filter(drained_before__lt=F("demand"))
+        .order_by("received_at", "id")
+    )
+
+    left = dict(demands)
+    for layer in layers:
+        key = (layer.product_id, layer.warehouse_id)
+        take = min(layer.quantity_remaining, left[key])
+        layer.quantity_remaining -= take
+        left[key] -= take
+
+    StockCostLayer.objects.bulk_update(layers, ["quantity_remaining"])
 
-        stock.quantity += item.received_quantity
+    for (product_id, warehouse_id), quantity in demands.items():
+        _log_uncovered(product_id, warehouse_id, quantity, left[(product_id, warehouse_id)])
+
+
+def apply_issues(issues):
+    """
+    Deduct stock for a batch of issues. Every line is validated against
+    the locked stock rows before anything is written; stock, ledger,
+    daily balance and cost layer writes are all bulk operations.
+    """
+    if not issues:
+        return
+
+    demands = Counter()
+    for issue in issues:
+        demands[(issue.product_id, issue.warehouse_id)] += issue.quantity
+
+    stocks = _lock_stock_rows(demands)
+
+    for key, quantity in demands.items():
+        stock = stocks.get(key)
+        if stock is None or stock.quantity - stock.reserved < quantity:
+            raise ValueError("Insufficient stock")
+
+    ledgers = _issue_ledgers(issues, stocks)
+
+    InventoryStock.objects.bulk_update(stocks.values(), ["quantity", "version"])
+    InventoryLedger.objects.bulk_create(ledgers)
+    record_daily_balances(ledgers)
+    consume_cost_layers_bulk(demands)
+
+
+def _issue_ledgers(issues, stocks):
+    """
+    Build the ledger rows for `issues`, walking each stock down from its
+    pre-issue quantity so balance_after is correct per line.
+    """
+    ledgers = []
+    for issue in issues:
+        stock = stocks[(issue.product_id, issue.warehouse_id)]
+        stock.quantity -= issue.quantity
         stock.version += 1
-        stock.save()
 
-        InventoryLedger.objects.create(
-            product=item.product,
-            warehouse=grn.order.warehouse,
-            change=item.received_quantity,
+        ledgers.append(InventoryLedger(
+            product_id=issue.product_id,
+            warehouse_id=issue.warehouse_id,
+            change=-issue.quantity,
             balance_after=stock.quantity,
-            reference_type="GRN",
-            reference_id=grn.id,
-            created_by=grn.received_by,
-        )
+            reference_type="ISSUE",
+            reference_id=issue.id,
+            created_by=issue.approved_by,
+        ))
+
+    return ledgers
 
 
 def apply_issue(issue: InventoryIssue):
-    stock = InventoryStock.objects.select_for_update().get(
-        product=issue.product,
-        warehouse=issue.warehouse,
-    )
+    apply_issues([issue])
 
-    if stock.quantity < issue.quantity:
-        raise ValueError("Insufficient stock")
 
-    stock.quantity -= issue.quantity
-    stock.version += 1
-    stock.save()
+def _reservation_order(key):
+    product_id, warehouse_id = key
+    return str(warehouse_id), str(product_id)
+
+
+def reserve_stock(*, demands, reference_type, reference_id, actor, expires_at=None):
+    """
+    Set aside (product_id, warehouse_id) -> quantity demands for an owner.
+    Each pair is one guarded UPDATE of InventoryStock.reserved against
+    quantity - reserved, applied in a fixed order; raises
+    ValueError("Insufficient stock") if any pair can't be covered.
+    """
+    if expires_at is None:
+        expires_at = now() + timedelta(
+            hours=getattr(settings, "INVENTORY_RESERVATION_TTL_HOURS", 48)
+        )
+
+    reservations = []
+    for key in sorted(demands, key=_reservation_order):
+        product_id, warehouse_id = key
+
+        apply_stock_delta(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            delta=0,
+            reserved_delta=demands[key],
+        )
+
+        reservations.append(StockReservation(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            quantity=demands[key],
+            reference_type=reference_type,
+            reference_id=reference_id,
+            created_by=actor,
+            expires_at=expires_at,
+        ))
+
+    StockReservation.objects.bulk_create(reservations)
+
+    return reservations
+
+
+def _reserved_totals(reservations):
+    totals = Counter()
+    for reservation in reservations:
+        totals[(reservation.product_id, reservation.warehouse_id)] += reservation.quantity
+    return totals
+
+
+def release_reservations(reservations, status=StockReservation.STATUS_RELEASED):
+    """
+    Hand reserved quantity back to available stock and close the
+    reservations with `status` (RELEASED or EXPIRED).
+    """
+    if not reservations:
+        return
+
+    totals = _reserved_totals(reservations)
+    for key in sorted(totals, key=_reservation_order):
+        product_id, warehouse_id = key
+        apply_stock_delta(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            delta=0,
+            reserved_delta=-totals[key],
+        )
+
+    StockReservation.objects.filter(
+        id__in=[r.id for r in reservations]
+    ).update(status=status)
+
+
+def consume_reservations(issues, reservations):
+    """
+    Turn active reservations into the issues' stock movements. Availability
+    was settled when the stock was reserved, so each product/warehouse is a
+    single UPDATE moving quantity and reserved down together, with no
+    re-check under a held lock. `issues` must add up to `reservations`.
+    """
+    demands = _reserved_totals(reservations)
+
+    stocks = {}
+    for key in sorted(demands, key=_reservation_order):
+        product_id, warehouse_id = key
+        stock = apply_stock_delta(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            delta=-demands[key],
+            reserved_delta=-demands[key],
+        )
+        # _issue_ledgers walks down from the pre-issue quantity
+        stock.quantity += demands[key]
+        stocks[key] = stock
+
+    ledgers = _issue_ledgers(issues, stocks)
+
+    InventoryLedger.objects.bulk_create(ledgers)
+    record_daily_balances(ledgers)
+    consume_cost_layers_bulk(demands)
+
+    StockReservation.objects.filter(
+        id__in=[r.id for r in reservations]
+    ).update(status=StockReservation.STATUS_CONSUMED)
 
-    InventoryLedger.objects.create(
-        product=issue.product,
-        warehouse=issue.warehouse,
-        change=-issue.quantity,
-        balance_after=stock.quantity,
-        reference_type="ISSUE",
-        reference_id=issue.id,
-        created_by=issue.approved_by,
-    )
 
 @transaction.atomic
+def expire_stock_reservations(*, batch_size=500):
+    """
+    Expire one batch of stale reservations. Rows another transaction is
+    consuming are skipped, so the sweeper never blocks slip execution.
+    Returns the number of reservations expired.
+    """
+    reservations = list(
+        StockReservation.objects
+        .select_for_update(skip_locked=True)
+        .filter(
+            status=StockReservation.STATUS_ACTIVE,
+            expires_at__lte=now(),
+        )
+        .order_by("expires_at")[:batch_size]
+    )
+
+    release_reservations(reservations, StockReservation.STATUS_EXPIRED)
+
+    return len(reservations)
+
+@atomic_audit
 def approve_issue(*, issue: InventoryIssue, actor):
     if not isinstance(actor, User):
         raise ValueError("actor must be a User instance")
@@ -499,7 +1283,7 @@ def approve_issue(*, issue: InventoryIssue, actor):
         "version": stock.version,
     }
 
-    if stock.quantity < issue.quantity:
+    if stock.quantity - stock.reserved < issue.quantity:
         raise ValueError("Insufficient stock")
 
     # stock.quantity -= issue.quantity
@@ -554,10 +1338,10 @@ def execute_issue(*, issue: InventoryIssue, actor):
     if issue.status != InventoryIssue.STATUS_APPROVED:
         raise ValueError("Issue not approved")
 
-    apply_issue(issue)
+    apply_issues([issue])
 
 
-@transaction.atomic
+@atomic_audit
 def reject_issue(*, issue: InventoryIssue, actor, reason=None):
     if not isinstance(actor, User):
         raise ValueError("actor must be a User instance")
@@ -599,7 +1383,7 @@ def reject_issue(*, issue: InventoryIssue, actor, reason=None):
 
 
 
-@transaction.atomic
+@atomic_audit
 def create_pr_service(*, actor, company, warehouse_id, items):
     pr = PurchaseRequisition.objects.create(
         company=company,
@@ -642,7 +1426,7 @@ def create_pr_service(*, actor, company, warehouse_id, items):
     return pr
 
 
-@transaction.atomic
+@atomic_audit
 def approve_pr_service(*, pr_id, actor):
     pr = PurchaseRequisition.objects.select_for_update().get(id=pr_id)
 
@@ -667,7 +1451,7 @@ def approve_pr_service(*, pr_id, actor):
     return pr
 
 
-@transaction.atomic
+@atomic_audit
 def reject_pr_service(*, pr_id, actor, reason=None):
     pr = PurchaseRequisition.objects.select_for_update().get(id=pr_id)
 
@@ -695,7 +1479,7 @@ def reject_pr_service(*, pr_id, actor, reason=None):
     return pr
 
 
-@transaction.atomic
+@atomic_audit
 def create_po_from_pr_service(*, pr_id, supplier_id, actor):
     pr = (
         PurchaseRequisition.objects
@@ -747,7 +1531,7 @@ def create_po_from_pr_service(*, pr_id, supplier_id, actor):
 
     return po
 
-@transaction.atomic
+@atomic_audit
 def approve_po_service(*, order_id, actor):
     po = InventoryOrder.objects.select_for_update().get(id=order_id)
 
@@ -772,7 +1556,7 @@ def approve_po_service(*, order_id, actor):
     return po
 
 
-@transaction.atomic
+@atomic_audit
 def reject_po_service(*, order_id, actor, reason=None):
     po = InventoryOrder.objects.select_for_update().get(id=order_id)
 
@@ -801,17 +1585,19 @@ def reject_po_service(*, order_id, actor, reason=None):
 
 
 def apply_grn(grn: GoodsReceiptNote):
+    rates = {
+        item.product_id: item.rate
+        for item in grn.order.items.all()
+    }
+
     for item in grn.items.all():
-        stock, _ = InventoryStock.objects.select_for_update().get_or_create(
-            product=item.product,
-            warehouse=grn.order.warehouse,
+        stock = apply_stock_delta(
+            product_id=item.product_id,
+            warehouse_id=grn.order.warehouse_id,
+            delta=item.received_quantity,
         )
 
-        stock.quantity += item.received_quantity
-        stock.version += 1
-        stock.save()
-
-        InventoryLedger.objects.create(
+        ledger = InventoryLedger.objects.create(
             product=item.product,
             warehouse=grn.order.warehouse,
             change=item.received_quantity,
@@ -820,9 +1606,19 @@ def apply_grn(grn: GoodsReceiptNote):
             reference_id=grn.id,
             created_by=grn.received_by,
         )
+        record_daily_balance(ledger)
+
+        add_cost_layer(
+            product_id=item.product_id,
+            warehouse_id=grn.order.warehouse_id,
+            quantity=item.received_quantity,
+            unit_cost=rates.get(item.product_id, item.product.cost_price),
+            reference_type="GRN",
+            reference_id=grn.id,
+        )
 
 
-@transaction.atomic
+@atomic_audit
 def create_grn_service(*, order_id, items, actor):
     if not items:
         raise ValueError("items required")
@@ -877,7 +1673,7 @@ def create_grn_service(*, order_id, items, actor):
     return grn
 
 
-@transaction.atomic
+@atomic_audit
 def approve_grn_service(*, grn_id, actor):
     grn = (
         GoodsReceiptNote.objects
@@ -914,7 +1710,7 @@ def approve_grn_service(*, grn_id, actor):
     return grn
 
 
-@transaction.atomic
+@atomic_audit
 def reject_grn_service(*, grn_id, actor, reason=None):
     grn = GoodsReceiptNote.objects.select_for_update().get(id=grn_id)
 
@@ -945,39 +1741,34 @@ from django.utils.timezone import now
 from django.db import transaction
 
 
-@transaction.atomic
+@atomic_audit
 def approve_issue_slip_service(*, slip_id, actor):
-    slip = IssueSlip.objects.select_for_update().get(id=slip_id)
+    slip = (
+        IssueSlip.objects
+        .select_for_update()
+        .prefetch_related("items")
+        .get(id=slip_id)
+    )
 
     if slip.status != IssueSlip.STATUS_PENDING:
         raise ValueError("Issue slip already processed")
 
+    demands = Counter()
+    for item in slip.items.all():
+        demands[(item.product_id, slip.warehouse_id)] += item.quantity
+
+    # Hold the stock now; execution converts these into the movements
+    reservations = reserve_stock(
+        demands=demands,
+        reference_type="ISSUE_SLIP",
+        reference_id=slip.id,
+        actor=actor,
+    )
+
     slip.status = IssueSlip.STATUS_APPROVED
     slip.approved_by = actor
     slip.save(update_fields=["status", "approved_by"])
 
-    for item in slip.items.all():
-        issue = InventoryIssue.objects.create(
-            product=item.product,
-            warehouse=slip.warehouse,
-            company=slip.company,
-            quantity=item.quantity,
-            issue_type="SLIP",
-            status=InventoryIssue.STATUS_APPROVED,
-            requested_by=slip.requested_by,
-            approved_by=actor,
-        )
-
-        AuditLogger.log(
-            entity="issue_create",
-            entity_id=slip.id,
-            action=AuditAction.CREATE,
-            actor=actor,
-            company=slip.company,
-            old_data={"issue_id": None},
-            new_data={"issue_id": issue.id},
-        )
-
     AuditLogger.log(
         entity="issue_slip",
         entity_id=slip.id,
@@ -985,13 +1776,16 @@ def approve_issue_slip_service(*, slip_id, actor):
         actor=actor,
         company=slip.company,
         old_data={"status": IssueSlip.STATUS_PENDING},
-        new_data={"status": IssueSlip.STATUS_APPROVED},
+        new_data={
+            "status": IssueSlip.STATUS_APPROVED,
+            "reservations": [str(r.id) for r in reservations],
+        },
     )
 
     return slip
 
 
-@transaction.atomic
+@atomic_audit
 def reject_issue_slip_service(*, slip_id, actor, reason=None):
     slip = IssueSlip.objects.select_for_update().get(id=slip_id)
 
@@ -1018,3 +1812,73 @@ def reject_issue_slip_service(*, slip_id, actor, reason=None):
     return slip
 
 
+@atomic_audit
+def execute_issue_slip_service(*, slip_id, actor):
+    slip = (
+        IssueSlip.objects
+        .select_for_update()
+        .prefetch_related("items")
+        .get(id=slip_id)
+    )
+
+    if slip.status != IssueSlip.STATUS_APPROVED:
+        raise ValueError("Only APPROVED slips can be executed")
+
+    approved_at = now()
+    issues = [
+        InventoryIssue(
+            issue_slip=slip,
+            product_id=item.product_id,
+            warehouse_id=slip.warehouse_id,
+            company_id=slip.company_id,
+            quantity=item.quantity,
+            issue_type=InventoryIssue.ISSUE_INTERNAL,
+            requested_by_id=slip.requested_by_id,
+            approved_by=actor,
+            status=InventoryIssue.STATUS_APPROVED,
+            approved_at=approved_at,
+        )
+        for item in slip.items.all()
+    ]
+
+    reservations = list(
+        StockReservation.objects
+        .select_for_update()
+        .filter(
+            reference_type="ISSUE_SLIP",
+            reference_id=slip.id,
+            status=StockReservation.STATUS_ACTIVE,
+        )
+    )
+
+    demands = Counter()
+    for issue in issues:
+        demands[(issue.product_id, issue.warehouse_id)] += issue.quantity
+
+    # 🔥 ACTUAL STOCK DEDUCTION
+    if reservations and _reserved_totals(reservations) == demands:
+        consume_reservations(issues, reservations)
+    else:
+        # Reservation expired (or slip approved before reservations existed):
+        # give back whatever is left and validate every line under the lock
+        release_reservations(reservations)
+        apply_issues(issues)
+
+    InventoryIssue.objects.bulk_create(issues)
+
+    slip.status = IssueSlip.STATUS_ISSUED
+    slip.save(update_fields=["status"])
+
+    AuditLogger.log(
+        entity="issue_slip",
+        entity_id=slip.id,
+        action=AuditAction.UPDATE,
+        actor=actor,
+        company=slip.company,
+        new_data={
+            "status": IssueSlip.STATUS_ISSUED,
+            "issue_count": len(issues),
+        },
+    )
+
+    return slip, issues
@@ -1,3 +1,1028 @@
-from django.test import TestCase
+import gzip
+import signal
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+from uuid import uuid4
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F, QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from company.models import Company, Product, Warehouse
+from core.audit.delta import expand_audit_rows
+from core.audit.models import AuditLog
+from inventory.models import (
+    InventoryCheckpoint,
+    InventoryDailyBalance,
+    InventoryLedger,
+    InventoryStock,
+    IssueSlip,
+    IssueSlipItem,
+    StockCostLayer,
+    StockReservation,
+)
+from inventory.group_commit import (
+    GroupCommitWriter,
+    _Movement,
+    group_stock_out,
+    install_shutdown_hooks,
+)
+from inventory.partitioning import (
+    archive_partitions,
+    ensure_partitions,
+    is_partitioned,
+    month_partitions,
+    partition_name,
+)
+from inventory.reconciliation import correct_drift, reconcile_warehouse
+from inventory.replay import build_shadow, replay_ledger, shadow_diff, swap_shadow
+from inventory.services import (
+    annotate_balance_at,
+    apply_stock_delta,
+    reserve_stock,
+    approve_issue_slip_service,
+    bulk_stock_in_service,
+    consume_cost_layers_bulk,
+    execute_issue_slip_service,
+    expire_stock_reservations,
+    release_reservations,
+    stock_in_service,
+    stock_out_service,
+    transfer_stock_service,
+    write_checkpoints,
+)
+from rbac.models import Role
+from reports.services import (
+    filter_ledger_dates,
+    get_inventory_aging_report,
+    get_inventory_valuation,
+    get_stock_as_of_queryset,
+)
+
+
+def _month(year, month):
+    return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+
+
+@skipUnless(connection.vendor == "postgresql", "Ledger partitioning is PostgreSQL-only")
+class LedgerPartitionPruningTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="owner", password="x")
+        self.company = Company.objects.create(name="Acme", created_by=user)
+        self.warehouse = Warehouse.objects.create(
+            company=self.company, name="Main", code="WH-MAIN"
+        )
+
+        ensure_partitions(start=_month(2025, 1))
+
+    def test_ledger_is_partitioned(self):
+        with connection.cursor() as cursor:
+            self.assertTrue(is_partitioned(cursor))
+
+    def test_movement_date_range_scans_one_month(self):
+        qs = filter_ledger_dates(
+            InventoryLedger.objects.filter(warehouse=self.warehouse),
+            "2025-03-10",
+            "2025-03-20",
+        )
+
+        plan = qs.explain()
+
+        self.assertIn(partition_name(_month(2025, 3)), plan)
+        self.assertNotIn(partition_name(_month(2025, 2)), plan)
+        self.assertNotIn(partition_name(_month(2025, 4)), plan)
+
+    def test_stock_as_of_skips_later_months(self):
+        at = datetime(2025, 3, 15, tzinfo=dt_timezone.utc)
+
+        plan = get_stock_as_of_queryset(company=self.company, at=at).explain()
+
+        self.assertIn(partition_name(_month(2025, 3)), plan)
+        self.assertNotIn(partition_name(_month(2025, 4)), plan)
+
+    def test_archive_dumps_then_drops_expired_months(self):
+        user = self.company.created_by
+        product = Product.objects.create(
+            company=self.company, sku="SKU-1", name="Bolt", unit="pcs"
+        )
+        InventoryStock.objects.create(product=product, warehouse=self.warehouse, quantity=5)
+        ledger = InventoryLedger.objects.create(
+            product=product,
+            warehouse=self.warehouse,
+            change=5,
+            balance_after=5,
+            reference_type="TEST",
+            reference_id=uuid4(),
+            created_by=user,
+        )
+        InventoryLedger.objects.filter(id=ledger.id).update(
+            created_at=datetime(2025, 1, 10, tzinfo=dt_timezone.utc)
+        )
+
+        # Keep everything from February 2025 on
+        today = timezone.now()
+        retention_months = (today.year - 2025) * 12 + today.month - 2
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            archived = archive_partitions(
+                retention_months=retention_months, archive_dir=archive_dir
+            )
+
+            self.assertEqual([(name, rows) for name, _, rows in archived], [(partition_name(_month(2025, 1)), 1)])
+            with gzip.open(archived[0][1], "rt") as fileobj:
+                self.assertEqual(len(fileobj.read().splitlines()), 2)  # header and the row
+
+        with connection.cursor() as cursor:
+            months = [month for month, _ in month_partitions(cursor)]
+        self.assertNotIn(_month(2025, 1), months)
+        self.assertIn(_month(2025, 2), months)
+
+        # The archived balance lives on in a checkpoint at the cut-off
+        checkpoint = InventoryCheckpoint.objects.get(product=product)
+        self.assertEqual((checkpoint.at, checkpoint.balance), (_month(2025, 2), 5))
+
+
+class StockTestCase(TestCase):
+    """
+    A company with one user, two warehouses and a product; the stock
+    services are called directly.
+    """
+    def setUp(self):
+        Role.objects.get_or_create(name="Viewer")  # new users get this role
+
+        self.user = User.objects.create_user(username="owner", password="x")
+        self.company = Company.objects.create(name="Acme", created_by=self.user)
+        self.warehouse = Warehouse.objects.create(
+            company=self.company, name="Main", code="WH-MAIN"
+        )
+        self.other_warehouse = Warehouse.objects.create(
+            company=self.company, name="Spare", code="WH-SPARE"
+        )
+        self.product = self._product()
+
+    def _product(self, **fields):
+        return Product.objects.create(
+            company=self.company,
+            sku=f"SKU-{uuid4().hex[:8]}",
+            name=fields.pop("name", f"Product {uuid4().hex[:4]}"),
+            unit="pcs",
+            **fields,
+        )
+
+    def _stock_in(self, quantity, product=None, warehouse=None, **kwargs):
+        return stock_in_service(
+            actor=self.user,
+            product_id=(product or self.product).id,
+            warehouse_id=(warehouse or self.warehouse).id,
+            quantity=quantity,
+            **kwargs,
+        )
+
+    def _stock(self, product=None, warehouse=None):
+        return InventoryStock.objects.get(
+            product=product or self.product, warehouse=warehouse or self.warehouse
+        )
+
+
+class FifoCostLayerTests(StockTestCase):
+    def _layers(self, product=None):
+        return list(
+            StockCostLayer.objects
+            .filter(product=product or self.product, warehouse=self.warehouse)
+            .order_by("received_at", "id")
+            .values_list("quantity_remaining", flat=True)
+        )
+
+    def _receive(self, quantity, unit_cost, product=None, days_ago=0):
+        reference_id = uuid4()
+        self._stock_in(
+            quantity, product=product, unit_cost=Decimal(unit_cost), reference_id=reference_id
+        )
+        StockCostLayer.objects.filter(reference_id=reference_id).update(
+            received_at=datetime(2025, 1, 10, tzinfo=dt_timezone.utc) - timedelta(days=days_ago)
+        )
+
+    def test_stock_out_drains_oldest_layers_first(self):
+        self._receive(5, "2.00", days_ago=3)
+        self._receive(5, "3.00", days_ago=2)
+        self._receive(5, "4.00", days_ago=1)
+
+        stock_out_service(
+            actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=7
+        )
+
+        self.assertEqual(self._layers(), [0, 3, 5])
+
+        row = get_inventory_valuation(self.company).get()
+        self.assertEqual(row["quantity"], 8)
+        self.assertEqual(row["total_value"], Decimal("29.00"))
+
+    def test_bulk_consume_drains_each_pair_fifo(self):
+        other = self._product()
+        self._receive(4, "1.00", days_ago=3)
+        self._receive(4, "1.00", product=other, days_ago=2)
+        self._receive(4, "1.00", days_ago=1)
+        self._receive(4, "1.00", product=other, days_ago=0)
+
+        consume_cost_layers_bulk({
+            (self.product.id, self.warehouse.id): 6,
+            (other.id, self.warehouse.id): 1,
+        })
+
+        self.assertEqual(self._layers(), [0, 2])
+        self.assertEqual(self._layers(other), [3, 4])
+
+    def test_bulk_consume_logs_uncovered_demand(self):
+        self._receive(2, "1.00")
+
+        with self.assertLogs("inventory.services", level="WARNING") as logs:
+            consume_cost_layers_bulk({(self.product.id, self.warehouse.id): 5})
+
+        self.assertEqual(self._layers(), [0])
+        self.assertIn("covered 2 of 5 units", logs.output[0])
+
+
+class DailyBalanceTests(StockTestCase):
+    def _balances(self):
+        return sorted(
+            InventoryDailyBalance.objects.values_list(
+                "warehouse_id", "date", "closing", "quantity_in", "quantity_out"
+            )
+        )
+
+    def test_movements_fold_into_one_row_per_day(self):
+        self._stock_in(10)
+        stock_out_service(
+            actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=3
+        )
+        transfer_stock_service(
+            actor=self.user,
+            product_id=self.product.id,
+            from_warehouse_id=self.warehouse.id,
+            to_warehouse_id=self.other_warehouse.id,
+            quantity=2,
+        )
+
+        today = timezone.now().astimezone(dt_timezone.utc).date()
+        self.assertEqual(
+            self._balances(),
+            sorted([
+                (self.warehouse.id, today, 5, 10, 5),
+                (self.other_warehouse.id, today, 2, 2, 0),
+            ]),
+        )
+
+    def test_backfill_rebuilds_the_same_rows(self):
+        self._stock_in(10)
+        self._stock_in(4, warehouse=self.other_warehouse)
+        stock_out_service(
+            actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=3
+        )
+        before = self._balances()
+
+        InventoryDailyBalance.objects.all().delete()
+        call_command("backfill_daily_balances", chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(self._balances(), before)
+
+    def test_backfill_keeps_archived_days(self):
+        _, archived = self._stock_in(10)
+        day = datetime(2025, 1, 10, tzinfo=dt_timezone.utc)
+        InventoryLedger.objects.filter(id=archived.id).update(created_at=day)
+        InventoryDailyBalance.objects.update(date=day.date())
+        self._stock_in(4)
+        before = self._balances()
+
+        # The January partition was archived
+        InventoryLedger.objects.filter(id=archived.id).delete()
+        call_command("backfill_daily_balances", stdout=StringIO())
+
+        self.assertEqual(self._balances(), before)
+
+
+class LedgerCheckpointTests(StockTestCase):
+    """
+    Movements on Jan 10, exactly on the Feb 1 boundary and on Feb 10,
+    with a checkpoint at Feb 1.
+    """
+    def setUp(self):
+        super().setUp()
+        for at, quantity in (
+            (datetime(2025, 1, 10, tzinfo=dt_timezone.utc), 10),
+            (_month(2025, 2), 3),
+            (datetime(2025, 2, 10, tzinfo=dt_timezone.utc), 5),
+        ):
+            _, ledger = self._stock_in(quantity)
+            InventoryLedger.objects.filter(id=ledger.id).update(created_at=at)
+
+        self.stock = self._stock()
+        write_checkpoints(stock_ids=[self.stock.id], at=_month(2025, 2))
+
+    def _balance(self, at, **kwargs):
+        qs = InventoryStock.objects.filter(id=self.stock.id)
+        return annotate_balance_at(qs, at, **kwargs).get().balance_at
+
+    def _tamper(self, balance):
+        # A checkpoint that disagrees with the ledger shows whether it was read
+        InventoryCheckpoint.objects.filter(at=_month(2025, 2)).update(balance=balance)
+
+    def test_checkpoint_holds_the_balance_before_the_boundary(self):
+        write_checkpoints(stock_ids=[self.stock.id], at=_month(2025, 3))
+
+        self.assertEqual(
+            list(InventoryCheckpoint.objects.order_by("at").values_list("at", "balance")),
+            [(_month(2025, 2), 10), (_month(2025, 3), 18)],
+        )
+
+    def test_later_checkpoints_build_on_earlier_ones(self):
+        self._tamper(100)
+
+        write_checkpoints(stock_ids=[self.stock.id], at=_month(2025, 3))
+
+        self.assertEqual(InventoryCheckpoint.objects.get(at=_month(2025, 3)).balance, 108)
+
+    def test_balance_after_a_checkpoint_starts_from_it(self):
+        self._tamper(100)
+
+        self.assertEqual(self._balance(datetime(2025, 2, 15, tzinfo=dt_timezone.utc)), 108)
+
+    def test_balance_before_the_first_checkpoint_sums_the_ledger(self):
+        self._tamper(100)
+
+        self.assertEqual(self._balance(datetime(2025, 1, 20, tzinfo=dt_timezone.utc)), 10)
+        self.assertEqual(self._balance(datetime(2025, 1, 1, tzinfo=dt_timezone.utc)), 0)
+
+    def test_balance_on_the_boundary(self):
+        boundary = _month(2025, 2)
+
+        # The checkpoint covers rows before the boundary; the row stamped
+        # exactly on it is read from the ledger
+        self.assertEqual(self._balance(boundary), 13)
+        self.assertEqual(self._balance(boundary, inclusive=False), 10)
+
+        self._tamper(100)
+        self.assertEqual(self._balance(boundary), 103)
+        self.assertEqual(self._balance(boundary, inclusive=False, rebuild=True), 10)
+
+
+class InventoryAgingTests(StockTestCase):
+    def test_age_comes_from_the_oldest_open_layer(self):
+        self._stock_in(5)
+        self._stock_in(5)
+        StockCostLayer.objects.filter(product=self.product).update(received_at=timezone.now())
+        oldest = StockCostLayer.objects.filter(product=self.product).order_by("id").first()
+        oldest.received_at = timezone.now() - timedelta(days=45)
+        oldest.save()
+
+        stale = self._product(name="Z stale")
+        InventoryStock.objects.create(product=stale, warehouse=self.warehouse, quantity=3)
+
+        with self.assertNumQueries(1):
+            rows = get_inventory_aging_report(self.company)
+
+        self.assertEqual(
+            [(r["product_id"], r["age_days"], r["bucket"]) for r in rows],
+            [(self.product.id, 45, "31–60"), (stale.id, None, "UNKNOWN")],
+        )
+
+    def test_drained_layers_no_longer_count(self):
+        self._stock_in(5)
+        StockCostLayer.objects.update(received_at=timezone.now() - timedelta(days=100))
+        stock_out_service(
+            actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=5
+        )
+        self._stock_in(2)
+
+        row, = get_inventory_aging_report(self.company)
+        self.assertEqual(row["bucket"], "0–30")
+
+
+class BulkStockInTests(StockTestCase):
+    def _bulk(self, items):
+        return bulk_stock_in_service(
+            actor=self.user, company=self.company, warehouse_id=self.warehouse.id, items=items
+        )
+
+    def test_lines_for_one_product_accumulate(self):
+        self._stock_in(2)
+        other = self._product()
+
+        self._bulk([
+            {"product_id": self.product.id, "quantity": 3},
+            {"product_id": other.id, "quantity": 4},
+            {"product_id": self.product.id, "quantity": 5},
+        ])
+
+        self.assertEqual(self._stock().quantity, 10)
+        self.assertEqual(self._stock(other).quantity, 4)
+        self.assertEqual(
+            list(
+                InventoryLedger.objects
+                .filter(product=self.product, reference_type="BULK_STOCK_IN")
+                .order_by("balance_after")
+                .values_list("change", "balance_after")
+            ),
+            [(3, 5), (5, 10)],
+        )
+        self.assertEqual(StockCostLayer.objects.filter(reference_type="BULK_STOCK_IN").count(), 3)
+
+    def test_invalid_product_writes_nothing(self):
+        with self.assertRaisesMessage(ValueError, "Invalid product"):
+            self._bulk([
+                {"product_id": self.product.id, "quantity": 3},
+                {"product_id": uuid4(), "quantity": 1},
+            ])
+
+        self.assertFalse(InventoryLedger.objects.exists())
+
+    def test_query_count_is_constant_in_lines(self):
+        products = [self._product() for _ in range(12)]
+
+        def queries(batch):
+            with CaptureQueriesContext(connection) as ctx:
+                self._bulk([{"product_id": p.id, "quantity": 1} for p in batch])
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries(products[:2]), queries(products[2:]))
+
+
+class IssueSlipTestCase(StockTestCase):
+    def _slip(self, *lines, status=IssueSlip.STATUS_PENDING):
+        slip = IssueSlip.objects.create(
+            warehouse=self.warehouse,
+            company=self.company,
+            requested_by=self.user,
+            purpose="Maintenance",
+            status=status,
+        )
+        for product, quantity in lines:
+            IssueSlipItem.objects.create(slip=slip, product=product, quantity=quantity)
+        return slip
+
+
+class IssueSlipExecutionTests(IssueSlipTestCase):
+    def test_lines_are_applied_in_one_batch(self):
+        other = self._product()
+        self._stock_in(10)
+        self._stock_in(4, product=other)
+        # Approved before reservations existed: validated at execution
+        slip = self._slip((self.product, 3), (other, 4), (self.product, 2), status=IssueSlip.STATUS_APPROVED)
+
+        _, issues = execute_issue_slip_service(slip_id=slip.id, actor=self.user)
+
+        slip.refresh_from_db()
+        self.assertEqual(slip.status, IssueSlip.STATUS_ISSUED)
+        self.assertEqual(len(issues), 3)
+        self.assertEqual(self._stock().quantity, 5)
+        self.assertEqual(self._stock(other).quantity, 0)
+        self.assertEqual(
+            sorted(
+                InventoryLedger.objects
+                .filter(product=self.product, reference_type="ISSUE")
+                .values_list("change", "balance_after")
+            ),
+            [(-3, 7), (-2, 5)],
+        )
+
+    def test_insufficient_line_rejects_the_whole_slip(self):
+        other = self._product()
+        self._stock_in(10)
+        self._stock_in(1, product=other)
+        slip = self._slip((self.product, 3), (other, 2), status=IssueSlip.STATUS_APPROVED)
+
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            execute_issue_slip_service(slip_id=slip.id, actor=self.user)
+
+        self.assertEqual(self._stock().quantity, 10)
+        self.assertFalse(InventoryLedger.objects.filter(reference_type="ISSUE").exists())
+
+    def test_pending_slip_cannot_be_executed(self):
+        slip = self._slip((self.product, 1))
+
+        with self.assertRaisesMessage(ValueError, "Only APPROVED slips can be executed"):
+            execute_issue_slip_service(slip_id=slip.id, actor=self.user)
+
+
+@override_settings(INVENTORY_STOCK_CONCURRENCY="optimistic")
+class OptimisticStockTests(StockTestCase):
+    def _stock_out(self, quantity):
+        return stock_out_service(
+            actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=quantity
+        )
+
+    def test_movements_bump_the_version(self):
+        self._stock_in(5)
+        self._stock_out(2)
+
+        stock = self._stock()
+        self.assertEqual((stock.quantity, stock.version), (3, 3))
+
+    def test_reserved_stock_is_not_available(self):
+        self._stock_in(5)
+        InventoryStock.objects.update(reserved=4)
+
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            self._stock_out(2)
+
+    def test_version_conflict_is_retried(self):
+        self._stock_in(5)
+        real_first = QuerySet.first
+        calls = []
+
+        def stale_first(qs):
+            stock = real_first(qs)
+            if isinstance(stock, InventoryStock) and not calls:
+                calls.append(stock)
+                # Another writer commits between our read and our UPDATE
+                InventoryStock.objects.filter(id=stock.id).update(
+                    quantity=F("quantity") + 1, version=F("version") + 1
+                )
+            return stock
+
+        with mock.patch.object(QuerySet, "first", stale_first):
+            self._stock_out(2)
+
+        stock = self._stock()
+        self.assertEqual((stock.quantity, stock.version), (4, 4))
+
+    @override_settings(INVENTORY_OPTIMISTIC_RETRIES=0)
+    def test_gives_up_after_the_retries(self):
+        self._stock_in(5, concurrency="pessimistic")
+
+        with self.assertRaisesMessage(ValueError, "concurrently"):
+            self._stock_out(2)
+
+
+class ApplyStockDeltaTests(StockTestCase):
+    def _apply(self, delta, reserved_delta=0):
+        return apply_stock_delta(
+            product_id=self.product.id,
+            warehouse_id=self.warehouse.id,
+            delta=delta,
+            reserved_delta=reserved_delta,
+        )
+
+    def test_stock_in_creates_the_row(self):
+        with self.assertNumQueries(1):
+            stock = self._apply(5)
+
+        self.assertEqual((stock.quantity, stock.reserved, stock.version), (5, 0, 1))
+        self.assertEqual(self._stock().id, stock.id)
+
+    def test_each_movement_is_one_statement(self):
+        self._apply(5)
+
+        with self.assertNumQueries(1):
+            stock = self._apply(-2)
+
+        self.assertEqual((stock.quantity, stock.version), (3, 2))
+        self.assertEqual(self._stock().quantity, 3)
+
+    def test_guard_keeps_quantity_above_reserved(self):
+        self._apply(5)
+        self._apply(0, reserved_delta=4)
+
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            self._apply(-2)
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            self._apply(0, reserved_delta=2)
+
+        stock = self._apply(-4, reserved_delta=-4)
+        self.assertEqual((stock.quantity, stock.reserved), (1, 0))
+
+    def test_stock_out_without_a_row_fails(self):
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            self._apply(-1)
+        self.assertFalse(InventoryStock.objects.exists())
+
+
+class GroupCommitTests(TransactionTestCase):
+    """
+    The writer thread commits on its own connection, so these run
+    outside the per-test transaction.
+    """
+    def setUp(self):
+        Role.objects.get_or_create(name="Viewer")
+
+        self.user = User.objects.create_user(username="owner", password="x")
+        self.company = Company.objects.create(name="Acme", created_by=self.user)
+        self.warehouse = Warehouse.objects.create(
+            company=self.company, name="Main", code="WH-MAIN"
+        )
+        self.product = Product.objects.create(
+            company=self.company, sku="SKU-1", name="Bolt", unit="pcs"
+        )
+        stock_in_service(
+            actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=10
+        )
+
+        self.writer = GroupCommitWriter(max_batch=50, max_wait=0.2)
+        self.addCleanup(self.writer.stop)
+
+        self.batches = []
+        commit = self.writer._commit
+
+        def recording_commit(batch):
+            self.batches.append(len(batch))
+            return commit(batch)
+
+        self.writer._commit = recording_commit
+
+    def _movement(self, change, product_id=None):
+        return _Movement(
+            actor=self.user,
+            product_id=product_id or self.product.id,
+            warehouse_id=self.warehouse.id,
+            change=change,
+            reason=None,
+            reference_type="STOCK_IN" if change > 0 else "STOCK_OUT",
+            reference_id=None,
+        )
+
+    def _quantity(self):
+        return InventoryStock.objects.get(product=self.product, warehouse=self.warehouse).quantity
+
+    def test_movements_within_the_window_commit_together(self):
+        futures = [self.writer.submit(self._movement(change)) for change in (-2, 5, -3)]
+
+        results = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(self.batches, [3])
+        self.assertEqual([stock["quantity"] for stock, _ in results], [8, 13, 10])
+        self.assertEqual(self._quantity(), 10)
+        self.assertEqual(
+            InventoryLedger.objects.filter(reference_type__in=["STOCK_IN", "STOCK_OUT"]).count(), 4
+        )
+
+    def test_a_failing_movement_fails_alone(self):
+        futures = [
+            self.writer.submit(self._movement(-4)),
+            self.writer.submit(self._movement(-7)),
+            self.writer.submit(self._movement(1, product_id=uuid4())),
+            self.writer.submit(self._movement(-6)),
+        ]
+
+        self.assertEqual(futures[0].result(timeout=5)[0]["quantity"], 6)
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            futures[1].result(timeout=5)
+        with self.assertRaisesMessage(ValueError, "Invalid product or warehouse"):
+            futures[2].result(timeout=5)
+        self.assertEqual(futures[3].result(timeout=5)[0]["quantity"], 0)
+
+        self.assertEqual(self._quantity(), 0)
+
+    def test_stop_commits_what_is_queued_and_closes_the_writer(self):
+        futures = [self.writer.submit(self._movement(-1)) for _ in range(3)]
+
+        self.writer.stop()
+
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(self._quantity(), 7)
+        self.assertIsNone(self.writer.submit(self._movement(-1)))
+
+    def test_closed_writer_falls_back_to_the_service(self):
+        self.writer.stop()
+
+        with mock.patch("inventory.group_commit.get_writer", return_value=self.writer):
+            group_stock_out(
+                actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=4
+            )
+
+        self.assertEqual(self._quantity(), 6)
+        self.assertEqual(self.batches, [])
+
+    def test_callers_inside_a_transaction_use_the_service(self):
+        with mock.patch("inventory.group_commit.get_writer") as get_writer:
+            with transaction.atomic():
+                group_stock_out(
+                    actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=4
+                )
+
+        get_writer.assert_not_called()
+        self.assertEqual(self._quantity(), 6)
+
+    def test_sigterm_drains_the_writer_before_the_previous_handler(self):
+        future = self.writer.submit(self._movement(-1))
+        previous = mock.Mock()
+
+        with mock.patch("inventory.group_commit._writer", self.writer), \
+                mock.patch("inventory.group_commit._hooks_installed", False), \
+                mock.patch("signal.getsignal", return_value=previous), \
+                mock.patch("signal.signal") as set_handler:
+            install_shutdown_hooks()
+            handler = set_handler.call_args.args[1]
+            handler(signal.SIGTERM, None)
+
+        self.assertTrue(future.done())
+        previous.assert_called_once_with(signal.SIGTERM, None)
+        self.assertIsNone(self.writer.submit(self._movement(-1)))
+
+
+class StockReservationTests(IssueSlipTestCase):
+    def _reservations(self):
+        return list(StockReservation.objects.values_list("quantity", "status"))
+
+    def test_approval_reserves_the_slip(self):
+        self._stock_in(10)
+        slip = self._slip((self.product, 4), (self.product, 2))
+
+        approve_issue_slip_service(slip_id=slip.id, actor=self.user)
+
+        stock = self._stock()
+        self.assertEqual((stock.quantity, stock.reserved), (10, 6))
+        self.assertEqual(self._reservations(), [(6, StockReservation.STATUS_ACTIVE)])
+
+        # Only the unreserved part can leave through other movements
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            stock_out_service(
+                actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=5
+            )
+
+    def test_approval_fails_without_available_stock(self):
+        other = self._product()
+        self._stock_in(10)
+        self._stock_in(1, product=other)
+        slip = self._slip((self.product, 4), (other, 2))
+
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            with transaction.atomic():
+                approve_issue_slip_service(slip_id=slip.id, actor=self.user)
+
+        self.assertEqual(self._stock().reserved, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_execution_consumes_the_reservation(self):
+        self._stock_in(10)
+        slip = self._slip((self.product, 4), (self.product, 2))
+        approve_issue_slip_service(slip_id=slip.id, actor=self.user)
+
+        execute_issue_slip_service(slip_id=slip.id, actor=self.user)
+
+        stock = self._stock()
+        self.assertEqual((stock.quantity, stock.reserved), (4, 0))
+        self.assertEqual(self._reservations(), [(6, StockReservation.STATUS_CONSUMED)])
+        self.assertEqual(
+            sorted(
+                InventoryLedger.objects
+                .filter(reference_type="ISSUE")
+                .values_list("change", "balance_after")
+            ),
+            [(-4, 6), (-2, 4)],
+        )
+
+    def test_release_hands_the_stock_back(self):
+        self._stock_in(10)
+        slip = self._slip((self.product, 4))
+        approve_issue_slip_service(slip_id=slip.id, actor=self.user)
+
+        release_reservations(list(StockReservation.objects.all()))
+
+        self.assertEqual(self._stock().reserved, 0)
+        self.assertEqual(self._reservations(), [(4, StockReservation.STATUS_RELEASED)])
+
+    def test_expired_reservations_are_released(self):
+        self._stock_in(10)
+        slip = self._slip((self.product, 4))
+        approve_issue_slip_service(slip_id=slip.id, actor=self.user)
+        fresh = self._slip((self.product, 1))
+        approve_issue_slip_service(slip_id=fresh.id, actor=self.user)
+        StockReservation.objects.filter(reference_id=slip.id).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        self.assertEqual(expire_stock_reservations(), 1)
+
+        self.assertEqual(self._stock().reserved, 1)
+        self.assertEqual(
+            StockReservation.objects.get(reference_id=slip.id).status,
+            StockReservation.STATUS_EXPIRED,
+        )
+
+        # The slip can still run; its lines are checked against available stock
+        execute_issue_slip_service(slip_id=slip.id, actor=self.user)
+        stock = self._stock()
+        self.assertEqual((stock.quantity, stock.reserved), (6, 1))
+
+
+class ReconciliationTests(StockTestCase):
+    def test_consistent_warehouse(self):
+        self._stock_in(5)
+        stock_out_service(
+            actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=2
+        )
+
+        report = reconcile_warehouse(self.warehouse.id)
+
+        self.assertEqual(report["pairs"], 1)
+        self.assertEqual(report["drift"], [])
+        self.assertEqual(report["chain_breaks"], [])
+
+    def test_drift_is_corrected_on_the_ledger(self):
+        self._stock_in(5)
+        InventoryStock.objects.filter(product=self.product).update(quantity=7)
+        version = self._stock().version
+
+        [drift] = reconcile_warehouse(self.warehouse.id)["drift"]
+        self.assertEqual(
+            (drift["stock_quantity"], drift["ledger_total"], drift["difference"]), (7, 5, 2)
+        )
+
+        ledger = correct_drift(
+            product_id=self.product.id, warehouse_id=self.warehouse.id, actor=self.user
+        )
+
+        self.assertEqual((ledger.change, ledger.balance_after), (2, 7))
+        self.assertEqual(self._stock().version, version + 1)
+        self.assertEqual(reconcile_warehouse(self.warehouse.id)["drift"], [])
+        self.assertIsNone(correct_drift(
+            product_id=self.product.id, warehouse_id=self.warehouse.id, actor=self.user
+        ))
+
+    def test_chain_break(self):
+        self._stock_in(5)
+        _, ledger = self._stock_in(3)
+        InventoryLedger.objects.filter(id=ledger.id).update(balance_after=9)
+
+        [chain_break] = reconcile_warehouse(self.warehouse.id)["chain_breaks"]
+
+        self.assertEqual(chain_break["ledger_id"], str(ledger.id))
+        self.assertEqual(chain_break["expected_balance_after"], 8)
+
+    def _archive_january(self):
+        # January's movement was archived after a checkpoint at the cut-off
+        _, ledger = self._stock_in(10)
+        InventoryLedger.objects.filter(id=ledger.id).update(
+            created_at=datetime(2025, 1, 10, tzinfo=dt_timezone.utc)
+        )
+        write_checkpoints(stock_ids=[self._stock().id], at=_month(2025, 2))
+        InventoryLedger.objects.filter(id=ledger.id).delete()
+
+    def test_truncated_ledger_starts_from_the_checkpoint(self):
+        self._archive_january()
+        self._stock_in(3)
+
+        report = reconcile_warehouse(self.warehouse.id)
+
+        self.assertEqual(report["drift"], [])
+        self.assertEqual(report["chain_breaks"], [])
+        self.assertIsNone(correct_drift(
+            product_id=self.product.id, warehouse_id=self.warehouse.id, actor=self.user
+        ))
+
+    def test_drift_on_a_truncated_ledger(self):
+        self._archive_january()
+        self._stock_in(3)
+        InventoryStock.objects.filter(product=self.product).update(quantity=15)
+
+        [drift] = reconcile_warehouse(self.warehouse.id)["drift"]
+        self.assertEqual((drift["ledger_total"], drift["difference"]), (13, 2))
+
+        ledger = correct_drift(
+            product_id=self.product.id, warehouse_id=self.warehouse.id, actor=self.user
+        )
+
+        self.assertEqual((ledger.change, ledger.balance_after), (2, 15))
+        self.assertEqual(reconcile_warehouse(self.warehouse.id), {
+            "warehouse_id": str(self.warehouse.id), "pairs": 1, "drift": [], "chain_breaks": [],
+        })
+
+
+class LedgerReplayTests(StockTestCase):
+    def test_replay_nets_each_pair(self):
+        self._stock_in(5)
+        self._stock_in(2, warehouse=self.other_warehouse)
+        stock_out_service(
+            actor=self.user, product_id=self.product.id, warehouse_id=self.warehouse.id, quantity=3
+        )
+
+        replay = replay_ledger()
+
+        self.assertEqual(replay.rows, 3)
+        self.assertEqual(replay.balances, {
+            self.product.id.bytes + self.warehouse.id.bytes: 2,
+            self.product.id.bytes + self.other_warehouse.id.bytes: 2,
+        })
+        self.assertEqual(len(replay.tail_ids), 3)
+
+    def test_cutoff(self):
+        _, ledger = self._stock_in(5)
+        InventoryLedger.objects.filter(id=ledger.id).update(
+            created_at=datetime(2025, 1, 10, tzinfo=dt_timezone.utc)
+        )
+        self._stock_in(2)
+
+        replay = replay_ledger(cutoff=datetime(2025, 2, 1, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(replay.balances, {self.product.id.bytes + self.warehouse.id.bytes: 5})
+
+    def test_truncated_ledger_starts_from_the_checkpoint(self):
+        january = datetime(2025, 1, 10, tzinfo=dt_timezone.utc)
+        self._stock_in(5)
+        self._stock_in(4, warehouse=self.other_warehouse)
+        InventoryLedger.objects.update(created_at=january)
+        write_checkpoints(
+            stock_ids=InventoryStock.objects.values("id"), at=_month(2025, 2)
+        )
+        InventoryLedger.objects.all().delete()  # January was archived
+        self._stock_in(2)
+
+        replay = replay_ledger()
+
+        self.assertEqual(replay.rows, 1)
+        self.assertEqual(replay.balances, {
+            self.product.id.bytes + self.warehouse.id.bytes: 7,
+            self.product.id.bytes + self.other_warehouse.id.bytes: 4,
+        })
+
+
+@skipUnless(connection.vendor == "postgresql", "Stock replay is PostgreSQL-only")
+class ShadowSwapTests(StockTestCase):
+    def _index_names(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s",
+                [InventoryStock._meta.db_table],
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_swap_keeps_rows_and_index_names(self):
+        self._stock_in(5)
+        stock = self._stock()
+        InventoryStock.objects.filter(id=stock.id).update(quantity=9, reserved=2)
+        indexes = self._index_names()
+
+        build_shadow(replay_ledger().balances)
+        self.assertEqual(len(shadow_diff()), 1)
+        swap_shadow(drop_old=True)
+
+        swapped = self._stock()
+        self.assertEqual((swapped.id, swapped.quantity, swapped.reserved), (stock.id, 5, 2))
+        self.assertEqual(self._index_names(), indexes)
+
+    def test_over_reserved_pair_refuses(self):
+        self._stock_in(5)
+        InventoryStock.objects.filter(product=self.product).update(quantity=9, reserved=7)
+
+        build_shadow(replay_ledger().balances)
+
+        with self.assertRaises(ValueError):
+            swap_shadow(drop_old=True)
+        self.assertEqual(self._stock().quantity, 9)
+
+    def test_live_only_stock_refuses(self):
+        self._stock_in(5)
+        InventoryStock.objects.create(product=self._product(), warehouse=self.warehouse, quantity=3)
+
+        replay = replay_ledger()
+        build_shadow(replay.balances)
+
+        with self.assertRaises(ValueError):
+            swap_shadow(replay=replay, drop_old=True)
+
+
+class StockAuditTests(StockTestCase):
+    def _audits(self):
+        return list(
+            AuditLog.objects
+            .filter(entity="inventory_stock")
+            .order_by("created_at", "id")
+        )
+
+    def _reserve(self, quantity):
+        reserve_stock(
+            demands={(self.product.id, self.warehouse.id): quantity},
+            reference_type="TEST",
+            reference_id=uuid4(),
+            actor=self.user,
+        )
+
+    def test_snapshot_carries_reserved(self):
+        self._stock_in(5)
+        self._reserve(2)
+        self._stock_in(3)
+
+        audit = self._audits()[-1]
+
+        self.assertFalse(audit.is_delta)
+        self.assertEqual(audit.old_data["reserved"], 2)
+        self.assertEqual((audit.new_data["quantity"], audit.new_data["reserved"]), (8, 2))
+
+    @override_settings(AUDIT_LOG_DIFF=True)
+    def test_movements_store_deltas_that_expand(self):
+        self._stock_in(5)
+        self._stock_in(3)
+
+        second = self._audits()[-1]
+        self.assertTrue(second.is_delta)
+        self.assertEqual(set(second.new_data), {"quantity", "version"})
+
+        before, after = expand_audit_rows([second])[second.id]
+        self.assertEqual((before["quantity"], after["quantity"]), (5, 8))
+        self.assertEqual(after["version"], before["version"] + 1)
@@ -36,6 +36,9 @@ class Command(BaseCommand):
             # Transfers
             "inventory.transfer",
 
+            # Bulk stock in (barcode scan batches)
+            "inventory.stock_in",
+
             # Masters
             "product.manage",
             "warehouse.manage",
@@ -74,6 +77,7 @@ class Command(BaseCommand):
                 "inventory.issue.execute",
 
                 "inventory.transfer",
+                "inventory.stock_in",
 
                 "product.manage",
                 "warehouse.manage",
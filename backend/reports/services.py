@@ -1,10 +1,13 @@
 # backend/reports/services.py
 from calendar import monthrange
-from datetime import datetime
-from django.db.models import Sum
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.db.models import Sum, OuterRef, Subquery, Exists, Case, When, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from inventory.models import InventoryStock, InventoryLedger, InventoryOrder, InventoryOrderItem
+from inventory.models import InventoryStock, InventoryLedger, InventoryDailyBalance, StockCostLayer, InventoryOrder, InventoryOrderItem
 from django.utils.dateparse import parse_date
+from inventory.services import annotate_balance_at
 
 from django.db.models import F, DecimalField, ExpressionWrapper
 
@@ -23,75 +26,121 @@ def get_stock_report_data():
         .order_by("product__name", "warehouse__name")
     )
 
+
+# Stock rows served straight from a values() projection: response key ->
+# InventoryStock lookup. The supplier comes from a LEFT JOIN in the same
+# query instead of one query per product.
+STOCK_COLUMNS = {
+    "product_id": "product_id",
+    "product_name": "product__name",
+    "warehouse_id": "warehouse_id",
+    "warehouse_name": "warehouse__name",
+    "warehouse_deleted_at": "warehouse__deleted_at",
+    "supplier_id": "product__supplier_id",
+    "supplier_name": "product__supplier__name",
+    "quantity": "quantity",
+    "unit": "product__unit",
+}
+
+
+def stock_values(qs, fields, extra=()):
+    """
+    `qs` (InventoryStock) projected onto the columns behind `fields`, plus
+    any `extra` lookups (e.g. the pagination cursor fields).
+    """
+    return qs.values(*extra, *(STOCK_COLUMNS[field] for field in fields))
+
+
+def stock_row(row, fields):
+    return {field: row[STOCK_COLUMNS[field]] for field in fields}
+
 from inventory.models import Product, Warehouse
 
 def get_monthly_stock_report(*, company, month):
     year, month_num = map(int, month.split("-"))
     days_in_month = monthrange(year, month_num)[1]
 
-    start_date = datetime(year, month_num, 1, tzinfo=timezone.UTC)
-    end_date = datetime(
-        year, month_num, days_in_month, 23, 59, 59, tzinfo=timezone.UTC
-    )
+    start_date = date(year, month_num, 1)
+    end_date = date(year, month_num, days_in_month)
 
-    rows = []
+    # Daily balances are UTC days, so the month opens at UTC midnight
+    month_start = datetime.combine(start_date, time.min, tzinfo=dt_timezone.utc)
 
     # 🔹 DRIVE REPORT FROM CURRENT STOCK (SOURCE OF TRUTH)
     stocks = (
-        InventoryStock.objects
-        .select_related("product", "warehouse")
-        .filter(warehouse__company=company, warehouse__deleted_at__isnull=True)
+        # 🔹 OPENING = NEAREST CHECKPOINT + MOVEMENTS BEFORE THE MONTH
+        annotate_balance_at(
+            InventoryStock.objects.filter(
+                warehouse__company=company,
+                warehouse__deleted_at__isnull=True,
+            ),
+            month_start,
+            inclusive=False,
+            name="opening",
+        )
+        .annotate(
+            has_history=Exists(
+                InventoryLedger.objects.filter(
+                    product=OuterRef("product"),
+                    warehouse=OuterRef("warehouse"),
+                )
+            ),
+        )
+        .values(
+            "product_id",
+            "warehouse_id",
+            "quantity",
+            "opening",
+            "has_history",
+            product_name=F("product__name"),
+            warehouse_name=F("warehouse__name"),
+            unit=F("product__unit"),
+        )
     )
 
-    for stock in stocks:
-        # 🔹 CURRENT BALANCE
-        current_qty = stock.quantity
-
-        # 🔹 SUM OF ALL MOVEMENTS *AFTER* MONTH START
-        future_delta = (
-            InventoryLedger.objects
-            .filter(
-                product=stock.product,
-                warehouse=stock.warehouse,
-                warehouse__deleted_at__isnull=True,
-                created_at__gte=start_date,
-            )
-            .aggregate(total=Sum("change"))["total"] or 0
+    # 🔹 NET MOVEMENT PER (PRODUCT, WAREHOUSE, DAY WITH MOVEMENT)
+    # Days add their net change to the opening rather than reading the
+    # stored closing, so the whole report sums the same ledger changes
+    # and a broken balance_after chain can't make it disagree with itself.
+    movements = {}
+    month_balances = (
+        InventoryDailyBalance.objects
+        .filter(
+            warehouse__company=company,
+            warehouse__deleted_at__isnull=True,
+            date__range=(start_date, end_date),
         )
+        .values_list("product_id", "warehouse_id", "date", "quantity_in", "quantity_out")
+    )
+
+    for product_id, warehouse_id, day, quantity_in, quantity_out in month_balances:
+        movements.setdefault((product_id, warehouse_id), {})[day.day] = quantity_in - quantity_out
+
+    rows = []
+
+    for stock in stocks:
+        if stock["has_history"]:
+            # 0 when the first movement happened in or after this month
+            opening = stock["opening"]
+        else:
+            # never moved through the ledger
+            opening = stock["quantity"]
 
-        # 🔹 CORRECT OPENING BALANCE
-        opening = current_qty - future_delta
+        day_changes = movements.get((stock["product_id"], stock["warehouse_id"]), {})
 
+        # 🔹 DAILY RUNNING BALANCE (CARRY FORWARD DAYS WITHOUT MOVEMENT)
         balance = opening
         daily = {}
-
-        # 🔹 DAILY RUNNING BALANCE
         for day in range(1, days_in_month + 1):
-            day_start = datetime(year, month_num, day, tzinfo=timezone.UTC)
-            day_end = datetime(
-                year, month_num, day, 23, 59, 59, tzinfo=timezone.UTC
-            )
-
-            delta = (
-                InventoryLedger.objects
-                .filter(
-                    product=stock.product,
-                    warehouse=stock.warehouse,
-                    warehouse__deleted_at__isnull=True,
-                    created_at__range=(day_start, day_end),
-                )
-                .aggregate(total=Sum("change"))["total"] or 0
-            )
-
-            balance += delta
+            balance += day_changes.get(day, 0)
             daily[day] = balance
 
         rows.append({
-            "product_id": stock.product.id,
-            "product_name": stock.product.name,
-            "warehouse_id": stock.warehouse.id,
-            "warehouse_name": stock.warehouse.name,
-            "unit": stock.product.unit,
+            "product_id": stock["product_id"],
+            "product_name": stock["product_name"],
+            "warehouse_id": stock["warehouse_id"],
+            "warehouse_name": stock["warehouse_name"],
+            "unit": stock["unit"],
             "opening": opening,
             "daily": daily,
             "closing": balance,
@@ -104,23 +153,104 @@ def get_monthly_stock_report(*, company, month):
     }
 
 
+def get_stock_as_of_queryset(*, company, at):
+    """
+    Stock position per product/warehouse at timestamp `at`: the nearest
+    ledger checkpoint plus the movements after it (annotate_balance_at).
+    Only pairs that had moved through the ledger by `at` are returned.
+    """
+    last_movement = (
+        InventoryLedger.objects
+        .filter(product=OuterRef("product"), warehouse=OuterRef("warehouse"), created_at__lte=at)
+        .order_by("-created_at")
+        .values("created_at")[:1]
+    )
+
+    return (
+        annotate_balance_at(
+            InventoryStock.objects.filter(
+                warehouse__company=company,
+                warehouse__deleted_at__isnull=True,
+            ),
+            at,
+        )
+        .annotate(last_movement_at=Subquery(last_movement))
+        .filter(last_movement_at__isnull=False)
+        .order_by("warehouse_id", "product_id")
+        .values(
+            "product_id",
+            "warehouse_id",
+            "balance_at",
+            "last_movement_at",
+            product_name=F("product__name"),
+            warehouse_name=F("warehouse__name"),
+            unit=F("product__unit"),
+        )
+    )
+
+
+def get_stock_as_of(*, company, at):
+    rows = list(get_stock_as_of_queryset(company=company, at=at))
+
+    for row in rows:
+        row["quantity"] = row.pop("balance_at")
+
+    return rows
+
+
+def _open_layers():
+    return StockCostLayer.objects.filter(
+        product=OuterRef("product"),
+        warehouse=OuterRef("warehouse"),
+        quantity_remaining__gt=0,
+    )
+
+
 def get_inventory_valuation(company):
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    layer_totals = _open_layers().values("product").annotate(
+        units=Sum("quantity_remaining"),
+        value=Sum(F("quantity_remaining") * F("unit_cost"), output_field=money),
+    )
+
     return (
         InventoryStock.objects
         .select_related("product", "warehouse")
         .filter(warehouse__company=company, warehouse__deleted_at__isnull=True)
+        .annotate(
+            layered_units=Coalesce(Subquery(layer_totals.values("units")), 0),
+            layered_value=Coalesce(
+                Subquery(layer_totals.values("value"), output_field=money),
+                Value(Decimal("0.00")),
+                output_field=money,
+            ),
+        )
         .values(
             "quantity",
             product_name=F("product__name"),
             warehouse_name=F("warehouse__name"),
-            unit_cost=F("product__cost_price"),
             unit=F("product__unit"),
         )
         .annotate(
+            # FIFO value of open layers; stock older than cost layers falls
+            # back to the product's current cost price
             total_value=ExpressionWrapper(
-                F("quantity") * F("product__cost_price"),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            )
+                F("layered_value")
+                + (F("quantity") - F("layered_units")) * F("product__cost_price"),
+                output_field=money,
+            ),
+            unit_cost=Case(
+                When(
+                    quantity__gt=0,
+                    then=ExpressionWrapper(
+                        F("total_value") / F("quantity"),
+                        output_field=money,
+                    ),
+                ),
+                default=F("product__cost_price"),
+                output_field=money,
+            ),
         )
         .order_by("product__name")
     )
@@ -140,6 +270,43 @@ def get_low_stock_report(threshold: int = 10, company=None):
     )
 
 
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def local_day_bounds(start_date=None, end_date=None):
+    """
+    Local calendar days [start_date, end_date] (dates or ISO strings) as
+    an aware [start, end) datetime range; either side may be None.
+    """
+    if isinstance(start_date, str):
+        start_date = parse_date(start_date)
+    if isinstance(end_date, str):
+        end_date = parse_date(end_date)
+
+    return (
+        _local_midnight(start_date) if start_date else None,
+        _local_midnight(end_date + timedelta(days=1)) if end_date else None,
+    )
+
+
+def filter_ledger_dates(qs, start_date=None, end_date=None):
+    """
+    Restrict ledger rows to local calendar days [start_date, end_date].
+    Uses a bare created_at range rather than created_at__date, which
+    wraps the column in a timezone cast that Postgres can neither prune
+    ledger partitions on nor match against the created_at index.
+    """
+    start, end = local_day_bounds(start_date, end_date)
+
+    if start:
+        qs = qs.filter(created_at__gte=start)
+    if end:
+        qs = qs.filter(created_at__lt=end)
+
+    return qs
+
+
 def get_audit_report(filters: dict):
     qs = (
         InventoryLedger.objects
@@ -148,16 +315,7 @@ def get_audit_report(filters: dict):
     )
 
     qs = qs.filter(warehouse__company=filters["company"])
-
-    if filters.get("start_date"):
-        qs = qs.filter(
-            created_at__date__gte=parse_date(filters["start_date"])
-        )
-
-    if filters.get("end_date"):
-        qs = qs.filter(
-            created_at__date__lte=parse_date(filters["end_date"])
-        )
+    qs = filter_ledger_dates(qs, filters.get("start_date"), filters.get("end_date"))
 
     if filters.get("product_id"):
         qs = qs.filter(product_id=filters["product_id"])
@@ -241,56 +399,75 @@ def get_order_report(filters):
     ).order_by("-order_created_at")
 
 
-def get_inventory_aging_report(company):
-    today = timezone.now().date()
+def get_inventory_aging_queryset(company):
+    # Last inbound movement per stock row, resolved by the database in the
+    # same query (uses the ledger (warehouse, product, created_at) index).
+    # Only used for stock that predates cost layers.
+    last_in = (
+        InventoryLedger.objects
+        .filter(
+            product=OuterRef("product"),
+            warehouse=OuterRef("warehouse"),
+            change__gt=0,
+        )
+        .order_by("-created_at")
+        .values("created_at")[:1]
+    )
 
-    stocks = (
+    # FIFO: age of the oldest unit still on hand
+    oldest_open = _open_layers().order_by("received_at").values("received_at")[:1]
+
+    return (
         InventoryStock.objects
-        .select_related("product", "warehouse")
         .filter(warehouse__company=company, warehouse__deleted_at__isnull=True, quantity__gt=0)
+        .annotate(last_in_at=Coalesce(Subquery(oldest_open), Subquery(last_in)))
+        .values(
+            "product_id",
+            "quantity",
+            "last_in_at",
+            product_name=F("product__name"),
+            warehouse_name=F("warehouse__name"),
+        )
+        .order_by("product__name", "warehouse__name", "id")
     )
 
-    report = []
 
-    for stock in stocks:
-        last_in = (
-            InventoryLedger.objects
-            .filter(
-                product=stock.product,
-                warehouse=stock.warehouse,
-                warehouse__deleted_at__isnull=True,
-                change__gt=0,
-            )
-            .order_by("-created_at")
-            .first()
-        )
+def aging_row(row, today):
+    if row["last_in_at"]:
+        last_in_date = row["last_in_at"].date()
+        age_days = (today - last_in_date).days
+    else:
+        age_days = None
+        last_in_date = None
+
+    if age_days is None:
+        bucket = "UNKNOWN"
+    elif age_days <= 30:
+        bucket = "0–30"
+    elif age_days <= 60:
+        bucket = "31–60"
+    elif age_days <= 90:
+        bucket = "61–90"
+    else:
+        bucket = "90+"
 
-        if last_in:
-            age_days = (today - last_in.created_at.date()).days
-            last_in_date = last_in.created_at.date()
-        else:
-            age_days = None
-            last_in_date = None
-
-        if age_days is None:
-            bucket = "UNKNOWN"
-        elif age_days <= 30:
-            bucket = "0–30"
-        elif age_days <= 60:
-            bucket = "31–60"
-        elif age_days <= 90:
-            bucket = "61–90"
-        else:
-            bucket = "90+"
-
-        report.append({
-            "product_id": stock.product.id,
-            "product_name": stock.product.name,
-            "warehouse": stock.warehouse.name,
-            "quantity": stock.quantity,
-            "last_in_date": last_in_date,
-            "age_days": age_days,
-            "bucket": bucket,
-        })
+    return {
+        "product_id": row["product_id"],
+        "product_name": row["product_name"],
+        "warehouse": row["warehouse_name"],
+        "quantity": row["quantity"],
+        "last_in_date": last_in_date,
+        "age_days": age_days,
+        "bucket": bucket,
+    }
 
-    return report
\ No newline at end of file
+
+def iter_inventory_aging_report(company, chunk_size=2000):
+    today = timezone.now().date()
+
+    for row in get_inventory_aging_queryset(company).iterator(chunk_size=chunk_size):
+        yield aging_row(row, today)
+
+
+def get_inventory_aging_report(company):
+    return list(iter_inventory_aging_report(company))
@@ -8,7 +8,7 @@ from weasyprint import HTML
 from rbac.services import user_has_permission
 from django.utils.dateparse import parse_date
 
-from .services import get_stock_report_data, get_inventory_valuation, get_low_stock_report, get_audit_report, get_order_report, get_inventory_aging_report
+from .services import get_stock_report_data, get_inventory_valuation, get_low_stock_report, get_audit_report, get_order_report, iter_inventory_aging_report, filter_ledger_dates
 from .utils import get_signature_block
 
 from inventory.models import InventoryLedger, InventoryIssue, InventoryOrder, GoodsReceiptNote, IssueSlip
@@ -61,10 +61,7 @@ def movement_report_pdf(request):
     product_id = request.GET.get("product_id")
     warehouse_id = request.GET.get("warehouse_id")
 
-    if start_date:
-        qs = qs.filter(created_at__date__gte=parse_date(start_date))
-    if end_date:
-        qs = qs.filter(created_at__date__lte=parse_date(end_date))
+    qs = filter_ledger_dates(qs, start_date, end_date)
     if product_id:
         qs = qs.filter(product_id=product_id)
     if warehouse_id:
@@ -235,7 +232,7 @@ def order_report_pdf(request):
 @login_required
 def aging_report_pdf(request):
     company = request.user.userprofile.company
-    rows = get_inventory_aging_report(company)
+    rows = iter_inventory_aging_report(company)
 
     profile = request.user.userprofile
 